@@ -1,12 +1,37 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from .models import Customer, Restaurant, MenuItem, DeliveryPersonnel, Order, OrderItem
+from .menu_cache import invalidate_menus
+from .orders import recalculate_total
+from .pagination import EstimatedCountPaginator
+from .transitions import TRANSITIONS, can_transition, transition_orders
+from .versions import touch_tables
+
+
+class RestaurantListFilter(admin.SimpleListFilter):
+    # a plain 'restaurant' filter lists every restaurant on every page load;
+    # this offers the best rated few (any id still works in the URL)
+    title = 'restaurant'
+    parameter_name = 'restaurant'
+    LIMIT = 20
+
+    def lookups(self, request, model_admin):
+        return [(r.restaurant_id, r.name) for r in
+                Restaurant.objects.only('restaurant_id', 'name').order_by('-rating', 'name')[:self.LIMIT]]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(restaurant_id=self.value())
+        return queryset
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
-    list_display = ('customer_id', 'name', 'email', 'phone', 'created_at')
+    list_display = ('customer_id', 'name', 'email', 'phone', 'order_count', 'total_spent', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name', 'email', 'phone')
-    readonly_fields = ('customer_id', 'created_at')
+    readonly_fields = ('customer_id', 'created_at', 'order_count', 'total_spent', 'last_order_date')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Basic Information', {
@@ -15,6 +40,9 @@ class CustomerAdmin(admin.ModelAdmin):
         ('Address', {
             'fields': ('address',)
         }),
+        ('Lifetime Stats', {
+            'fields': ('order_count', 'total_spent', 'last_order_date')
+        }),
         ('Metadata', {
             'fields': ('created_at',)
         }),
@@ -24,10 +52,10 @@ class CustomerAdmin(admin.ModelAdmin):
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ('restaurant_id', 'name', 'cuisine_type', 'rating', 'phone')
+    list_display = ('restaurant_id', 'name', 'cuisine_type', 'rating', 'phone', 'order_count', 'revenue', 'menu_size')
     list_filter = ('cuisine_type', 'rating')
-    search_fields = ('name', 'cuisine_type')
-    readonly_fields = ('restaurant_id',)
+    search_fields = ('name',)
+    readonly_fields = ('restaurant_id', 'order_count', 'revenue', 'menu_size')
     
     fieldsets = (
         ('Basic Information', {
@@ -36,17 +64,34 @@ class RestaurantAdmin(admin.ModelAdmin):
         ('Contact Details', {
             'fields': ('phone', 'address')
         }),
+        ('Stats', {
+            'fields': ('order_count', 'revenue', 'menu_size')
+        }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # cuisine_type holds a code, so the search term is matched against the labels
+        term = search_term.strip().lower()
+        cuisines = [label for label in Restaurant.Cuisine.labels if term and term in label.lower()]
+        if cuisines:
+            results |= queryset.filter(cuisine_type__in=cuisines)
+        return results, may_have_duplicates
+
 
 
 @admin.register(MenuItem)
 class MenuItemAdmin(admin.ModelAdmin):
     list_display = ('item_id', 'name', 'restaurant', 'category', 'price', 'is_available')
-    list_filter = ('category', 'is_available', 'restaurant')
+    list_filter = ('category', 'is_available', RestaurantListFilter)
     search_fields = ('name', 'description')
     readonly_fields = ('item_id',)
     list_editable = ('is_available',)
+    list_select_related = ('restaurant',)
+    autocomplete_fields = ('restaurant',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['mark_available', 'mark_unavailable']
     
     fieldsets = (
         ('Basic Information', {
@@ -57,6 +102,28 @@ class MenuItemAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # __str__ shows the restaurant, e.g. in autocomplete results for order items
+        return super().get_queryset(request).select_related('restaurant')
+
+    # list_editable toggles go through save() and the cache signals;
+    # these bulk actions use update(), so they invalidate menus and move the
+    # menu item table's data version (reports, fragments) themselves
+    def _set_availability(self, request, queryset, is_available):
+        restaurant_ids = set(queryset.values_list('restaurant_id', flat=True))
+        updated = queryset.update(is_available=is_available)
+        invalidate_menus(*restaurant_ids)
+        touch_tables(MenuItem._meta.db_table)
+        self.message_user(request, f"{updated} menu item(s) updated.")
+
+    def mark_available(self, request, queryset):
+        self._set_availability(request, queryset, True)
+    mark_available.short_description = 'Mark selected items as available'
+
+    def mark_unavailable(self, request, queryset):
+        self._set_availability(request, queryset, False)
+    mark_unavailable.short_description = 'Mark selected items as out of stock'
+
 
 
 @admin.register(DeliveryPersonnel)
@@ -83,6 +150,13 @@ class OrderItemInline(admin.TabularInline):
     extra = 1
     readonly_fields = ('order_item_id', 'get_subtotal')
     fields = ('order_item_id', 'menu_item', 'quantity', 'item_price', 'get_subtotal')
+    autocomplete_fields = ('menu_item',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # each row renders its selected item, whose __str__ shows the restaurant
+        if db_field.name == 'menu_item':
+            kwargs['queryset'] = MenuItem.objects.select_related('restaurant')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
     
     def get_subtotal(self, obj):
         if obj.pk:
@@ -92,18 +166,47 @@ class OrderItemInline(admin.TabularInline):
 
 
 
+def transition_action(target):
+    # one UPDATE per batch of selected orders instead of a save() per row
+    def action(modeladmin, request, queryset):
+        moved, rejected = transition_orders(queryset.values_list('order_id', flat=True), target)
+        modeladmin.message_user(request, f"{len(moved)} order(s) moved to {target}.")
+        if rejected:
+            listed = ', '.join(f"#{order_id} ({status})" for order_id, status in list(rejected.items())[:20])
+            modeladmin.message_user(request, f"{len(rejected)} order(s) cannot move to {target}: {listed}",
+                                    messages.WARNING)
+    action.__name__ = 'move_to_' + target.lower().replace(' ', '_')
+    action.short_description = f'Move selected orders to {target}'
+    return action
+
+
+class OrderAdminForm(forms.ModelForm):
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        current = self.initial.get('status')
+        if self.instance.pk and status != current and not can_transition(current, status):
+            raise forms.ValidationError(f"An order cannot move from {current} to {status}.")
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ('order_id', 'customer', 'restaurant', 'total_amount', 'status', 'order_date')
-    list_filter = ('status', 'order_date', 'restaurant')
+    list_filter = ('status', 'order_date', RestaurantListFilter)
     search_fields = ('customer__name', 'restaurant__name')
-    readonly_fields = ('order_id', 'order_date')
-    list_editable = ('status',)
+    readonly_fields = ('order_id', 'order_date', 'status_changed_at', 'total_amount')
+    actions = [transition_action(target) for target in dict.fromkeys(
+        target for targets in TRANSITIONS.values() for target in targets)]
+    list_select_related = ('customer', 'restaurant')
+    autocomplete_fields = ('customer', 'restaurant', 'delivery_person')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [OrderItemInline]
     
     fieldsets = (
         ('Order Information', {
-            'fields': ('order_id', 'order_date', 'status')
+            'fields': ('order_id', 'order_date', 'status', 'status_changed_at')
         }),
         ('Customer & Restaurant', {
             'fields': ('customer', 'restaurant', 'delivery_person')
@@ -114,9 +217,16 @@ class OrderAdmin(admin.ModelAdmin):
     )
     
     def save_model(self, request, obj, form, change):
-        # Calculate total amount from order items
+        # the real total is only known once the inline items are saved
+        if obj.total_amount is None:
+            obj.total_amount = 0
         super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        # Calculate total amount from order items
+        super().save_related(request, form, formsets, change)
+        recalculate_total(form.instance)
+
 
 
 @admin.register(OrderItem)
@@ -125,9 +235,17 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ('order__order_date', 'menu_item__category')
     search_fields = ('order__order_id', 'menu_item__name')
     readonly_fields = ('order_item_id', 'get_subtotal_display')
+    # Order.__str__ shows the customer, MenuItem.__str__ the restaurant
+    list_select_related = ('order__customer', 'menu_item__restaurant')
+    raw_id_fields = ('order',)
+    autocomplete_fields = ('menu_item',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def get_subtotal_display(self, obj):
-        return f"Rs.{obj.get_subtotal()}"
+        if obj.pk:
+            return f"Rs.{obj.get_subtotal()}"
+        return "Rs.0.00"
     get_subtotal_display.short_description = 'Subtotal'
     
     fieldsets = (
@@ -0,0 +1,91 @@
+"""
+Single-flight request coalescing.
+
+Flight.do(key, fn) runs fn() for the first caller asking for `key`;
+callers asking for the same key while that call is running wait for it
+and get its result (or its exception) instead of running their own.
+Nothing is kept once the call returns, so only loads that overlap in time
+are merged: the thundering herd on one popular menu or order at lunch
+time. Caching across time is delivery.menu_cache's job.
+
+Sync callers are merged across the threads of one process, async callers
+(Flight.ado) across the coroutines of one event loop. Every caller gets
+the same result object, so none of them may modify it.
+"""
+import asyncio
+import threading
+
+from .metrics import registry
+
+
+COALESCED = registry.counter(
+    'delivery_coalesced_requests_total', 'Loads that waited for an identical one in flight instead of running.',
+    ['flight'])
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Flight:
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED.inc(flight=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        """do() for a coroutine function `fn`."""
+        loop = asyncio.get_running_loop()
+        key = (loop, key)
+        future = self._futures.get(key)
+        if future is not None:
+            COALESCED.inc(flight=self.name)
+            # a waiter going away must not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._futures[key] = loop.create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: nobody may be waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
@@ -0,0 +1,138 @@
+"""
+Courier assignment.
+
+A courier is claimed by flipping is_available from True to False with a
+conditional UPDATE; only the worker whose UPDATE matched a row owns the
+courier, so two orders can never get the same one. Where the database
+supports it, candidate rows are also read with SELECT ... FOR UPDATE SKIP
+LOCKED, so concurrent dispatchers pick different couriers instead of
+racing for the same one. Orders are linked with the same kind of guarded
+UPDATE, and a courier is released again once they have no active order.
+
+Lock conflicts (SQLite's "database is locked", InnoDB deadlocks) roll the
+batch back and it is retried after a short random back-off.
+"""
+import random
+import time
+
+from django.db import connection, transaction, OperationalError
+from django.db.models import Exists, OuterRef
+
+from .models import DeliveryPersonnel, Order
+from .rollups import mark_dirty
+from .stats import INACTIVE_STATUSES
+from .versions import touch_tables
+
+
+ASSIGNABLE_STATUSES = ('Pending', 'Confirmed', 'Preparing')
+DISPATCH_BATCH_SIZE = 50
+ASSIGN_ATTEMPTS = 3
+LOCK_RETRIES = 10
+
+
+def _skip_locked(queryset):
+    if connection.features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True)
+    return queryset
+
+
+def _candidate_couriers(count):
+    couriers = DeliveryPersonnel.objects.filter(is_available=True)
+    if connection.features.has_select_for_update_skip_locked:
+        return list(couriers.select_for_update(skip_locked=True).order_by('pk').values_list(
+            'pk', flat=True
+        )[:count])
+    # without row locks every worker would read the same first rows, so
+    # spread them over a wider window; the guarded UPDATE settles ties
+    ids = list(couriers.order_by('pk').values_list('pk', flat=True)[:count * 4])
+    random.shuffle(ids)
+    return ids[:count]
+
+
+def _claim(courier_ids):
+    return [pk for pk in courier_ids
+            if DeliveryPersonnel.objects.filter(pk=pk, is_available=True).update(is_available=False)]
+
+
+def _dispatch_batch(orders, limit):
+    with transaction.atomic():
+        pending = list(_skip_locked(orders.filter(
+            delivery_person__isnull=True, status__in=ASSIGNABLE_STATUSES
+        )).order_by('order_date', 'order_id').values_list('order_id', 'order_date')[:limit])
+        if not pending:
+            return {}
+
+        couriers = _claim(_candidate_couriers(len(pending)))
+        assigned, dates = {}, []
+        for (order_id, order_date), courier_id in zip(pending, couriers):
+            # guarded as well: without row locks another worker may have linked it
+            if Order.objects.filter(pk=order_id, delivery_person__isnull=True).update(
+                    delivery_person_id=courier_id):
+                assigned[order_id] = courier_id
+                dates.append(order_date)
+
+        unused = set(couriers) - set(assigned.values())
+        if unused:
+            DeliveryPersonnel.objects.filter(pk__in=unused).update(is_available=True)
+        # update() skips the signals that keep courier rollups and availability versions current
+        mark_dirty(*dates)
+        touch_tables(DeliveryPersonnel._meta.db_table)
+    return assigned
+
+
+def dispatch(orders, limit=DISPATCH_BATCH_SIZE):
+    """
+    Assign available couriers to up to `limit` unassigned, active orders
+    from `orders`, oldest first, in one transaction. Returns a dict of
+    order_id -> delivery_id for the assignments made.
+    """
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return _dispatch_batch(orders, limit)
+        except OperationalError:
+            # inside a caller's transaction the whole thing has to be retried by them
+            if connection.in_atomic_block or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+
+
+def _backlog_remains(orders):
+    return (orders.filter(delivery_person__isnull=True, status__in=ASSIGNABLE_STATUSES).exists()
+            and DeliveryPersonnel.objects.filter(is_available=True).exists())
+
+
+def assign_courier(order_id):
+    """Assign a courier to one order; returns the delivery_id or None."""
+    orders = Order.objects.filter(pk=order_id)
+    for _ in range(ASSIGN_ATTEMPTS):
+        assigned = dispatch(orders, limit=1)
+        if assigned:
+            return assigned[order_id]
+        if not _backlog_remains(orders):
+            return None
+    return None
+
+
+def dispatch_pending(batch_size=DISPATCH_BATCH_SIZE):
+    """Drain the backlog of unassigned orders until orders or couriers run out."""
+    total = 0
+    while True:
+        assigned = dispatch(Order.objects.all(), limit=batch_size)
+        total += len(assigned)
+        # an empty batch can also mean other dispatchers got there first
+        if not assigned and not _backlog_remains(Order.objects.all()):
+            return total
+
+
+def release_couriers(*courier_ids):
+    """Mark couriers available again if they have no active order left."""
+    courier_ids = {pk for pk in courier_ids if pk is not None}
+    if not courier_ids:
+        return 0
+    active = Order.objects.filter(delivery_person=OuterRef('pk')).exclude(status__in=INACTIVE_STATUSES)
+    released = DeliveryPersonnel.objects.filter(
+        pk__in=courier_ids, is_available=False
+    ).exclude(Exists(active)).update(is_available=True)
+    if released:
+        touch_tables(DeliveryPersonnel._meta.db_table)
+    return released
@@ -0,0 +1,63 @@
+"""
+Model fields for columns that hold one label out of a fixed set.
+
+CodedChoiceField stores a small integer code per label, mapped through an
+IntegerChoices class, but deals in the labels everywhere in Python: model
+attributes, filter() arguments, values() rows, forms and admin filters
+all see 'Out for Delivery', while the column and its indexes hold 4.
+SQL that reads the column without the ORM (raw cursors, Concat and the
+like) sees the code; label_sql() turns it back into the label in SQL.
+"""
+from django.core import exceptions
+from django.db import models
+from django.utils.functional import cached_property
+
+
+class CodedChoiceField(models.PositiveSmallIntegerField):
+
+    def __init__(self, *args, codes, **kwargs):
+        # an IntegerChoices class, or its .choices when rebuilt by a migration
+        self.codes = list(getattr(codes, 'choices', codes))
+        self.code_of = {label: code for code, label in self.codes}
+        self.label_of = {code: label for code, label in self.codes}
+        kwargs['choices'] = [(label, label) for _, label in self.codes]
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['choices']
+        kwargs['codes'] = self.codes
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # the integer range checks would compare labels against numbers
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.label_of[value]
+
+    def to_python(self, value):
+        if value is None or value in self.code_of:
+            return value
+        if value in self.label_of:
+            return self.label_of[value]
+        raise exceptions.ValidationError(
+            self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+        )
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int) and value in self.label_of:
+            return value
+        try:
+            return self.code_of[str(value)]
+        except KeyError:
+            raise ValueError(f'Field {self.name!r} has no choice {value!r}') from None
+
+
+def label_sql(field_path, field):
+    """The label behind the code in `field_path`, as an SQL expression."""
+    return models.Case(
+        *(models.When(**{field_path: label}, then=models.Value(label)) for _, label in field.codes),
+        output_field=models.CharField(),
+    )
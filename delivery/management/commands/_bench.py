@@ -0,0 +1,84 @@
+"""Small helpers shared by the bench_* management commands."""
+import statistics
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'n': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def format_summary(label, samples):
+    s = summarize(samples)
+    return (f"{label:<32} n={s['n']:<5} mean={s['mean_ms']:8.2f}ms "
+            f"p50={s['p50_ms']:8.2f}ms p95={s['p95_ms']:8.2f}ms p99={s['p99_ms']:8.2f}ms")
+
+
+def peak_rss_kb():
+    """This process's peak resident set size so far in KB, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def table_sizes(tables):
+    """{table: (data bytes, index bytes)} for `tables`, or None where the backend cannot tell."""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute('SELECT m.tbl_name, m.type, SUM(s.pgsize) FROM dbstat s '
+                               'JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name, m.type')
+            except Exception:  # built without SQLITE_ENABLE_DBSTAT_VTAB
+                return None
+            sizes = {}
+            for table, kind, size in cursor.fetchall():
+                data, index = sizes.get(table, (0, 0))
+                sizes[table] = (data + size, index) if kind == 'table' else (data, index + size)
+            return {table: sizes.get(table, (0, 0)) for table in tables}
+        if connection.vendor == 'mysql':
+            for table in tables:
+                cursor.execute(f'ANALYZE TABLE {connection.ops.quote_name(table)}')
+                cursor.fetchall()
+            cursor.execute('SELECT table_name, data_length, index_length FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE()')
+            sizes = {table: (data, index) for table, data, index in cursor.fetchall()}
+            return {table: sizes.get(table, (0, 0)) for table in tables}
+        if connection.vendor == 'postgresql':
+            sizes = {}
+            for table in tables:
+                cursor.execute('SELECT pg_relation_size(%s), pg_indexes_size(%s)', [table, table])
+                sizes[table] = cursor.fetchone()
+            return sizes
+    return None
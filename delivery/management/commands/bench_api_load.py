@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from delivery.models import Order, Restaurant
+
+from ._bench import format_summary
+
+
+# (label, sync url name, async url name, sample kwarg)
+ENDPOINTS = [
+    ('order status', 'delivery:api_order_status', 'delivery:api_order_status_async', 'order_id'),
+    ('restaurant menu', 'delivery:api_restaurant_menu', 'delivery:api_restaurant_menu_async', 'restaurant_id'),
+]
+
+
+async def http_get(reader, writer, host, path):
+    """One keep-alive HTTP/1.1 GET; returns the status code."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('server closed the connection')
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+
+class Command(BaseCommand):
+    help = ('Load-tests the sync and async JSON API endpoints of a running ASGI server '
+            '(e.g. "API_RATE_LIMIT_RATE=0 uvicorn food_delivery.asgi:application --port 8000", '
+            'as every client connects from one address) with many concurrent keep-alive '
+            'polling clients and reports requests/sec and latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--clients', type=int, default=300)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+        parser.add_argument('--interval', type=float, default=0.0,
+                            help='Pause between a client\'s requests (0 = as fast as possible)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # the ORM is not usable inside the event loop, so pick targets first
+        samples = {
+            'order_id': list(Order.objects.order_by('-order_date').values_list('order_id', flat=True)[:1000]),
+            'restaurant_id': list(Restaurant.objects.values_list('restaurant_id', flat=True)[:100]),
+        }
+        if not samples['order_id'] or not samples['restaurant_id']:
+            self.stdout.write(self.style.WARNING('Nothing to request, run populate_data first.'))
+            return
+
+        self.stdout.write(f'{options["clients"]} clients, {options["duration"]:.0f}s per run against '
+                          f'http://{options["host"]}:{options["port"]}')
+        for label, sync_name, async_name, kwarg in ENDPOINTS:
+            for kind, url_name in (('sync', sync_name), ('async', async_name)):
+                paths = [reverse(url_name, kwargs={kwarg: value}) for value in samples[kwarg]]
+                latencies, errors, elapsed = asyncio.run(self.run_load(paths, options))
+                self.stdout.write(format_summary(f'{label} ({kind})', latencies))
+                self.stdout.write(f'{"":<32} {len(latencies) / elapsed:,.0f} req/s, {errors} error(s)')
+
+    async def run_load(self, paths, options):
+        host, port = options['host'], options['port']
+        rng = random.Random(options['seed'])
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + options['duration']
+
+        async def client():
+            nonlocal errors
+            reader = writer = None
+            while time.perf_counter() < deadline:
+                path = rng.choice(paths)
+                start = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                    status = await http_get(reader, writer, host, path)
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    errors += 1
+                    if writer is not None:
+                        writer.close()
+                    writer = None
+                    await asyncio.sleep(0.05)
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+                if options['interval']:
+                    await asyncio.sleep(options['interval'])
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['clients'])))
+        elapsed = time.perf_counter() - started
+        if not latencies and errors:
+            raise CommandError(f'Every request failed; is the server running on {host}:{port}?')
+        return latencies, errors, elapsed
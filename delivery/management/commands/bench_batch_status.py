@@ -0,0 +1,61 @@
+import json
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from delivery.models import Order
+
+from ._bench import measure
+
+
+class Command(BaseCommand):
+    help = ('Compares a dashboard refresh of many orders done as one POST to the batch status '
+            'API against one status request per order, through the full request handler: '
+            'median wall time, queries and bytes per refresh.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', type=int, default=1000, help='Orders per refresh')
+        parser.add_argument('--repeat', type=int, default=5, help='Refreshes per approach')
+
+    # one client makes every request; this times the views, not the rate limit
+    @override_settings(API_RATE_LIMIT_RATE=0)
+    def handle(self, *args, **options):
+        order_ids = list(Order.objects.order_by('-order_id').values_list('order_id', flat=True)[:options['ids']])
+        if not order_ids:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+        client = Client(HTTP_HOST='localhost')
+        urls = [reverse('delivery:api_order_status', args=[order_id]) for order_id in order_ids]
+        body = json.dumps({'ids': order_ids})
+
+        def individual():
+            return sum(len(client.get(url).content) for url in urls)
+
+        def batched():
+            response = client.post(reverse('delivery:api_orders_status'), body, content_type='application/json')
+            return len(b''.join(response.streaming_content))
+
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            # each request clears connection.queries, so count them here
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        results = {}
+        for label, refresh in ((f'{len(order_ids)} individual calls', individual), ('one batched call', batched)):
+            queries.clear()
+            with connection.execute_wrapper(count):
+                size = refresh()
+            samples = measure(refresh, options['repeat'])
+            results[label] = statistics.median(samples)
+            self.stdout.write(f'{label:<24} {results[label] * 1000:10.1f}ms {len(queries):>6} queries '
+                              f'{size / 1024:8.1f}KB')
+
+        one_by_one, batch = results.values()
+        self.stdout.write(self.style.SUCCESS(
+            f'Batched refresh is {one_by_one / batch:.0f}x faster '
+            f'({one_by_one * 1000:.1f}ms -> {batch * 1000:.1f}ms)'))
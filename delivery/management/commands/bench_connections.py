@@ -0,0 +1,95 @@
+import statistics
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections, close_old_connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from delivery.models import Order
+
+from ._bench import measure, format_summary
+
+
+class Command(BaseCommand):
+    help = ('Measures what persistent connections save: times read-only pages and JSON APIs '
+            'through the full request handler with a new connection per request (CONN_MAX_AGE=0) '
+            'and with connections kept open, and counts the connections opened per database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Alternate the two settings this many times to even out drift')
+        parser.add_argument('--max-age', type=int, default=60,
+                            help='CONN_MAX_AGE for the persistent run')
+
+    # every request comes from one client; this times the views, not the rate limit
+    @override_settings(API_RATE_LIMIT_RATE=0)
+    def handle(self, *args, **options):
+        order_id = Order.objects.values_list('order_id', flat=True).first()
+        if order_id is None:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+        urls = [
+            reverse('delivery:home'),
+            reverse('delivery:customer_list'),
+            reverse('delivery:api_order_status', args=[order_id]),
+        ]
+        modes = {'new connection per request': 0, 'persistent': options['max_age']}
+        per_round = max(1, options['repeat'] // options['rounds'])
+        samples = {label: [] for label in modes}
+        opened = {label: Counter() for label in modes}
+        current = None
+
+        def count_connection(sender, connection, **kwargs):
+            opened[current][connection.alias] += 1
+
+        def request(url):
+            client.get(url)
+            # what request_finished does after each response outside the test client
+            close_old_connections()
+
+        client = Client(HTTP_HOST='localhost')
+        saved = {alias: connections[alias].settings_dict['CONN_MAX_AGE'] for alias in connections}
+        connection_created.connect(count_connection)
+        try:
+            for _ in range(options['rounds']):
+                for current, max_age in modes.items():
+                    connections.close_all()
+                    for alias in connections:
+                        connections[alias].settings_dict['CONN_MAX_AGE'] = max_age
+                    for url in urls:
+                        request(url)  # warm caches
+                        samples[current] += measure(lambda: request(url), per_round)
+        finally:
+            connection_created.disconnect(count_connection)
+            connections.close_all()
+            for alias, max_age in saved.items():
+                connections[alias].settings_dict['CONN_MAX_AGE'] = max_age
+
+        for label in modes:
+            self.stdout.write(format_summary(label, samples[label]))
+            self.stdout.write(f'{"":<32} connections opened: ' + ', '.join(
+                f'{alias}={count}' for alias, count in opened[label].items()))
+
+        setup = {}
+        for alias in connections:
+            connection = connections[alias]
+
+            def reconnect():
+                connection.close()
+                connection.ensure_connection()
+            reconnect_samples = measure(reconnect, options['repeat'])
+            setup[alias] = statistics.median(reconnect_samples)
+            self.stdout.write(format_summary(f'connection setup ({alias})', reconnect_samples))
+        connections.close_all()
+
+        requests = len(samples['persistent'])
+        avoided = sum((opened['new connection per request'][alias] - opened['persistent'][alias]) * cost
+                      for alias, cost in setup.items())
+        fresh, persistent = (statistics.median(samples[label]) for label in modes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Persistent connections skip {avoided / requests * 1000:.2f}ms of connection setup per request; '
+            f'median request time {fresh * 1000:.2f}ms -> {persistent * 1000:.2f}ms'
+        ))
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from delivery.dispatch import dispatch, ASSIGNABLE_STATUSES
+from delivery.models import DeliveryPersonnel, Order
+from delivery.rollups import mark_dirty
+
+
+class Command(BaseCommand):
+    help = ('Drains the backlog of unassigned orders with several concurrent dispatcher '
+            'threads, checks that no courier was handed two orders and reports '
+            'assignments/sec. The assignments are undone afterwards unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--keep', action='store_true', help='Keep the assignments that were made')
+
+    def handle(self, *args, **options):
+        backlog = Order.objects.filter(delivery_person__isnull=True, status__in=ASSIGNABLE_STATUSES).count()
+        couriers = DeliveryPersonnel.objects.filter(is_available=True).count()
+        self.stdout.write(f'{backlog} unassigned orders, {couriers} available couriers, '
+                          f'{options["threads"]} threads')
+        if not backlog or not couriers:
+            self.stdout.write(self.style.WARNING('Nothing to dispatch, run populate_data first.'))
+            return
+
+        results, errors = [], []
+        barrier = threading.Barrier(options['threads'])
+
+        def worker():
+            try:
+                barrier.wait()
+                while True:
+                    assigned = dispatch(Order.objects.all(), limit=options['batch_size'])
+                    if not assigned:
+                        break
+                    results.append(assigned)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        pairs = [pair for batch in results for pair in batch.items()]
+        order_ids = [order_id for order_id, _ in pairs]
+        courier_ids = [courier_id for _, courier_id in pairs]
+        self.stdout.write(f'{len(pairs)} assignments in {elapsed:.2f}s '
+                          f'({len(pairs) / elapsed:,.0f} assignments/s)')
+
+        if not options['keep'] and pairs:
+            Order.objects.filter(pk__in=order_ids).update(delivery_person=None)
+            # they were all available before the run
+            DeliveryPersonnel.objects.filter(pk__in=courier_ids).update(is_available=True)
+            mark_dirty(*Order.objects.filter(pk__in=order_ids).values_list('order_date', flat=True))
+
+        if errors:
+            raise CommandError(f'{len(errors)} dispatcher thread(s) failed: {errors[0]!r}')
+        if len(set(courier_ids)) != len(courier_ids) or len(set(order_ids)) != len(order_ids):
+            raise CommandError('A courier or order was assigned twice')
+        self.stdout.write(self.style.SUCCESS('No double assignments.'))
@@ -0,0 +1,68 @@
+import gc
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from delivery.export import BATCH_SIZE, ORDER_COLUMNS, LINE_COLUMNS, day_range, export_batches, export_chunks
+from delivery.models import Order
+
+from ._bench import peak_rss_kb
+
+
+class Command(BaseCommand):
+    help = ('Exports every order through delivery.export and reports rows/sec, MB/sec and '
+            'the process peak RSS after each stage: reading only, CSV, JSON Lines and CSV '
+            'through /exports/orders/. The peak should not move with the number of orders; '
+            'compare runs after "populate_data --orders N" for different N.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--in-memory', action='store_true',
+                            help='Finish with list() of the same joined rows, to compare the peak')
+
+    def handle(self, *args, **options):
+        orders = day_range()
+        total = Order.objects.count()
+        if not total:
+            self.stdout.write(self.style.WARNING('Nothing to export, run populate_data first.'))
+            return
+        batch_size = options['batch_size']
+        self.stdout.write(f'{total:,} orders, {batch_size} per batch, peak RSS at start {self.rss()}')
+
+        rows = self.stage('read only', rows=None, fn=lambda: (
+            sum(len(batch) for batch in export_batches(orders, batch_size)), 0))
+        for fmt in ('csv', 'jsonl'):
+            self.stage(fmt, rows, lambda: (None, sum(len(chunk) for chunk in export_chunks(fmt, orders, batch_size))))
+
+        # the view is staff only
+        admin = User.objects.filter(is_active=True, is_superuser=True).first()
+        if admin is None:
+            self.stdout.write(self.style.WARNING('No superuser to log in as, skipping /exports/orders/'))
+        else:
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(admin)
+            url = reverse('delivery:export_orders')
+            self.stage('csv via /exports/orders/', rows, lambda: (
+                None, sum(len(chunk) for chunk in client.get(url, {'format': 'csv'}).streaming_content)))
+
+        if options['in_memory']:
+            lookups = [lookup for _, lookup in ORDER_COLUMNS] + [f'order_items__{lookup}' for _, lookup in LINE_COLUMNS]
+            self.stage('list() in memory', rows, lambda: (
+                None, 0 * len(list(orders.order_by('order_date', 'order_id').values_list(*lookups)))))
+
+    def stage(self, label, rows, fn):
+        gc.collect()
+        start = time.perf_counter()
+        counted, size = fn()
+        elapsed = time.perf_counter() - start
+        rows = counted if counted is not None else rows
+        self.stdout.write(f'{label:<28} {rows:>10,} rows {elapsed:7.2f}s {rows / elapsed:>10,.0f} rows/s '
+                          f'{size / elapsed / 1e6:7.1f} MB/s  peak RSS {self.rss()}')
+        return rows
+
+    def rss(self):
+        peak = peak_rss_kb()
+        return 'n/a' if peak is None else f'{peak / 1024:.0f}MB'
@@ -0,0 +1,74 @@
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from delivery.metrics import record_query
+from delivery.models import Order, Restaurant
+
+from ._bench import measure, format_summary
+
+
+MIDDLEWARE_PATH = 'delivery.middleware.instrumentation_middleware'
+
+
+class Command(BaseCommand):
+    help = ('Measures the overhead of the instrumentation middleware by timing the main '
+            'pages through the full request handler with and without it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Alternate on/off this many times to even out drift')
+
+    # every request comes from one client; this times the views, not the rate limit
+    @override_settings(API_RATE_LIMIT_RATE=0)
+    def handle(self, *args, **options):
+        order_id = Order.objects.values_list('order_id', flat=True).first()
+        restaurant_id = Restaurant.objects.values_list('restaurant_id', flat=True).first()
+        if order_id is None or restaurant_id is None:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+        urls = [
+            reverse('delivery:home'),
+            reverse('delivery:order_list'),
+            reverse('delivery:analytics'),
+            reverse('delivery:api_order_status', args=[order_id]),
+            reverse('delivery:api_restaurant_menu', args=[restaurant_id]),
+        ]
+        with_middleware = list(settings.MIDDLEWARE)
+        without_middleware = [m for m in with_middleware if m != MIDDLEWARE_PATH]
+        per_round = max(1, options['repeat'] // options['rounds'])
+
+        samples = {(url, on): [] for url in urls for on in (True, False)}
+        for _ in range(options['rounds']):
+            for on, middleware in ((True, with_middleware), (False, without_middleware)):
+                with override_settings(MIDDLEWARE=middleware):
+                    client = Client(HTTP_HOST='localhost')
+                    # "off" also drops the query hook, so nothing of it is left
+                    if not on:
+                        connection.ensure_connection()
+                        connection.execute_wrappers.remove(record_query)
+                    try:
+                        for url in urls:
+                            client.get(url)  # load middleware, warm caches
+                            samples[url, on].extend(measure(lambda: client.get(url), per_round))
+                    finally:
+                        if not on:
+                            connection.execute_wrappers.append(record_query)
+
+        total_on = total_off = 0.0
+        for url in urls:
+            on, off = samples[url, True], samples[url, False]
+            total_on += statistics.fmean(on)
+            total_off += statistics.fmean(off)
+            overhead = (statistics.median(on) / statistics.median(off) - 1) * 100
+            self.stdout.write(f'-- {url}  (median overhead {overhead:+.1f}%)')
+            self.stdout.write(format_summary('instrumented', on))
+            self.stdout.write(format_summary('plain', off))
+        self.stdout.write(self.style.SUCCESS(
+            f'Overall mean overhead: {(total_on / total_off - 1) * 100:+.1f}%'
+        ))
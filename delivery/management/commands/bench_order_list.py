@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from delivery import views
+from delivery.models import Order
+from delivery.pagination import encode_cursor, keyset_paginate
+
+from ._bench import measure, format_summary
+
+
+class Command(BaseCommand):
+    help = ('Times the order list at the first, middle and last page using keyset '
+            'cursors and, for comparison, OFFSET pagination. Run it against datasets '
+            'of different sizes (see populate_data) to compare latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', help='Apply the status filter, e.g. "Delivered"')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        status = options['status']
+        repeat = options['repeat']
+        per_page = views.ORDERS_PER_PAGE
+        factory = RequestFactory()
+
+        orders = Order.objects.all()
+        if status:
+            orders = orders.filter(status=status)
+        ordered = orders.order_by('-order_date', '-order_id')
+        joined = orders.select_related('customer', 'restaurant', 'delivery_person')
+        total = orders.count()
+        self.stdout.write(f'{total} orders{f" with status {status!r}" if status else ""}, '
+                          f'{per_page} per page, {repeat} runs each')
+        if not total:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+
+        depths = sorted({0, total // 2, max(total - per_page, 0)})
+        for depth in depths:
+            params = {'status': status} if status else {}
+            if depth:
+                boundary = ordered.values('order_date', 'order_id')[depth - 1]
+                params['after'] = encode_cursor(boundary['order_date'], boundary['order_id'])
+            request = factory.get('/orders/', params)
+
+            with CaptureQueriesContext(connection) as ctx:
+                views.order_list(request)
+            view = measure(lambda: views.order_list(request), repeat)
+            keyset = measure(lambda: keyset_paginate(
+                joined, after=params.get('after'), per_page=per_page
+            ), repeat)
+            offset = measure(lambda: list(joined.order_by(
+                '-order_date', '-order_id'
+            )[depth:depth + per_page]), repeat)
+
+            self.stdout.write(f'-- row offset {depth} ({len(ctx.captured_queries)} queries per view call)')
+            self.stdout.write(format_summary('view incl. render', view))
+            self.stdout.write(format_summary('keyset query', keyset))
+            self.stdout.write(format_summary('OFFSET query', offset))
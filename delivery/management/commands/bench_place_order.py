@@ -0,0 +1,62 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from delivery import views
+from delivery.models import Customer, MenuItem, Order
+
+from ._bench import format_summary
+
+
+class Command(BaseCommand):
+    help = ('Places orders through POST /api/orders/ back to back and reports latency and '
+            'orders/sec. The orders are deleted again afterwards unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--lines', type=int, default=3, help='Items per order')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Keep the orders that were placed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:1000])
+        menus = {}
+        for restaurant_id, item_id in MenuItem.objects.filter(is_available=True).values_list(
+                'restaurant_id', 'item_id'):
+            menus.setdefault(restaurant_id, []).append(item_id)
+        menus = {rid: items for rid, items in menus.items() if len(items) >= options['lines']}
+        if not customer_ids or not menus:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+
+        factory = RequestFactory()
+        restaurant_ids = list(menus)
+        requests = []
+        for _ in range(options['orders']):
+            restaurant_id = rng.choice(restaurant_ids)
+            requests.append(factory.post('/api/orders/', json.dumps({
+                'customer_id': rng.choice(customer_ids),
+                'restaurant_id': restaurant_id,
+                'items': [{'menu_item_id': item_id, 'quantity': rng.randint(1, 3)}
+                          for item_id in rng.sample(menus[restaurant_id], options['lines'])],
+            }), content_type='application/json'))
+
+        samples, placed = [], []
+        started = time.perf_counter()
+        for request in requests:
+            start = time.perf_counter()
+            response = views.api_place_order(request)
+            samples.append(time.perf_counter() - start)
+            placed.append(json.loads(response.content)['order_id'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(format_summary(f'place order ({options["lines"]} lines)', samples))
+        self.stdout.write(self.style.SUCCESS(f'{len(placed) / elapsed:,.0f} orders/s'))
+
+        if not options['keep']:
+            for order in Order.objects.filter(order_id__in=placed):
+                order.delete()
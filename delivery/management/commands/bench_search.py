@@ -0,0 +1,59 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from delivery.models import MenuItem
+from delivery.search import query_terms, search_menu
+
+from ._bench import measure, format_summary
+
+
+class Command(BaseCommand):
+    help = ('Times delivery.search on the current data with a mix of whole-word, prefix, '
+            'multi-word and price-filtered queries built from real dish and restaurant '
+            'names, directly and through /api/search/. Populate a large menu first, e.g. '
+            '"populate_data --restaurants 60000 --orders 10000" for about a million items.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Distinct queries per kind')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs of each query')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total = MenuItem.objects.count()
+        if not total:
+            self.stdout.write(self.style.WARNING('Nothing to search, run populate_data first.'))
+            return
+        samples = list(MenuItem.objects.filter(
+            pk__in=[rng.randint(1, total) for _ in range(options['queries'])]
+        ).values_list('name', 'restaurant__name', 'restaurant__cuisine_type'))
+
+        words = [query_terms(name)[0] for name, _, _ in samples]
+        kinds = {
+            'word': [(word, {}) for word in words],
+            'prefix (3 letters)': [(word[:3], {}) for word in words],
+            'dish + restaurant word': [(f'{query_terms(name)[0]} {query_terms(restaurant)[0]}', {})
+                                       for name, restaurant, _ in samples],
+            'dish + cuisine': [(f'{query_terms(name)[0]} {cuisine}', {}) for name, _, cuisine in samples],
+            'word, price 100-300': [(word, {'min_price': Decimal(100), 'max_price': Decimal(300)})
+                                    for word in words],
+        }
+
+        self.stdout.write(f'{total:,} menu items, {len(samples)} queries per kind')
+        for label, queries in kinds.items():
+            latencies = []
+            for text, filters in queries:
+                terms = query_terms(text)
+                latencies.extend(measure(lambda: search_menu(terms, **filters), options['repeat']))
+            self.stdout.write(format_summary(label, latencies))
+
+        client = Client(HTTP_HOST='localhost')
+        url = reverse('delivery:api_search')
+        latencies = []
+        for text, _ in kinds['word']:
+            latencies.extend(measure(lambda: client.get(url, {'q': text}), options['repeat']))
+        self.stdout.write(format_summary('/api/search/ (word)', latencies))
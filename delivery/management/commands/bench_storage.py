@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from delivery.models import Restaurant, MenuItem, DeliveryPersonnel, Order, OrderStatusEvent
+
+from ._bench import measure, format_summary, table_sizes
+
+
+MODELS = (Order, OrderStatusEvent, MenuItem, Restaurant, DeliveryPersonnel)
+
+
+class Command(BaseCommand):
+    help = ('Reports the on-disk size of the order, status event, menu, restaurant and courier '
+            'tables and their indexes, and times status-filtered order queries. Run it before '
+            'and after a schema change on the same generated dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        sizes = table_sizes([model._meta.db_table for model in MODELS])
+        if sizes is None:
+            self.stdout.write(self.style.WARNING('This database does not report table sizes.'))
+        else:
+            self.stdout.write(f'{"table":<24} {"rows":>10} {"data":>10} {"indexes":>10} {"bytes/row":>10}')
+            for model in MODELS:
+                table = model._meta.db_table
+                rows = model.objects.count()
+                data, index = sizes[table]
+                self.stdout.write(f'{table:<24} {rows:>10,} {data / 2**20:>8.1f}MB {index / 2**20:>8.1f}MB '
+                                  f'{(data + index) / max(rows, 1):>10.0f}')
+
+        queries = {
+            'count status=Out for Delivery': lambda: Order.objects.filter(status='Out for Delivery').count(),
+            'count status in (active)': lambda: Order.objects.exclude(
+                status__in=('Delivered', 'Cancelled')).count(),
+            'newest 20 Delivered': lambda: list(Order.objects.filter(status='Delivered').order_by(
+                '-order_date', '-order_id').values_list('order_id', flat=True)[:20]),
+            'orders per status': lambda: list(Order.objects.values('status').annotate(n=Count('pk')).order_by()),
+            'menu items per category': lambda: list(MenuItem.objects.values('category').annotate(
+                n=Count('pk')).order_by()),
+        }
+        for label, fn in queries.items():
+            fn()
+            self.stdout.write(format_summary(label, measure(fn, options['repeat'])))
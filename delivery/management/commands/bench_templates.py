@@ -0,0 +1,99 @@
+import copy
+import re
+import statistics
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .bench_views import seed
+
+
+PAGES = ('home', 'analytics')
+DEFAULT_SIZES = (10000, 100000)
+
+_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+) queries")?')
+
+
+def uncached_templates():
+    """settings.TEMPLATES without the cached loader, so every render compiles its templates again."""
+    templates = copy.deepcopy(settings.TEMPLATES)
+    for backend in templates:
+        backend.pop('APP_DIRS', None)
+        backend.setdefault('OPTIONS', {})['loaders'] = [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]
+    return templates
+
+
+def timings(response):
+    """(total ms, template ms, database ms, queries) from the Server-Timing header."""
+    found = {name: (float(dur), queries) for name, dur, queries in _TIMING.findall(response['Server-Timing'])}
+    return found['total'][0], found['tpl'][0], found['db'][0], int(found['db'][1])
+
+
+def sample(client, path, repeat, clear):
+    rows = []
+    for _ in range(repeat):
+        if clear:
+            cache.clear()
+        response = client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f'GET {path} returned {response.status_code}')
+        rows.append(timings(response))
+    return [statistics.median(column) for column in zip(*rows)]
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database at each size and times the home and analytics pages '
+            'with templates compiled on every render, with the cached loader and a cold fragment '
+            'cache, and with warm {% cache %} fragments. Template time is read from the '
+            'Server-Timing header, so on a miss it includes the queries the lazy context runs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                            help='Comma-separated dataset sizes, in orders')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per page and mode')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+
+        # never seed over real data
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            for size in sizes:
+                self.stdout.write(f'Seeding {size:,} orders...')
+                seed(size)
+                self.run_pages(options['repeat'])
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+    def run_pages(self, repeat):
+        client = Client()
+        self.stdout.write(f'{"page / mode":<40} {"total":>10} {"template":>10} {"db":>10} {"queries":>7}')
+        for page in PAGES:
+            path = reverse(f'delivery:{page}')
+            # the first analytics request folds the new data into the rollups
+            client.get(path)
+            with override_settings(TEMPLATES=uncached_templates()):
+                results = {'compiled per render': sample(client, path, repeat, clear=True)}
+            results['cached loader, fragment miss'] = sample(client, path, repeat, clear=True)
+            client.get(path)
+            results['cached loader, fragment hit'] = sample(client, path, repeat, clear=False)
+            for mode, (total, template, db, queries) in results.items():
+                self.stdout.write(f'{page + " / " + mode:<40} {total:>8.2f}ms {template:>8.2f}ms '
+                                  f'{db:>8.2f}ms {queries:>7.0f}')
+            miss, hit = results['cached loader, fragment miss'][1], results['cached loader, fragment hit'][1]
+            self.stdout.write(self.style.SUCCESS(
+                f'{page}: template render {miss:.2f}ms -> {hit:.2f}ms with warm fragments'))
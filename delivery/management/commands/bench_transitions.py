@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from delivery.models import Customer, Order, Restaurant
+from delivery.transitions import TRANSITION_BATCH_SIZE, transition_orders
+
+
+MARKER = 'bench_transitions'
+
+
+class Command(BaseCommand):
+    help = ('Moves freshly created Pending orders to Confirmed and then to Cancelled, once '
+            'with a save() per order as the admin list used to and once with '
+            'delivery.transitions, and reports transitions/sec and queries for both. '
+            'Everything runs in a transaction that is rolled back at the end.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Orders moved by each method')
+        parser.add_argument('--batch-size', type=int, default=TRANSITION_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:1000])
+        restaurant_ids = list(Restaurant.objects.values_list('restaurant_id', flat=True)[:1000])
+        if not customer_ids or not restaurant_ids:
+            self.stdout.write(self.style.WARNING('Nothing to benchmark, run populate_data first.'))
+            return
+
+        n = options['orders']
+        with transaction.atomic():
+            # bulk_create skips the signals, which is fine for a run that is rolled back
+            Order.objects.bulk_create([
+                Order(customer_id=rng.choice(customer_ids), restaurant_id=rng.choice(restaurant_ids),
+                      total_amount=rng.randint(100, 2000), delivery_address=MARKER)
+                for _ in range(2 * n)
+            ], batch_size=1000)
+            ids = list(Order.objects.filter(delivery_address=MARKER).order_by('order_id')
+                       .values_list('order_id', flat=True))
+            per_row, bulk = ids[:n], ids[n:]
+
+            for target in ('Confirmed', 'Cancelled'):
+                self.run(f'save() per order -> {target}', n, lambda: self.save_each(per_row, target))
+                self.run(f'transition_orders -> {target}', n,
+                         lambda: transition_orders(bulk, target, options['batch_size']))
+            transaction.set_rollback(True)
+
+    def save_each(self, order_ids, target):
+        for order in Order.objects.filter(pk__in=order_ids):
+            order.status = target
+            order.save()
+
+    def run(self, label, n, fn):
+        # counted by hand: the per-row runs overflow the debug query log
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f'{label:<36} {n / elapsed:>10,.0f} transitions/s '
+                          f'{elapsed * 1000:9.1f}ms {queries:>7} queries')
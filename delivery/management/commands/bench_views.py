@@ -0,0 +1,293 @@
+import gc
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from datetime import timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+
+from delivery import urls
+from delivery.models import Customer, MenuItem, Order
+
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'baseline.json'
+DEFAULT_SIZES = (1000, 4000, 16000)
+
+# routes requested by a logged-in superuser; the rest are anonymous
+STAFF_ROUTES = {'api_transition_orders', 'export_orders', 'metrics'}
+
+# a time or memory figure below these floors is noise, whatever the ratio
+MIN_TIME_MS = 2.0
+MIN_PEAK_KB = 64.0
+
+
+def seed(size, seed=1):
+    """Replace all data with a generated dataset of `size` orders."""
+    call_command(
+        'populate_data', orders=size, customers=max(50, size // 10), restaurants=max(5, size // 200),
+        couriers=max(5, size // 100), seed=seed, stdout=StringIO(),
+    )
+
+
+def sample_requests():
+    """{url name: (method, path, extra client kwargs)} for every route in delivery/urls.py."""
+    order_ids = list(Order.objects.order_by('-order_id').values_list('order_id', flat=True)[:100])
+    last_day = Order.objects.order_by('-order_date').values_list('order_date', flat=True).first()
+    item = MenuItem.objects.filter(is_available=True).values('item_id', 'restaurant_id', 'name').order_by('item_id').first()
+    customer_id = Customer.objects.order_by('customer_id').values_list('customer_id', flat=True).first()
+    if not order_ids or last_day is None or item is None or customer_id is None:
+        raise CommandError('The dataset has no orders or menu items to request')
+
+    # orders that cannot move, so the counted first request does what the timed
+    # repeats do; bench_transitions measures moves
+    final_ids = list(Order.objects.filter(status__in=('Delivered', 'Cancelled')).order_by('-order_id')
+                     .values_list('order_id', flat=True)[:100])
+
+    samples = {'order_id': order_ids[0], 'restaurant_id': item['restaurant_id']}
+    extra = {
+        'api_order_status_batch': ('get', {'data': {'ids': ','.join(map(str, order_ids))}}),
+        'api_orders_status': ('post', {'data': json.dumps({'ids': order_ids}), 'content_type': 'application/json'}),
+        'api_search': ('get', {'data': {'q': item['name'].split()[0]}}),
+        'export_orders': ('get', {'data': {'start': last_day.astimezone(dt_timezone.utc).date().isoformat()}}),
+        'api_transition_orders': ('post', {
+            'data': json.dumps({'ids': final_ids, 'status': 'Confirmed'}),
+            'content_type': 'application/json',
+        }),
+        'api_place_order': ('post', {
+            'data': json.dumps({'customer_id': customer_id, 'restaurant_id': item['restaurant_id'],
+                                'items': [{'menu_item_id': item['item_id'], 'quantity': 2}]}),
+            'content_type': 'application/json',
+        }),
+    }
+    requests = {}
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        kwargs = {name: samples[name] for name in pattern.pattern.converters}
+        method, client_kwargs = extra.get(pattern.name, ('get', {}))
+        requests[pattern.name] = (method, reverse(f'{urls.app_name}:{pattern.name}', kwargs=kwargs), client_kwargs)
+    return requests
+
+
+async def drain(chunks):
+    async for _ in chunks:
+        pass
+
+
+def fetch(client, method, path, client_kwargs):
+    response = getattr(client, method)(path, **client_kwargs)
+    if response.status_code >= 400:
+        raise CommandError(f'{method.upper()} {path} returned {response.status_code}')
+    if response.get('Content-Type') == 'text/event-stream':
+        # an event stream never ends: measure up to the headers, like the middleware
+        response.close()
+    elif response.streaming and response.is_async:
+        async_to_sync(drain)(response.streaming_content)
+    elif response.streaming:
+        for _ in response.streaming_content:
+            pass
+    else:
+        response.content
+    return response
+
+
+# every request comes from one client; this times the views, not the rate limit
+@override_settings(API_RATE_LIMIT_RATE=0)
+def run_routes(requests, repeat):
+    """
+    {url name: {'queries', 'ms', 'peak_kb'}}. Queries are counted on a cold
+    cache, so cached views report what a miss costs; time is the median of
+    `repeat` warm requests; peak is the tracemalloc high-water mark of one.
+    """
+    anonymous, staff = Client(), Client()
+    staff.force_login(User.objects.get_or_create(username='bench-staff', defaults={
+        'is_staff': True, 'is_superuser': True})[0])
+    results = {}
+    for name, (method, path, client_kwargs) in requests.items():
+        client = staff if name in STAFF_ROUTES else anonymous
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            fetch(client, method, path, client_kwargs)
+        # read it now: the next request resets the connection's query log
+        query_count = len(queries)
+
+        samples = []
+        # as timeit does: a collection landing in one sample is noise
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fetch(client, method, path, client_kwargs)
+                samples.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+        tracemalloc.start()
+        try:
+            fetch(client, method, path, client_kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        results[name] = {
+            'queries': query_count,
+            'ms': round(statistics.median(samples) * 1000, 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    return results
+
+
+def scaling_exponent(small, large, n_small, n_large):
+    """k in value ~ size**k between two sizes; 1.0 is linear."""
+    if small <= 0 or large <= 0:
+        return 0.0
+    return math.log(large / small) / math.log(n_large / n_small)
+
+
+def scaling_problems(results, max_exponent):
+    """
+    Routes whose query count grows with the data (an N+1), or whose time or
+    peak memory grows faster than size**max_exponent between the smallest
+    and largest size.
+    """
+    sizes = sorted(results, key=int)
+    if len(sizes) < 2:
+        return []
+    first, last = sizes[0], sizes[-1]
+    problems = []
+    for name, small in results[first].items():
+        large = results[last].get(name)
+        if large is None:
+            continue
+        if large['queries'] > small['queries']:
+            problems.append(f'{name}: {small["queries"]} queries at {first} orders, '
+                            f'{large["queries"]} at {last}')
+        for key, floor, unit in (('ms', MIN_TIME_MS, 'ms'), ('peak_kb', MIN_PEAK_KB, 'KB')):
+            if large[key] < floor:
+                continue
+            k = scaling_exponent(small[key], large[key], int(first), int(last))
+            if k > max_exponent:
+                problems.append(f'{name}: {key} grows as size^{k:.2f} '
+                                f'({small[key]}{unit} -> {large[key]}{unit})')
+    return problems
+
+
+def _over(current, base, tolerance, floor):
+    return current > base * (1 + tolerance) and current - base > floor
+
+
+def regressions(results, baseline, memory_tolerance):
+    """
+    Routes chattier or hungrier than the baseline at the same size. Query
+    counts and allocations do not depend on the machine, so they gate.
+    """
+    problems = []
+    for size, routes in results.items():
+        for name, current in routes.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if current['queries'] > base['queries']:
+                problems.append(f'{name} @ {size}: {current["queries"]} queries, baseline {base["queries"]}')
+            if _over(current['peak_kb'], base['peak_kb'], memory_tolerance, MIN_PEAK_KB):
+                problems.append(f'{name} @ {size}: peak_kb {current["peak_kb"]}, baseline {base["peak_kb"]} '
+                                f'(+{(current["peak_kb"] / base["peak_kb"] - 1) * 100:.0f}%)')
+    return problems
+
+
+def slowdowns(results, baseline, time_tolerance):
+    """
+    Routes slower than the baseline at the same size. The baseline was
+    timed on another machine, so these are reported, never failed on.
+    """
+    warnings = []
+    for size, routes in results.items():
+        for name, current in routes.items():
+            base = baseline.get(size, {}).get(name)
+            if base is not None and _over(current['ms'], base['ms'], time_tolerance, MIN_TIME_MS):
+                warnings.append(f'{name} @ {size}: ms {current["ms"]}, baseline {base["ms"]} '
+                                f'(+{(current["ms"] / base["ms"] - 1) * 100:.0f}%)')
+    return warnings
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database at several sizes, requests every route in '
+            'delivery/urls.py through the test client and records query count, median '
+            'time and peak memory per route. Fails if a route makes more queries or '
+            'allocates more than the checked-in baseline, or scales super-linearly with '
+            'the data; slower timings than the baseline are only reported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                            help='Comma-separated dataset sizes, in orders')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per route and size')
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write these results as the new baseline instead of comparing')
+        parser.add_argument('--time-tolerance', type=float, default=0.5,
+                            help='Slowdown against the baseline worth a warning (0.5 = 50%%)')
+        parser.add_argument('--memory-tolerance', type=float, default=0.25)
+        parser.add_argument('--max-exponent', type=float, default=1.25,
+                            help='Fail if time or memory grows faster than size**this')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+
+        # never seed over real data
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            results = {}
+            for size in sizes:
+                self.stdout.write(f'Seeding {size:,} orders...')
+                seed(size)
+                results[str(size)] = run_routes(sample_requests(), options['repeat'])
+                self.report(size, results[str(size)])
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        path = Path(options['baseline'])
+        if options['update_baseline']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({'sizes': sizes, 'results': results}, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {path}'))
+            return
+
+        problems = scaling_problems(results, options['max_exponent'])
+        if path.exists():
+            baseline = json.loads(path.read_text())['results']
+            problems += regressions(results, baseline, options['memory_tolerance'])
+            for warning in slowdowns(results, baseline, options['time_tolerance']):
+                self.stdout.write(self.style.WARNING(f'  {warning}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'No baseline at {path}, only checking scaling'))
+
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(f'  {problem}'))
+        if problems:
+            raise CommandError(f'{len(problems)} performance regression(s)')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def report(self, size, routes):
+        self.stdout.write(f'{"route":<28} {"queries":>7} {"median":>10} {"peak":>10}')
+        for name, row in routes.items():
+            self.stdout.write(f'{name:<28} {row["queries"]:>7} {row["ms"]:>8.2f}ms {row["peak_kb"]:>8.0f}KB')
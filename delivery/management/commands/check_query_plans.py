@@ -0,0 +1,168 @@
+import json
+import re
+from datetime import timezone as dt_timezone
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.urls import URLPattern
+
+from delivery import urls
+from delivery.models import MenuItem, Order, Restaurant
+
+
+# Small dimension tables that views legitimately list in full, and work
+# queues that are drained on every read.
+ALLOWED_SCANS = {'restaurant', 'delivery_personnel', 'rollup_dirty_bucket'}
+
+# Views whose purpose is to list or aggregate every row of a table.
+EXPECTED_SCANS = {
+    'sql_demo': {'menu_item', 'customer'},
+}
+
+# views that take their input from the query string: GET param -> sample value
+QUERY_PARAMS = {
+    'api_order_status_batch': {'ids': 'order_id', 'since': 'order_day'},
+    'api_search': {'q': 'search_term'},
+    'export_orders': {'start': 'order_day', 'end': 'order_day'},
+}
+
+# read-only views that take a POSTed JSON body: body key -> sample value
+JSON_BODIES = {
+    'api_orders_status': {'ids': 'order_ids', 'since': 'order_day'},
+}
+
+
+async def drain(chunks):
+    async for _ in chunks:
+        pass
+
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = ('Runs every view in delivery/urls.py, EXPLAINs each SELECT it issues and '
+            'fails if any of them does a full table scan. Run it against a populated '
+            'database: on near-empty tables the planner prefers scans regardless of indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allow-scan', action='append', default=[], metavar='TABLE',
+                            help='Additional table that may be fully scanned')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan row')
+
+    def handle(self, *args, **options):
+        allowed = ALLOWED_SCANS | set(options['allow_scan'])
+        sample_kwargs = self.sample_kwargs()
+        factory = RequestFactory()
+        # never saved: an active superuser holds every permission without a query
+        staff = User(username='check_query_plans', is_active=True, is_staff=True, is_superuser=True)
+        failures = []
+
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            name = pattern.name
+            params = list(pattern.pattern.converters)
+            if any(p not in sample_kwargs for p in params):
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, no sample value for {params}'))
+                continue
+
+            if name in JSON_BODIES:
+                body = {key: sample_kwargs.get(sample) for key, sample in JSON_BODIES[name].items()}
+                request = factory.post('/', json.dumps(body), content_type='application/json')
+            else:
+                query = {key: sample_kwargs[sample] for key, sample in QUERY_PARAMS.get(name, {}).items()
+                         if sample in sample_kwargs}
+                request = factory.get('/', query)
+            request.user = staff
+            statements = self.capture(pattern.callback, request, {p: sample_kwargs[p] for p in params})
+            view_allowed = allowed | EXPECTED_SCANS.get(name, set())
+            self.stdout.write(f'{name}: {len(statements)} SELECT statement(s)')
+            for sql, params_ in statements:
+                scans, plan = self.full_scans(sql, params_)
+                if options['verbose_plans']:
+                    for row in plan:
+                        self.stdout.write(f'    {row}')
+                bad = sorted(set(scans) - view_allowed)
+                if bad:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'  FULL SCAN on {", ".join(bad)}: {" ".join(sql.split())[:160]}'
+                    ))
+
+        if failures:
+            raise CommandError(f'Full table scans in: {", ".join(sorted(set(failures)))}')
+        self.stdout.write(self.style.SUCCESS('No unexpected full table scans.'))
+
+    def sample_kwargs(self):
+        kwargs = {}
+        restaurant_id = Restaurant.objects.values_list('restaurant_id', flat=True).first()
+        order = Order.objects.order_by('-order_date').values('order_id', 'order_date').first()
+        if restaurant_id is not None:
+            kwargs['restaurant_id'] = restaurant_id
+        if order is not None:
+            kwargs['order_id'] = order['order_id']
+            kwargs['order_ids'] = [order['order_id']]
+            kwargs['order_day'] = order['order_date'].astimezone(dt_timezone.utc).date().isoformat()
+        dish = MenuItem.objects.filter(is_available=True).values_list('name', flat=True).first()
+        if dish:
+            kwargs['search_term'] = dish.split()[0]
+        return kwargs
+
+    def capture(self, view, request, kwargs):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # a cache hit would hide the queries behind it
+        no_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        if iscoroutinefunction(view):
+            # async ORM calls run on this thread, so the wrapper still sees them
+            view = async_to_sync(view)
+        with override_settings(CACHES=no_cache), connection.execute_wrapper(record):
+            response = view(request, **kwargs)
+            # exports and batch statuses query as they stream; event streams never end
+            if response.streaming and response.get('Content-Type') != 'text/event-stream':
+                if response.is_async:
+                    async_to_sync(drain)(response.streaming_content)
+                else:
+                    for _ in response.streaming_content:
+                        pass
+        return statements
+
+    def full_scans(self, sql, params):
+        vendor = connection.vendor
+        prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            columns = [col[0].lower() for col in cursor.description]
+            rows = cursor.fetchall()
+
+        scans = []
+        if vendor == 'sqlite':
+            plan = [row[-1] for row in rows]
+            for detail in plan:
+                match = SQLITE_SCAN.match(detail)
+                if match:
+                    scans.append(match.group(1))
+        elif vendor == 'mysql':
+            plan = [dict(zip(columns, row)) for row in rows]
+            scans = [row['table'] for row in plan if row.get('type') == 'ALL']
+        else:
+            plan = [row[0] for row in rows]
+            for line in plan:
+                scans.extend(POSTGRES_SCAN.findall(line))
+        return self.resolve_aliases(sql, scans), plan
+
+    def resolve_aliases(self, sql, tables):
+        # raw SQL in sql_queries_demo uses short aliases (o, c, r ...)
+        aliases = dict((alias, table) for table, alias in
+                       re.findall(r'(?:FROM|JOIN)\s+"?(\w+)"?\s+(?:AS\s+)?"?(\w+)"?', sql, re.I))
+        return [aliases.get(t, t) for t in tables]
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from delivery.dispatch import dispatch_pending, DISPATCH_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Assigns available couriers to unassigned orders, oldest first (safe to run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DISPATCH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        assigned = dispatch_pending(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Assigned {assigned} order(s).'))
@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery.export import BATCH_SIZE, EXPORT_FORMATS, day_range, export_chunks
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'{value!r} is not a YYYY-MM-DD date')
+
+
+class Command(BaseCommand):
+    help = ('Writes every order line placed between --start and --end (UTC days, both '
+            'inclusive) as CSV or JSON Lines, with the customer and restaurant of each '
+            'order. Reads in batches, so memory stays flat however long the range.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_day, help='First day, YYYY-MM-DD (default: no limit)')
+        parser.add_argument('--end', type=parse_day, help='Last day, YYYY-MM-DD (default: no limit)')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Orders read per query')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and end < start:
+            raise CommandError('--end is before --start')
+        chunks = export_chunks(options['format'], day_range(start, end), options['batch_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
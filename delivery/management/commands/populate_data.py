@@ -1,22 +1,278 @@
 from django.core.management.base import BaseCommand
-from delivery.models import Customer, Restaurant, MenuItem, DeliveryPersonnel, Order, OrderItem
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from delivery.models import (
+    Customer, Restaurant, MenuItem, MenuSearchEntry, DeliveryPersonnel, Order, OrderItem, OrderStatusEvent,
+)
+from delivery.menu_cache import invalidate_menus
+from delivery.versions import touch_tables
+from delivery.rollups import refresh_rollups, reset_rollups
+from delivery.search import rebuild_search_index
+from delivery.stats import rebuild_dashboard_stats, rebuild_customer_stats, rebuild_restaurant_stats
+from contextlib import contextmanager
+from datetime import timedelta
 from decimal import Decimal
 from django.utils import timezone
+import bisect
+import itertools
 import random
+import time
+
+# dependents first, so foreign keys never dangle mid-clear
+DATA_MODELS = [OrderStatusEvent, OrderItem, Order, MenuSearchEntry, MenuItem, Restaurant, Customer, DeliveryPersonnel]
+
+FIRST_NAMES = ['Rajesh', 'Sita', 'Amit', 'Priya', 'Kiran', 'Anita', 'Bikash', 'Sunita', 'Ramesh', 'Gita',
+               'Suman', 'Asha', 'Nabin', 'Puja', 'Deepak', 'Mina', 'Sanjay', 'Rita', 'Prakash', 'Sarita']
+LAST_NAMES = ['Kumar', 'Sharma', 'Thapa', 'Rana', 'Shrestha', 'Gurung', 'Tamang', 'Rai', 'Magar', 'Karki',
+              'Adhikari', 'Poudel', 'Lama', 'Bhandari', 'Joshi', 'Khadka', 'Basnet', 'Maharjan']
+AREAS = ['Thamel, Kathmandu', 'Lazimpat, Kathmandu', 'Baneshwor, Kathmandu', 'Pulchowk, Lalitpur',
+         'Jhamsikhel, Lalitpur', 'Koteshwor, Kathmandu', 'Maharajgunj, Kathmandu', 'Bhaktapur Durbar Square',
+         'Kupondole, Lalitpur', 'New Road, Kathmandu', 'Boudha, Kathmandu', 'Kirtipur']
+RESTAURANT_WORDS = (['Spice', 'Dragon', 'Golden', 'Royal', 'Himalayan', 'Urban', 'Little', 'Green', 'Red', 'Old Town'],
+                    ['Garden', 'Wok', 'Kitchen', 'House', 'Junction', 'Bistro', 'Corner', 'Palace', 'Express', 'Table'])
+DISHES = ['Momo', 'Chow Mein', 'Thukpa', 'Butter Chicken', 'Paneer Tikka', 'Dal Bhat', 'Biryani', 'Pizza',
+          'Pasta', 'Burger', 'Tacos', 'Burrito', 'Fried Rice', 'Spring Rolls', 'Sekuwa', 'Choila', 'Lassi',
+          'Milkshake', 'Gulab Jamun', 'Brownie', 'Nachos', 'Fries', 'Samosa', 'Soup', 'Salad']
+PRICE_RANGES = {'Stater': (150, 400), 'Main Course': (250, 900), 'Dessert': (100, 350),
+                'Beverage': (60, 250), 'Snack': (80, 300)}
+# relative order volume per hour of day: lunch and dinner peaks
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.2, 0.3, 1, 2, 3, 3, 4, 8, 14, 12, 6, 4, 4, 5, 9, 14, 13, 8, 4, 2]
+ACTIVE_STATUSES = ['Pending', 'Confirmed', 'Preparing', 'Out for Delivery']
+STATUS_PATH = ['Pending', 'Confirmed', 'Preparing', 'Out for Delivery', 'Delivered']
+
+
+def zipf_cum_weights(n, s):
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+def status_history(rng, status, order_date, now, prep_minutes, delivery_minutes):
+    """(from, to, changed_at, seconds in from) for each status an order went through to reach `status`."""
+    if status == 'Cancelled':
+        path = STATUS_PATH[:rng.randint(1, 3)] + ['Cancelled']
+    else:
+        path = STATUS_PATH[:STATUS_PATH.index(status) + 1]
+    typical = {'Pending': 2, 'Confirmed': 4, 'Preparing': prep_minutes, 'Out for Delivery': delivery_minutes}
+    events = [(None, 'Pending', order_date, None)]
+    entered = order_date
+    for old, new in zip(path, path[1:]):
+        changed_at = min(now, entered + timedelta(minutes=rng.lognormvariate(0, 0.4) * typical[old]))
+        events.append((old, new, changed_at, round((changed_at - entered).total_seconds())))
+        entered = changed_at
+    return events
+
+
+@contextmanager
+def explicit_order_dates():
+    # auto_now_add would overwrite the generated order_date on insert
+    field = Order._meta.get_field('order_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
 
 class Command(BaseCommand):
-    help = 'Populates database with sample data'
+    help = ('Populates database with sample data. Pass --customers/--restaurants/--orders '
+            'to generate a load-scale dataset instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, help='Number of customers to generate')
+        parser.add_argument('--restaurants', type=int, help='Number of restaurants to generate')
+        parser.add_argument('--orders', type=int, help='Number of orders to generate')
+        parser.add_argument('--couriers', type=int, help='Number of delivery personnel (default: orders / 2000)')
+        parser.add_argument('--days', type=int, default=90, help='Spread orders over this many past days')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, same seed gives same dataset')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if any(options[name] is not None for name in ('customers', 'restaurants', 'orders')):
+            self.generate(options)
+        else:
+            self.populate_sample()
+        self.refresh_derived_data()
+
+    def clear_data(self):
+        # raw DELETEs: Model.delete() would load and signal every row
+        reset_rollups()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in DATA_MODELS:
+                cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+    def refresh_derived_data(self):
+        self.stdout.write('Rebuilding dashboard counters, customer and restaurant totals, search index '
+                          'and analytics rollups...')
+        rebuild_dashboard_stats()
+        rebuild_customer_stats()
+        rebuild_restaurant_stats()
+        rebuild_search_index()
+        # nothing else writes while the data is loaded, so no order can commit late
+        refresh_rollups(commit_lag=timedelta(0))
+        invalidate_menus(*Restaurant.objects.values_list('restaurant_id', flat=True))
+        touch_tables(*(model._meta.db_table for model in DATA_MODELS))
+
+    def generate(self, options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        n_customers = options['customers'] or 1000
+        n_restaurants = options['restaurants'] or 50
+        n_orders = options['orders'] if options['orders'] is not None else 10000
+        n_couriers = options['couriers'] or max(5, n_orders // 2000)
+        self.inserted = 0
+        self.started = time.perf_counter()
+
+        self.stdout.write('Clearing existing data...')
+        self.clear_data()
+
+        self.stdout.write(f'Creating {n_customers:,} customers...')
+        self.bulk_insert(Customer, n_customers, batch_size, lambda i: Customer(
+            customer_id=i + 1,
+            name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            email=f'customer{i + 1}@example.com',
+            phone=f'98{rng.randrange(10**8):08d}',
+            address=rng.choice(AREAS),
+        ))
+
+        self.stdout.write(f'Creating {n_restaurants:,} restaurants with menus...')
+        cuisines = [choice for choice, _ in Restaurant.CUISINE_CHOICES]
+        categories = list(PRICE_RANGES)
+        self.bulk_insert(Restaurant, n_restaurants, batch_size, lambda i: Restaurant(
+            restaurant_id=i + 1,
+            name=f'{rng.choice(RESTAURANT_WORDS[0])} {rng.choice(RESTAURANT_WORDS[1])} #{i + 1}',
+            address=rng.choice(AREAS),
+            phone=f'01{rng.randrange(10**7):07d}',
+            rating=Decimal(rng.randint(300, 500)) / 100,
+            cuisine_type=rng.choice(cuisines),
+        ))
+
+        menus = []  # restaurant index -> [(item_id, price), ...]
+        items = []
+        for r in range(n_restaurants):
+            menu = []
+            for _ in range(rng.randint(8, 25)):
+                category = rng.choice(categories)
+                low, high = PRICE_RANGES.get(category, (100, 500))
+                price = Decimal(rng.randrange(low, high, 10))
+                items.append(MenuItem(
+                    item_id=len(items) + 1, restaurant_id=r + 1,
+                    name=f'{rng.choice(DISHES)} {len(items) + 1}'[:50],
+                    description=f'House special from {AREAS[r % len(AREAS)]}',
+                    price=price, category=category, is_available=rng.random() > 0.05,
+                ))
+                menu.append((len(items), price))
+            menus.append(menu)
+        self.bulk_insert(MenuItem, len(items), batch_size, items.__getitem__)
+
+        vehicles = [choice for choice, _ in DeliveryPersonnel.VEHICLE_CHOICES]
+        self.bulk_insert(DeliveryPersonnel, n_couriers, batch_size, lambda i: DeliveryPersonnel(
+            delivery_id=i + 1, name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            phone=f'98{rng.randrange(10**8):08d}', vehicle_type=rng.choice(vehicles),
+            is_available=rng.random() > 0.3,
+        ))
+
+        self.stdout.write(f'Creating {n_orders:,} orders...')
+        self.generate_orders(rng, n_orders, n_customers, n_couriers, menus, options['days'], batch_size)
+        self.reset_sequences()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS('=' * 50))
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted {self.inserted:,} rows in {elapsed:.1f}s ({self.inserted / elapsed:,.0f} rows/s)'
+        ))
+        self.stdout.write(self.style.SUCCESS('=' * 50))
+
+    def generate_orders(self, rng, n_orders, n_customers, n_couriers, menus, days, batch_size):
+        restaurant_weights = zipf_cum_weights(len(menus), 1.1)
+        customer_weights = zipf_cum_weights(n_customers, 0.6)
+        hour_weights = list(itertools.accumulate(HOUR_WEIGHTS))
+        now = timezone.now()
+        start_day = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # draw every timestamp first so order_id increases with order_date
+        timestamps = sorted(
+            min(now, start_day + timedelta(
+                days=rng.randrange(days + 1),
+                hours=bisect.bisect(hour_weights, rng.random() * hour_weights[-1]),
+                seconds=rng.randrange(3600),
+            ))
+            for _ in range(n_orders)
+        )
+        recent = now - timedelta(hours=2)
+        # typical minutes in the kitchen per restaurant and on the road per courier
+        prep_minutes = [rng.uniform(8, 30) for _ in menus]
+        delivery_minutes = [rng.uniform(15, 40) for _ in range(n_couriers)]
+
+        done, next_report = 0, n_orders // 10
+        order_item_id = 0
+        with explicit_order_dates():
+            for offset in range(0, n_orders, batch_size):
+                orders, order_items, events = [], [], []
+                for i in range(offset, min(offset + batch_size, n_orders)):
+                    order_date = timestamps[i]
+                    r = bisect.bisect(restaurant_weights, rng.random() * restaurant_weights[-1])
+                    menu = menus[r]
+                    lines = rng.sample(menu, min(len(menu), rng.choices((1, 2, 3, 4, 5), (30, 35, 20, 10, 5))[0]))
+                    total = Decimal('0.00')
+                    for item_id, price in lines:
+                        quantity = rng.choice((1, 1, 1, 2, 2, 3))
+                        total += price * quantity
+                        order_item_id += 1
+                        order_items.append(OrderItem(order_item_id=order_item_id, order_id=i + 1, menu_item_id=item_id,
+                                                     quantity=quantity, item_price=price))
+                    if order_date < recent:
+                        status = 'Cancelled' if rng.random() < 0.08 else 'Delivered'
+                    else:
+                        status = rng.choice(ACTIVE_STATUSES)
+                    courier = rng.randrange(n_couriers) if status != 'Pending' else None
+                    history = status_history(rng, status, order_date, now, prep_minutes[r],
+                                             delivery_minutes[courier or 0])
+                    events.extend(OrderStatusEvent(order_id=i + 1, from_status=old, to_status=new, changed_at=at,
+                                                   duration_seconds=seconds) for old, new, at, seconds in history)
+                    orders.append(Order(
+                        order_id=i + 1,
+                        customer_id=bisect.bisect(customer_weights, rng.random() * customer_weights[-1]) + 1,
+                        restaurant_id=r + 1,
+                        delivery_person_id=courier + 1 if courier is not None else None,
+                        order_date=order_date,
+                        status_changed_at=history[-1][2],
+                        total_amount=total,
+                        status=status,
+                        delivery_address=rng.choice(AREAS),
+                    ))
+                with transaction.atomic():
+                    Order.objects.bulk_create(orders)
+                    OrderItem.objects.bulk_create(order_items)
+                    OrderStatusEvent.objects.bulk_create(events)
+                self.inserted += len(orders) + len(order_items) + len(events)
+                done += len(orders)
+                if done >= next_report or done == n_orders:
+                    self.progress(f'orders {done:,}/{n_orders:,}')
+                    next_report += max(n_orders // 10, 1)
+
+    def bulk_insert(self, model, count, batch_size, build):
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create([build(i) for i in range(offset, min(offset + batch_size, count))])
+        self.inserted += count
+        self.progress(f'{model._meta.verbose_name_plural} {count:,}')
+
+    def progress(self, label):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f'  {label} ({self.inserted:,} rows, {self.inserted / elapsed:,.0f} rows/s)')
+
+    def reset_sequences(self):
+        # rows were inserted with explicit ids; PostgreSQL sequences need to catch up
+        statements = connection.ops.sequence_reset_sql(no_style(), DATA_MODELS)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
 
-    def handle(self, *args, **kwargs):
+    def populate_sample(self):
         self.stdout.write('Starting data population...')
         
         self.stdout.write('Clearing existing data...')
-        OrderItem.objects.all().delete()
-        Order.objects.all().delete()
-        MenuItem.objects.all().delete()
-        Restaurant.objects.all().delete()
-        Customer.objects.all().delete()
-        DeliveryPersonnel.objects.all().delete()
+        self.clear_data()
         
         self.stdout.write('Creating customers...')
         customers = [
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from delivery.models import DashboardStats
+from delivery.stats import STATS_ID, rebuild_dashboard_stats, compute_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the dashboard counters from the source tables and reports any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, do not rewrite the counters')
+
+    def handle(self, *args, **options):
+        current = DashboardStats.objects.filter(pk=STATS_ID).values(
+            'total_customers', 'total_restaurants', 'total_orders',
+            'total_menu_items', 'active_orders'
+        ).first()
+        actual = compute_dashboard_stats()
+
+        if current is None:
+            self.stdout.write('No stored counters yet.')
+        else:
+            drift = {name: current[name] - value for name, value in actual.items() if current[name] != value}
+            if drift:
+                for name, delta in drift.items():
+                    self.stdout.write(self.style.WARNING(f'{name}: stored {current[name]}, actual {actual[name]} ({delta:+d})'))
+            else:
+                self.stdout.write('Counters match the source tables.')
+
+        if not options['check']:
+            rebuild_dashboard_stats()
+            self.stdout.write(self.style.SUCCESS('Dashboard counters rebuilt.'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from delivery.stats import (
+    customer_stats_drift, rebuild_customer_stats, restaurant_stats_drift, rebuild_restaurant_stats,
+)
+
+
+# name -> (drift generator, rebuild function)
+TOTALS = {
+    'customer': (customer_stats_drift, rebuild_customer_stats),
+    'restaurant': (restaurant_stats_drift, rebuild_restaurant_stats),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compares the totals stored on customers and restaurants with their orders '
+            'and menus, reports the rows that drifted and recomputes them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TOTALS), help='Check one table only')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift, do not rewrite the totals')
+        parser.add_argument('--show', type=int, default=20, help='How many drifted rows to list per table')
+
+    def handle(self, *args, **options):
+        for name in [options['only']] if options['only'] else TOTALS:
+            drift, rebuild = TOTALS[name]
+            self.reconcile(name, drift, rebuild, options)
+
+    def reconcile(self, name, drift, rebuild, options):
+        drifted = []
+        for pk, stored, actual in drift():
+            if len(drifted) < options['show']:
+                changes = ', '.join(f'{field} {stored[field]} -> {actual[field]}'
+                                    for field in stored if stored[field] != actual[field])
+                self.stdout.write(self.style.WARNING(f'{name} {pk}: {changes}'))
+            drifted.append(pk)
+
+        if not drifted:
+            self.stdout.write(f'{name.capitalize()} totals match the source tables.')
+            return
+        self.stdout.write(f'{len(drifted)} {name}(s) drifted.')
+
+        if not options['check']:
+            for start in range(0, len(drifted), 1000):
+                rebuild(drifted[start:start + 1000])
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {len(drifted)} {name}(s).'))
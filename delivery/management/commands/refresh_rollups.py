@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from delivery.rollups import refresh_rollups, reset_rollups
+
+
+class Command(BaseCommand):
+    help = ('Folds new and changed orders into the analytics rollup tables, which the analytics page '
+            'only reads (safe to run from cron; schedule it every few minutes)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop all rollups and rebuild them from every order')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+            self.stdout.write('Rollups cleared.')
+        hours = refresh_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {hours} hour bucket(s).'))
@@ -0,0 +1,152 @@
+"""
+Read-through cache for per-restaurant menus.
+
+Entries are keyed by restaurant and a version token. Saving or deleting a
+Restaurant or MenuItem moves the version on (see delivery.signals), so an
+edited menu is never read back from an old entry; stale entries simply
+expire. The version token is also the menu's ETag. There is no
+Last-Modified: HTTP dates are whole seconds, so an edit in the same second
+as the copy a client holds would still answer If-Modified-Since with a 304.
+
+The version lives in the default cache, so every process serving requests
+must share it (file-based locally, memcached/redis in production); with
+locmem, invalidation only reaches the process that made the edit.
+
+Concurrent misses for the same menu version share one load (see
+delivery.coalesce), so a herd of requests for a popular menu that just
+changed costs one pair of queries, not one per request.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .coalesce import Flight
+from .metrics import registry
+from .models import Restaurant, MenuItem
+
+
+MENU_FIELDS = ('item_id', 'name', 'price', 'category', 'description', 'is_available')
+MENU_TIMEOUT = 60 * 60 * 6
+
+MENU_FLIGHT = Flight('menu')
+
+MENU_CACHE_EVENTS = registry.counter(
+    'delivery_menu_cache_events_total', 'Menu cache hits, misses and invalidations.', ['event'])
+
+
+def _count(name):
+    MENU_CACHE_EVENTS.inc(event=name)
+
+
+def menu_cache_stats():
+    return {name: MENU_CACHE_EVENTS.value(event=name) for name in ('hits', 'misses', 'invalidations')}
+
+
+def _version_key(restaurant_id):
+    return f'menu:version:{restaurant_id}'
+
+
+def menu_version(restaurant_id):
+    key = _version_key(restaurant_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def amenu_version(restaurant_id):
+    key = _version_key(restaurant_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def menu_etag(restaurant_id, kind, version=None):
+    if version is None:
+        version = menu_version(restaurant_id)
+    return f'{kind}-{restaurant_id}-{version}'
+
+
+def load_menu(restaurant_id):
+    return {
+        'restaurant': Restaurant.objects.filter(restaurant_id=restaurant_id).first(),
+        'menu_items': list(MenuItem.objects.filter(
+            restaurant_id=restaurant_id,
+            is_available=True
+        ).values(*MENU_FIELDS)),
+    }
+
+
+async def aload_menu(restaurant_id):
+    return {
+        'restaurant': await Restaurant.objects.filter(restaurant_id=restaurant_id).afirst(),
+        'menu_items': [item async for item in MenuItem.objects.filter(
+            restaurant_id=restaurant_id,
+            is_available=True
+        ).values(*MENU_FIELDS)],
+    }
+
+
+def _menu_key(restaurant_id, version):
+    return f'menu:{restaurant_id}:{version}'
+
+
+def get_menu(restaurant_id):
+    """Return {'restaurant': Restaurant | None, 'menu_items': [dict, ...]}."""
+    key = _menu_key(restaurant_id, menu_version(restaurant_id))
+    menu = cache.get(key)
+    if menu is None:
+        _count('misses')
+
+        def fill():
+            menu = load_menu(restaurant_id)
+            cache.set(key, menu, MENU_TIMEOUT)
+            return menu
+        menu = MENU_FLIGHT.do(key, fill)
+    else:
+        _count('hits')
+    return menu
+
+
+async def aget_menu(restaurant_id, version=None):
+    """Async get_menu(); pass `version` if the caller already read it."""
+    if version is None:
+        version = await amenu_version(restaurant_id)
+    key = _menu_key(restaurant_id, version)
+    menu = await cache.aget(key)
+    if menu is None:
+        _count('misses')
+
+        async def fill():
+            menu = await aload_menu(restaurant_id)
+            await cache.aset(key, menu, MENU_TIMEOUT)
+            return menu
+        menu = await MENU_FLIGHT.ado(key, fill)
+    else:
+        _count('hits')
+    return menu
+
+
+def _bump(restaurant_ids):
+    version = time.time_ns()
+    cache.set_many({_version_key(rid): version for rid in restaurant_ids}, timeout=None)
+
+
+def invalidate_menus(*restaurant_ids):
+    """
+    Move the menu version on now, so this transaction reads its own
+    writes, and again on commit, so nothing cached from pre-commit data
+    by other requests survives.
+    """
+    restaurant_ids = {rid for rid in restaurant_ids if rid is not None}
+    if not restaurant_ids:
+        return
+    _count('invalidations')
+    _bump(restaurant_ids)
+    transaction.on_commit(lambda: _bump(restaurant_ids))
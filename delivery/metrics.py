@@ -0,0 +1,230 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters and histograms are registered once at import time and updated
+from request handling code; views.metrics renders them for scraping.
+Values are per process, so each worker is scraped on its own.
+
+The per-request part lives here as well: RequestMetrics collects query
+count, database time, the slowest statement and template render time for
+the current request (see delivery.middleware), reached through a context
+variable so it works for sync and async views alike.
+"""
+import bisect
+import contextvars
+import re
+import threading
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [count per bucket..., count above the last bucket, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def totals(self, **labels):
+        """(number of observations, their sum) for `labels`."""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            return (sum(row[:-1]), row[-1]) if row else (0, 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(row)) for key, row in self._values.items())
+        for key, row in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield f'{self.name}_bucket', labels + [('le', le)], cumulative
+            yield f'{self.name}_sum', labels, row[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'delivery_request_duration_seconds', 'Time spent handling a request.', ['view'])
+DB_DURATION = registry.histogram(
+    'delivery_db_duration_seconds', 'Time spent in SQL per request.', ['view'])
+DB_QUERIES = registry.histogram(
+    'delivery_db_queries_per_request', 'SQL statements executed per request.', ['view'],
+    buckets=QUERY_COUNT_BUCKETS)
+TEMPLATE_DURATION = registry.histogram(
+    'delivery_template_render_seconds', 'Time spent rendering templates per request.', ['view'])
+N_PLUS_ONE = registry.counter(
+    'delivery_n_plus_one_total', 'Requests that repeated one SQL statement shape too often.', ['view'])
+
+
+""" PER-REQUEST COLLECTION """
+_current = contextvars.ContextVar('delivery_request_metrics', default=None)
+
+# IN lists of different lengths are still the same statement
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'slowest', 'slowest_sql', 'template_time', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+        self.template_time = 0.0
+        self.shapes = {}
+
+    def repeated_statements(self, threshold):
+        """[(sql shape, times executed)] for shapes executed more than `threshold` times."""
+        return sorted(((sql, n) for sql, n in self.shapes.items() if n > threshold), key=lambda x: -x[1])
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_request():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper hook, installed on every connection (see delivery.signals)."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_time += elapsed
+        if elapsed > metrics.slowest:
+            metrics.slowest, metrics.slowest_sql = elapsed, sql
+        shape = _IN_LIST.sub('IN (...)', sql) if 'IN (' in sql else sql
+        metrics.shapes[shape] = metrics.shapes.get(shape, 0) + 1
+
+
+""" TEMPLATES """
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render for RequestMetrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
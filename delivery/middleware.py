@@ -0,0 +1,77 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+
+logger = logging.getLogger('delivery.metrics')
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+def record_request(request, response, collected, started):
+    """Feed one finished request into the metrics, logs and Server-Timing header."""
+    elapsed = time.perf_counter() - started
+    view = _view_name(request)
+    metrics.REQUEST_DURATION.observe(elapsed, view=view)
+    metrics.DB_DURATION.observe(collected.db_time, view=view)
+    metrics.DB_QUERIES.observe(collected.queries, view=view)
+    metrics.TEMPLATE_DURATION.observe(collected.template_time, view=view)
+
+    threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 10)
+    repeated = collected.repeated_statements(threshold)
+    if repeated:
+        metrics.N_PLUS_ONE.inc(view=view)
+        for sql, count in repeated:
+            logger.warning('Possible N+1 in %s: statement executed %d times: %s', view, count, sql)
+
+    slow_ms = getattr(settings, 'METRICS_SLOW_QUERY_MS', 100)
+    if collected.slowest * 1000 >= slow_ms:
+        logger.warning('Slow query in %s (%.1fms): %s', view, collected.slowest * 1000, collected.slowest_sql)
+
+    if response is not None:
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={collected.db_time * 1000:.1f};desc="{collected.queries} queries"',
+            f'db-slowest;dur={collected.slowest * 1000:.1f}',
+            f'tpl;dur={collected.template_time * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ])
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """
+    Per-request query count, database time, slowest statement and template
+    time, added as a Server-Timing header and recorded in delivery.metrics.
+    Streaming responses are measured up to the point the body starts.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            collected, token = metrics.start_request()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await get_response(request)
+            finally:
+                metrics.end_request(token)
+                record_request(request, response, collected, started)
+            return response
+    else:
+        def middleware(request):
+            collected, token = metrics.start_request()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = get_response(request)
+            finally:
+                metrics.end_request(token)
+                record_request(request, response, collected, started)
+            return response
+    return middleware
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0003_order_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_customers', models.IntegerField(default=0)),
+                ('total_restaurants', models.IntegerField(default=0)),
+                ('total_orders', models.IntegerField(default=0)),
+                ('total_menu_items', models.IntegerField(default=0)),
+                ('active_orders', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Dashboard Stats',
+                'db_table': 'dashboard_stats',
+            },
+        ),
+    ]
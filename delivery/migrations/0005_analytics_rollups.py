@@ -0,0 +1,97 @@
+# Generated by Django 6.0.2 on 2026-10-18 18:51
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0004_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(unique=True)),
+                ('marked_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rollup_dirty_bucket',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.IntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'rollup_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='StatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Preparing', 'Preparing'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+            ],
+            options={
+                'db_table': 'status_rollup',
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'status'), name='status_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourierRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('total_deliveries', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('delivery_person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='delivery.deliverypersonnel')),
+            ],
+            options={
+                'db_table': 'courier_rollup',
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'delivery_person'), name='courier_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MenuItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('times_ordered', models.IntegerField(default=0)),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='delivery.menuitem')),
+            ],
+            options={
+                'db_table': 'menu_item_rollup',
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'menu_item'), name='menu_item_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='delivery.restaurant')),
+            ],
+            options={
+                'db_table': 'restaurant_rollup',
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'restaurant'), name='restaurant_rollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:26
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model('delivery', 'Customer')
+    Order = apps.get_model('delivery', 'Order')
+    orders = Order.objects.filter(customer=OuterRef('pk')).exclude(status='Cancelled').order_by().values('customer')
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    Customer.objects.update(
+        order_count=Coalesce(Subquery(orders.annotate(n=Count('*')).values('n')), 0),
+        total_spent=Coalesce(Subquery(orders.annotate(spent=Sum('total_amount')).values('spent'), output_field=money),
+                             Value(Decimal('0.00')), output_field=money),
+        last_order_date=Subquery(orders.annotate(latest=Max('order_date')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_spent', 'customer_id'], name='customer_ranking_idx'),
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
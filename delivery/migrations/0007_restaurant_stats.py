@@ -0,0 +1,55 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:30
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_restaurant_stats(apps, schema_editor):
+    Restaurant = apps.get_model('delivery', 'Restaurant')
+    Order = apps.get_model('delivery', 'Order')
+    MenuItem = apps.get_model('delivery', 'MenuItem')
+    orders = Order.objects.filter(restaurant=OuterRef('pk')).exclude(status='Cancelled').order_by().values('restaurant')
+    items = MenuItem.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')
+    money = models.DecimalField(max_digits=14, decimal_places=2)
+    Restaurant.objects.update(
+        order_count=Coalesce(Subquery(orders.annotate(n=Count('*')).values('n')), 0),
+        revenue=Coalesce(Subquery(orders.annotate(total=Sum('total_amount')).values('total'), output_field=money),
+                         Value(Decimal('0.00')), output_field=money),
+        menu_size=Coalesce(Subquery(items.annotate(n=Count('*')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_customer_lifetime_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='menu_size',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='order_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['rating', 'restaurant_id'], name='restaurant_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['cuisine_type', 'rating', 'restaurant_id'], name='restaurant_cuisine_rating_idx'),
+        ),
+        migrations.RunPython(backfill_restaurant_stats, migrations.RunPython.noop),
+    ]
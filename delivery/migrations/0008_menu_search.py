@@ -0,0 +1,86 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_FTS = [
+    # external content: the text lives in menu_search, the FTS table only indexes it
+    "CREATE VIRTUAL TABLE menu_search_fts USING fts5(title, body, tags, content='menu_search', "
+    "content_rowid='menu_item_id', prefix='2 3', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER menu_search_ai AFTER INSERT ON menu_search BEGIN "
+    "INSERT INTO menu_search_fts(rowid, title, body, tags) VALUES (new.menu_item_id, new.title, new.body, new.tags); "
+    "END",
+    "CREATE TRIGGER menu_search_ad AFTER DELETE ON menu_search BEGIN "
+    "INSERT INTO menu_search_fts(menu_search_fts, rowid, title, body, tags) "
+    "VALUES ('delete', old.menu_item_id, old.title, old.body, old.tags); "
+    "END",
+    "CREATE TRIGGER menu_search_au AFTER UPDATE ON menu_search BEGIN "
+    "INSERT INTO menu_search_fts(menu_search_fts, rowid, title, body, tags) "
+    "VALUES ('delete', old.menu_item_id, old.title, old.body, old.tags); "
+    "INSERT INTO menu_search_fts(rowid, title, body, tags) VALUES (new.menu_item_id, new.title, new.body, new.tags); "
+    "END",
+]
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS menu_search_au',
+    'DROP TRIGGER IF EXISTS menu_search_ad',
+    'DROP TRIGGER IF EXISTS menu_search_ai',
+    'DROP TABLE IF EXISTS menu_search_fts',
+]
+MYSQL_FULLTEXT = [
+    'ALTER TABLE menu_search ADD FULLTEXT INDEX menu_search_title_ft (title)',
+    'ALTER TABLE menu_search ADD FULLTEXT INDEX menu_search_text_ft (title, body, tags)',
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_FTS, 'mysql': MYSQL_FULLTEXT}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    # MySQL's indexes go with the table
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS_DROP:
+            schema_editor.execute(sql)
+
+
+def backfill_menu_search(apps, schema_editor):
+    MenuItem = apps.get_model('delivery', 'MenuItem')
+    MenuSearchEntry = apps.get_model('delivery', 'MenuSearchEntry')
+    rows = MenuItem.objects.order_by('pk').values_list(
+        'item_id', 'name', 'description', 'category', 'restaurant__name', 'restaurant__cuisine_type'
+    )
+    batch = []
+    for item_id, name, description, category, restaurant, cuisine in rows.iterator(chunk_size=2000):
+        batch.append(MenuSearchEntry(menu_item_id=item_id, title=name, body=description,
+                                     tags=f'{category} {restaurant} {cuisine}'))
+        if len(batch) >= 2000:
+            MenuSearchEntry.objects.bulk_create(batch)
+            batch = []
+    MenuSearchEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0007_restaurant_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuSearchEntry',
+            fields=[
+                ('menu_item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='delivery.menuitem')),
+                ('title', models.CharField(max_length=50)),
+                ('body', models.TextField(blank=True)),
+                ('tags', models.CharField(max_length=255)),
+            ],
+            options={
+                'db_table': 'menu_search',
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_menu_search, migrations.RunPython.noop),
+    ]
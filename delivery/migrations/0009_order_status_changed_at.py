@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:54
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_status_changed_at(apps, schema_editor):
+    # the real time of the last change is unknown; the order date is the earliest it can be
+    Order = apps.get_model('delivery', 'Order')
+    Order.objects.update(status_changed_at=F('order_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0008_menu_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_status_changed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0009_order_status_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupstate',
+            name='last_event_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CourierDurationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Preparing', 'Preparing'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('le_minutes', models.IntegerField(blank=True, null=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('delivery_person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duration_rollups', to='delivery.deliverypersonnel')),
+            ],
+            options={
+                'db_table': 'courier_duration_rollup',
+                'indexes': [models.Index(fields=['status', 'delivery_person', 'bucket', 'le_minutes', 'order_count'], name='courier_duration_owner_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'status', 'delivery_person', 'le_minutes'), name='courier_duration_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('from_status', models.CharField(blank=True, choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Preparing', 'Preparing'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('to_status', models.CharField(choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Preparing', 'Preparing'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('changed_at', models.DateTimeField()),
+                ('duration_seconds', models.IntegerField(blank=True, null=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='delivery.order')),
+            ],
+            options={
+                'db_table': 'order_status_event',
+                'indexes': [models.Index(fields=['changed_at'], name='status_event_changed_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantDurationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Confirmed', 'Confirmed'), ('Preparing', 'Preparing'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('le_minutes', models.IntegerField(blank=True, null=True)),
+                ('order_count', models.IntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duration_rollups', to='delivery.restaurant')),
+            ],
+            options={
+                'db_table': 'restaurant_duration_rollup',
+                'indexes': [models.Index(fields=['status', 'restaurant', 'bucket', 'le_minutes', 'order_count'], name='restaurant_duration_owner_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'status', 'restaurant', 'le_minutes'), name='restaurant_duration_rollup_uniq')],
+            },
+        ),
+    ]
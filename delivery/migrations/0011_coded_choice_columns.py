@@ -0,0 +1,129 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:19
+
+import delivery.fields
+from django.db import migrations, models, transaction
+from django.db.models import Case, F, Max, Value, When
+
+
+# frozen copies of the model IntegerChoices
+STATUS_CODES = [(5, 'Pending'), (2, 'Confirmed'), (6, 'Preparing'), (4, 'Out for Delivery'), (3, 'Delivered'), (1, 'Cancelled')]
+CATEGORY_CODES = [(6, 'Stater'), (3, 'Main Course'), (2, 'Dessert'), (1, 'Beverage'), (4, 'Snack'), (5, 'Starter')]
+CUISINE_CODES = [(4, 'Indian'), (1, 'Chinese'), (5, 'Italian'), (6, 'Mexican'), (3, 'Fast Food'), (2, 'Continental')]
+VEHICLE_CODES = [(2, 'Bike'), (4, 'Scooter'), (3, 'Car'), (1, 'Bicycle')]
+
+CODED_COLUMNS = [
+    ('order', 'status', STATUS_CODES),
+    ('orderstatusevent', 'from_status', STATUS_CODES),
+    ('orderstatusevent', 'to_status', STATUS_CODES),
+    ('statusrollup', 'status', STATUS_CODES),
+    ('restaurantdurationrollup', 'status', STATUS_CODES),
+    ('courierdurationrollup', 'status', STATUS_CODES),
+    ('menuitem', 'category', CATEGORY_CODES),
+    ('restaurant', 'cuisine_type', CUISINE_CODES),
+    ('deliverypersonnel', 'vehicle_type', VEHICLE_CODES),
+]
+# columns where '' meant "none" and becomes NULL
+NULLABLE = {('orderstatusevent', 'from_status')}
+BATCH_SIZE = 10000
+
+
+def rewrite_in_batches(apps, schema_editor, model_name, field, whens):
+    # short transactions over primary key ranges, so no lock is held for the whole table
+    model = apps.get_model('delivery', model_name)
+    rows = model.objects.using(schema_editor.connection.alias)
+    high = rows.aggregate(high=Max('pk'))['high'] or 0
+    for start in range(0, high + 1, BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            rows.filter(pk__gte=start, pk__lt=start + BATCH_SIZE).update(
+                **{field: Case(*whens, default=F(field))}
+            )
+
+
+def labels_to_codes(apps, schema_editor):
+    """Replace each label with its code, still as text; the AlterFields below change the type."""
+    for model_name, field, codes in CODED_COLUMNS:
+        model = apps.get_model('delivery', model_name)
+        known = [label for _, label in codes]
+        nullable = (model_name, field) in NULLABLE
+        unknown = model.objects.using(schema_editor.connection.alias).exclude(**{f'{field}__in': known})
+        if nullable:
+            unknown = unknown.exclude(**{f'{field}__in': ['']}).exclude(**{f'{field}__isnull': True})
+        unknown = sorted(set(unknown.values_list(field, flat=True)[:1000]))
+        if unknown:
+            raise ValueError(f'{model._meta.db_table}.{field} holds values with no code: {unknown[:10]}')
+        whens = [When(**{field: label}, then=Value(str(code))) for code, label in codes]
+        if nullable:
+            whens.append(When(**{field: ''}, then=Value(None)))
+        rewrite_in_batches(apps, schema_editor, model_name, field, whens)
+
+
+def codes_to_labels(apps, schema_editor):
+    for model_name, field, codes in CODED_COLUMNS:
+        whens = [When(**{field: str(code)}, then=Value(label)) for code, label in codes]
+        if (model_name, field) in NULLABLE:
+            whens.append(When(**{f'{field}__isnull': True}, then=Value('')))
+        rewrite_in_batches(apps, schema_editor, model_name, field, whens)
+
+
+class Migration(migrations.Migration):
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('delivery', '0010_order_status_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderstatusevent',
+            name='from_status',
+            field=models.CharField(blank=True, choices=[(label, label) for _, label in STATUS_CODES],
+                                   max_length=20, null=True),
+        ),
+        migrations.RunPython(labels_to_codes, codes_to_labels),
+        migrations.AlterField(
+            model_name='courierdurationrollup',
+            name='status',
+            field=delivery.fields.CodedChoiceField(codes=STATUS_CODES),
+        ),
+        migrations.AlterField(
+            model_name='deliverypersonnel',
+            name='vehicle_type',
+            field=delivery.fields.CodedChoiceField(codes=VEHICLE_CODES),
+        ),
+        migrations.AlterField(
+            model_name='menuitem',
+            name='category',
+            field=delivery.fields.CodedChoiceField(codes=CATEGORY_CODES),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=delivery.fields.CodedChoiceField(codes=STATUS_CODES, default='Pending'),
+        ),
+        migrations.AlterField(
+            model_name='orderstatusevent',
+            name='from_status',
+            field=delivery.fields.CodedChoiceField(blank=True, codes=STATUS_CODES, null=True),
+        ),
+        migrations.AlterField(
+            model_name='orderstatusevent',
+            name='to_status',
+            field=delivery.fields.CodedChoiceField(codes=STATUS_CODES),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='cuisine_type',
+            field=delivery.fields.CodedChoiceField(codes=CUISINE_CODES),
+        ),
+        migrations.AlterField(
+            model_name='restaurantdurationrollup',
+            name='status',
+            field=delivery.fields.CodedChoiceField(codes=STATUS_CODES),
+        ),
+        migrations.AlterField(
+            model_name='statusrollup',
+            name='status',
+            field=delivery.fields.CodedChoiceField(codes=STATUS_CODES),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0011_coded_choice_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupstate',
+            name='pending_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rollupstate',
+            name='pending_order_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rollupstate',
+            name='window_digest',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0012_rollup_commit_lag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupstate',
+            name='pending_event_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.core.validators import MinValueValidator ,MaxValueValidator
 from decimal import Decimal
+
+from .fields import CodedChoiceField
 # Create your models here.
 
 
@@ -13,24 +16,37 @@ class Customer(models.Model):
     address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # lifetime totals over orders that were not cancelled, kept current by delivery.signals
+    order_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_order_date = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         db_table = 'customer'
         ordering = ['-created_at']
+        indexes = [
+            # customer_list: biggest spenders first, read backwards
+            models.Index(fields=['total_spent', 'customer_id'], name='customer_ranking_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
     
 
 
+# The coded columns below store the code, numbered in the labels' alphabetical
+# order so that ORDER BY on a column sorts as the label text did. Codes are
+# stored data: never renumber one, and give a new label the next free code.
 class Restaurant(models.Model):
-    CUISINE_CHOICES = [
-        ('Indian' , 'Indian'),
-        ('Chinese', 'Chinese'),
-        ('Italian', 'Italian'),
-        ('Mexican', 'Mexican'),
-        ('Fast Food', 'Fast Food'),
-        ('Continental', 'Continental'),
-    ]
+    class Cuisine(models.IntegerChoices):
+        INDIAN = 4, 'Indian'
+        CHINESE = 1, 'Chinese'
+        ITALIAN = 5, 'Italian'
+        MEXICAN = 6, 'Mexican'
+        FAST_FOOD = 3, 'Fast Food'
+        CONTINENTAL = 2, 'Continental'
+
+    CUISINE_CHOICES = [(label, label) for label in Cuisine.labels]
 
     restaurant_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -43,11 +59,21 @@ class Restaurant(models.Model):
         validators=[MinValueValidator(0.0),MaxValueValidator(5.0)]
     )
 
-    cuisine_type = models.CharField(max_length=50,choices=CUISINE_CHOICES)
+    cuisine_type = CodedChoiceField(codes=Cuisine)
+
+    # orders that were not cancelled and dishes on the menu, kept current by delivery.signals
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    menu_size = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'restaurant'
         ordering = ['-rating']
+        indexes = [
+            # restaurant_list: best rated first, optionally within one cuisine
+            models.Index(fields=['rating', 'restaurant_id'], name='restaurant_rating_idx'),
+            models.Index(fields=['cuisine_type', 'rating', 'restaurant_id'], name='restaurant_cuisine_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.cuisine_type}"
@@ -55,13 +81,16 @@ class Restaurant(models.Model):
 
 
 class MenuItem(models.Model):
-    CATEGORY_CHOICES = [
-        ('Stater','Stater'),
-        ('Main Course', 'Main Course'),
-        ('Dessert', 'Dessert'),
-        ('Beverage', 'Beverage'),
-        ('Snack', 'Snack'),
-    ]
+    class Category(models.IntegerChoices):
+        STATER = 6, 'Stater'
+        MAIN_COURSE = 3, 'Main Course'
+        DESSERT = 2, 'Dessert'
+        BEVERAGE = 1, 'Beverage'
+        SNACK = 4, 'Snack'
+        # what the sample data has always stored next to the misspelt choice
+        STARTER = 5, 'Starter'
+
+    CATEGORY_CHOICES = [(label, label) for label in Category.labels]
 
     item_id = models.AutoField(primary_key=True)
     restaurant = models.ForeignKey(
@@ -72,30 +101,48 @@ class MenuItem(models.Model):
     name = models.CharField(max_length=50)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=8,decimal_places=2)
-    category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
+    category = CodedChoiceField(codes=Category)
     is_available = models.BooleanField(default=True)
 
 
     class Meta:
         db_table = 'menu_item'
         ordering = ['category','name']
+        indexes = [
+            # restaurant_detail / api_restaurant_menu: available items in menu order
+            models.Index(fields=['restaurant', 'is_available', 'category', 'name'], name='menu_item_menu_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - Rs.{self.price} ({self.restaurant.name})"
 
 
+class MenuSearchEntry(models.Model):
+    # the searchable text of one menu item, kept current by delivery.signals;
+    # indexed for full-text search by the 0008 migration (see delivery.search)
+    menu_item = models.OneToOneField(MenuItem, on_delete=models.CASCADE, primary_key=True,
+                                     related_name='search_entry')
+    title = models.CharField(max_length=50)
+    body = models.TextField(blank=True)
+    tags = models.CharField(max_length=255)
+
+    class Meta:
+        db_table = 'menu_search'
+
+
 class DeliveryPersonnel(models.Model):
-    VEHICLE_CHOICES = [
-        ('Bike', 'Bike'),
-        ('Scooter', 'Scooter'),
-        ('Car', 'Car'),
-        ('Bicycle', 'Bicycle'),
-    ]
+    class Vehicle(models.IntegerChoices):
+        BIKE = 2, 'Bike'
+        SCOOTER = 4, 'Scooter'
+        CAR = 3, 'Car'
+        BICYCLE = 1, 'Bicycle'
+
+    VEHICLE_CHOICES = [(label, label) for label in Vehicle.labels]
     
     delivery_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=15)
-    vehicle_type = models.CharField(max_length=50, choices=VEHICLE_CHOICES)
+    vehicle_type = CodedChoiceField(codes=Vehicle)
     is_available = models.BooleanField(default=True)
 
 
@@ -109,14 +156,15 @@ class DeliveryPersonnel(models.Model):
 
 
 class Order(models.Model):
-    STATUS_CHOICES = [
-        ('Pending', 'Pending'),
-        ('Confirmed', 'Confirmed'),
-        ('Preparing', 'Preparing'),
-        ('Out for Delivery', 'Out for Delivery'),
-        ('Delivered', 'Delivered'),
-        ('Cancelled', 'Cancelled'),
-    ]
+    class Status(models.IntegerChoices):
+        PENDING = 5, 'Pending'
+        CONFIRMED = 2, 'Confirmed'
+        PREPARING = 6, 'Preparing'
+        OUT_FOR_DELIVERY = 4, 'Out for Delivery'
+        DELIVERED = 3, 'Delivered'
+        CANCELLED = 1, 'Cancelled'
+
+    STATUS_CHOICES = [(label, label) for label in Status.labels]
 
     order_id = models.AutoField(primary_key=True)
     customer = models.ForeignKey(
@@ -142,21 +190,33 @@ class Order(models.Model):
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
 
-    status = models.CharField(
-        max_length=20, 
-        choices=STATUS_CHOICES, 
-        default='Pending'
-    )
+    status = CodedChoiceField(codes=Status, default='Pending')
+    # set by delivery.signals on save and by delivery.transitions in bulk
+    status_changed_at = models.DateTimeField(default=timezone.now)
 
     delivery_address = models.TextField()
 
     class Meta:
         db_table = 'order_table'
         ordering = ['-order_date']
+        indexes = [
+            # newest-first listings and the keyset cursor in order_list
+            models.Index(fields=['order_date', 'order_id'], name='order_date_id_idx'),
+            # status filters and per-status counts
+            models.Index(fields=['status', 'order_date', 'order_id'], name='order_status_date_idx'),
+            models.Index(fields=['customer', 'order_date'], name='order_customer_date_idx'),
+            # completed deliveries per courier in analytics
+            models.Index(fields=['delivery_person', 'status'], name='order_courier_status_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.order_id} - {self.customer.name} - Rs.{self.total_amount}"
 
+    def save(self, *args, **kwargs):
+        # the status event and totals written by delivery.signals commit with the row
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order_item_id = models.AutoField(primary_key=True)
@@ -177,6 +237,10 @@ class OrderItem(models.Model):
 
     class Meta:
             db_table = 'order_item'
+            indexes = [
+                # covers the per-item GROUP BY in analytics
+                models.Index(fields=['menu_item', 'quantity'], name='order_item_item_qty_idx'),
+            ]
         
     def get_subtotal(self):
         return self.quantity * self.item_price
@@ -188,3 +252,176 @@ class OrderItem(models.Model):
         if not self.item_price:
             self.item_price = self.menu_item.price
         super().save(*args, **kwargs)
+
+
+class OrderStatusEvent(models.Model):
+    # append-only: one row per status an order entered, written with the change
+    event_id = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    # null for the event that created the order
+    from_status = CodedChoiceField(codes=Order.Status, null=True, blank=True)
+    to_status = CodedChoiceField(codes=Order.Status)
+    changed_at = models.DateTimeField()
+    # time spent in from_status; null for the event that created the order
+    duration_seconds = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'order_status_event'
+        indexes = [
+            # the days rebuilt by delivery.rollups
+            models.Index(fields=['changed_at'], name='status_event_changed_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+class DashboardStats(models.Model):
+    # single row read by the home page, kept current by delivery.signals
+    total_customers = models.IntegerField(default=0)
+    total_restaurants = models.IntegerField(default=0)
+    total_orders = models.IntegerField(default=0)
+    total_menu_items = models.IntegerField(default=0)
+    active_orders = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'dashboard_stats'
+        verbose_name_plural = 'Dashboard Stats'
+
+    def __str__(self):
+        return f"Dashboard stats ({self.updated_at:%Y-%m-%d %H:%M})"
+
+
+""" ANALYTICS ROLLUPS (maintained by delivery.rollups) """
+ROLLUP_PERIOD_CHOICES = [
+    ('hour', 'Hour'),
+    ('day', 'Day'),
+]
+
+
+class RestaurantRollup(models.Model):
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='rollups')
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        db_table = 'restaurant_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'restaurant'], name='restaurant_rollup_uniq'),
+        ]
+
+
+class MenuItemRollup(models.Model):
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='rollups')
+    times_ordered = models.IntegerField(default=0)
+    total_quantity = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'menu_item_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'menu_item'], name='menu_item_rollup_uniq'),
+        ]
+
+
+class CourierRollup(models.Model):
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    delivery_person = models.ForeignKey(DeliveryPersonnel, on_delete=models.CASCADE, related_name='rollups')
+    total_deliveries = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'courier_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'delivery_person'], name='courier_rollup_uniq'),
+        ]
+
+
+class StatusRollup(models.Model):
+    period = models.CharField(max_length=4, choices=ROLLUP_PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    status = CodedChoiceField(codes=Order.Status)
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        db_table = 'status_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'status'], name='status_rollup_uniq'),
+        ]
+
+
+class RestaurantDurationRollup(models.Model):
+    # orders that left `status` on day `bucket` after more than the previous
+    # bound and at most le_minutes; le_minutes is null past the last bound
+    bucket = models.DateTimeField()
+    status = CodedChoiceField(codes=Order.Status)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='duration_rollups')
+    le_minutes = models.IntegerField(null=True, blank=True)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'restaurant_duration_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'status', 'restaurant', 'le_minutes'],
+                                    name='restaurant_duration_rollup_uniq'),
+        ]
+        indexes = [
+            # covers ranking by samples and reading the histograms back
+            models.Index(fields=['status', 'restaurant', 'bucket', 'le_minutes', 'order_count'],
+                         name='restaurant_duration_owner_idx'),
+        ]
+
+
+class CourierDurationRollup(models.Model):
+    bucket = models.DateTimeField()
+    status = CodedChoiceField(codes=Order.Status)
+    delivery_person = models.ForeignKey(DeliveryPersonnel, on_delete=models.CASCADE,
+                                        related_name='duration_rollups')
+    le_minutes = models.IntegerField(null=True, blank=True)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'courier_duration_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'status', 'delivery_person', 'le_minutes'],
+                                    name='courier_duration_rollup_uniq'),
+        ]
+        indexes = [
+            # covers ranking by samples and reading the histograms back
+            models.Index(fields=['status', 'delivery_person', 'bucket', 'le_minutes', 'order_count'],
+                         name='courier_duration_owner_idx'),
+        ]
+
+
+class RollupState(models.Model):
+    # orders and status events above the watermarks may not be rolled up yet
+    last_order_id = models.IntegerField(default=0)
+    last_event_id = models.BigIntegerField(default=0)
+    # the highest ids seen at pending_at; they become the watermarks once
+    # ROLLUP_COMMIT_LAG_SECONDS have passed, so lower ids committed late
+    # are still picked up
+    pending_order_id = models.IntegerField(default=0)
+    pending_event_id = models.BigIntegerField(default=0)
+    pending_at = models.DateTimeField(null=True, blank=True)
+    # count, max and sum of the ids above each watermark at the last refresh;
+    # a row committing late below the highest id changes it
+    window_digest = models.CharField(max_length=200, blank=True, default='')
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'rollup_state'
+
+
+class RollupDirtyBucket(models.Model):
+    # hours whose already rolled-up orders changed since the last refresh
+    bucket = models.DateTimeField(unique=True)
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'rollup_dirty_bucket'
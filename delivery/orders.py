@@ -0,0 +1,237 @@
+"""
+Order placement and status lookups.
+
+place_order() validates a basket against one batched MenuItem lookup,
+prices it from the database, and writes the Order and all of its
+OrderItems in a single transaction. The number of queries does not depend
+on how many lines the basket has.
+
+status_chunks() answers a dashboard's batch status poll: thousands of
+orders read with one IN query over STATUS_FIELDS and written out as JSON
+while the rows are read. astatus_chunks() is the same body for the async
+API.
+"""
+import json
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import router, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .coalesce import Flight
+from .models import Customer, MenuItem, Order, OrderItem
+from .versions import touch_tables
+
+
+MAX_ORDER_LINES = 50
+MAX_LINE_QUANTITY = 100
+MAX_BATCH_STATUS_IDS = 5000
+STATUS_CHUNK_SIZE = 500
+# "as_of" trails the read by this much, so a status change whose transaction
+# was still open, or had not reached the replica yet, shows up next poll
+SINCE_OVERLAP = timedelta(seconds=10)
+
+# the columns behind the order status API, read with values()
+STATUS_FIELDS = ('order_id', 'status', 'total_amount', 'delivery_person__name')
+
+
+class OrderError(ValueError):
+    """The basket or customer cannot be turned into an order."""
+
+
+def _parse_lines(items):
+    if not isinstance(items, list) or not items:
+        raise OrderError('An order needs at least one item')
+
+    quantities = {}
+    for line in items:
+        if not isinstance(line, dict):
+            raise OrderError('Each item must be an object with menu_item_id and quantity')
+        try:
+            menu_item_id = int(line['menu_item_id'])
+            quantity = int(line.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise OrderError('Each item must be an object with menu_item_id and quantity')
+        if not 1 <= quantity <= MAX_LINE_QUANTITY:
+            raise OrderError(f'Quantity must be between 1 and {MAX_LINE_QUANTITY}')
+        # the same dish listed twice becomes one line
+        quantities[menu_item_id] = quantities.get(menu_item_id, 0) + quantity
+
+    if len(quantities) > MAX_ORDER_LINES:
+        raise OrderError(f'An order can have at most {MAX_ORDER_LINES} different items')
+    return quantities
+
+
+def place_order(customer_id, restaurant_id, items, delivery_address=None):
+    """
+    Create an order for `items` ([{'menu_item_id': ..., 'quantity': ...}])
+    and return it. Raises OrderError if anything in the request is invalid.
+    """
+    quantities = _parse_lines(items)
+
+    address = Customer.objects.filter(pk=customer_id).values_list('address', flat=True).first()
+    if address is None:
+        raise OrderError('Customer not found')
+
+    # one lookup prices every line and proves it belongs to this restaurant
+    prices = dict(MenuItem.objects.filter(
+        restaurant_id=restaurant_id, is_available=True, item_id__in=quantities
+    ).values_list('item_id', 'price'))
+    missing = sorted(set(quantities) - set(prices))
+    if missing:
+        raise OrderError(f'Items not available from this restaurant: {", ".join(map(str, missing))}')
+
+    total = sum(prices[item_id] * quantity for item_id, quantity in quantities.items())
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            customer_id=customer_id,
+            restaurant_id=restaurant_id,
+            total_amount=total,
+            delivery_address=delivery_address or address,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menu_item_id=item_id, quantity=quantity, item_price=prices[item_id])
+            for item_id, quantity in quantities.items()
+        ])
+        # bulk_create skips the signals
+        touch_tables(OrderItem._meta.db_table)
+    return order
+
+
+def recalculate_total(order):
+    """Set total_amount from the order's saved items."""
+    total = order.order_items.aggregate(total=Sum(F('quantity') * F('item_price')))['total']
+    order.total_amount = total or 0
+    order.save(update_fields=['total_amount'])
+    return order.total_amount
+
+
+def parse_order_ids(raw, limit=MAX_BATCH_STATUS_IDS):
+    """Turn "1,2,3" (or a list) into a de-duplicated list of at most `limit` ints."""
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(',') if part.strip()]
+    if not isinstance(raw, list) or not raw:
+        raise OrderError('Pass one or more order ids')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw))
+    except (TypeError, ValueError):
+        raise OrderError('Order ids must be integers')
+    if len(ids) > limit:
+        raise OrderError(f'At most {limit} order ids per request')
+    return ids
+
+
+def parse_since(raw):
+    """An ISO 8601 timestamp (UTC unless it says otherwise), or None if absent."""
+    if raw in (None, ''):
+        return None
+    value = parse_datetime(raw) if isinstance(raw, str) else None
+    if value is None:
+        raise OrderError('since must be an ISO 8601 timestamp')
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def status_payload(row):
+    """Shape a STATUS_FIELDS row the way api_order_status reports an order."""
+    return {
+        'order_id': row['order_id'],
+        'status': row['status'],
+        'total_amount': str(row['total_amount']),
+        'delivery_person': row['delivery_person__name'],
+    }
+
+
+STATUS_FLIGHT = Flight('order_status')
+
+
+def _status_key(order_id):
+    # a sticky client reads the primary and must not share a replica read
+    return router.db_for_read(Order), order_id
+
+
+def order_status(order_id):
+    """
+    status_payload() of one order, or None if there is none. Concurrent
+    calls for the same order share one query (see delivery.coalesce).
+    """
+    def load():
+        row = Order.objects.values(*STATUS_FIELDS).filter(order_id=order_id).first()
+        return None if row is None else status_payload(row)
+    return STATUS_FLIGHT.do(_status_key(order_id), load)
+
+
+async def aorder_status(order_id):
+    async def load():
+        row = await Order.objects.values(*STATUS_FIELDS).filter(order_id=order_id).afirst()
+        return None if row is None else status_payload(row)
+    return await STATUS_FLIGHT.ado(_status_key(order_id), load)
+
+
+class _StatusBody:
+    """The JSON framing shared by status_chunks() and astatus_chunks()."""
+
+    def __init__(self, order_ids, since):
+        self.order_ids, self.since = order_ids, since
+        # taken before the read, see SINCE_OVERLAP
+        self.as_of = timezone.now() - SINCE_OVERLAP
+        self.found, self.chunk = set(), []
+
+    def rows(self):
+        orders = Order.objects.filter(order_id__in=self.order_ids).values(*STATUS_FIELDS).order_by()
+        if self.since is not None:
+            orders = orders.filter(status_changed_at__gt=self.since)
+        return orders
+
+    def head(self):
+        return f'{{"success": true, "as_of": {json.dumps(self.as_of.isoformat())}, "orders": ['
+
+    def add(self, row):
+        """Take one row; returns a chunk to send once STATUS_CHUNK_SIZE have piled up."""
+        self.found.add(row['order_id'])
+        self.chunk.append(json.dumps(status_payload(row)))
+        if len(self.chunk) == STATUS_CHUNK_SIZE:
+            return self.flush()
+        return None
+
+    def flush(self):
+        chunk, self.chunk = self.chunk, []
+        return (', ' if len(self.found) > len(chunk) else '') + ', '.join(chunk)
+
+    def tail(self):
+        rest = self.flush() if self.chunk else ''
+        if self.since is None:
+            missing = [order_id for order_id in self.order_ids if order_id not in self.found]
+            return f'{rest}], "missing": {json.dumps(missing)}}}'
+        return f'{rest}]}}'
+
+
+def status_chunks(order_ids, since=None):
+    """
+    The JSON body of a batch status response, in chunks of up to
+    STATUS_CHUNK_SIZE orders. Without `since`, ids with no order are listed
+    under "missing". With it, only orders whose status changed after
+    `since` are listed; courier changes alone do not count. "as_of" is the
+    `since` to send on the next poll.
+    """
+    body = _StatusBody(order_ids, since)
+    yield body.head()
+    for row in body.rows().iterator(chunk_size=STATUS_CHUNK_SIZE):
+        chunk = body.add(row)
+        if chunk:
+            yield chunk
+    yield body.tail()
+
+
+async def astatus_chunks(order_ids, since=None):
+    """status_chunks(), read with the async ORM."""
+    body = _StatusBody(order_ids, since)
+    yield body.head()
+    async for row in body.rows().aiterator(chunk_size=STATUS_CHUNK_SIZE):
+        chunk = body.add(row)
+        if chunk:
+            yield chunk
+    yield body.tail()
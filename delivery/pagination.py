@@ -0,0 +1,139 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# below this many rows an exact COUNT(*) is cheap enough
+ESTIMATE_THRESHOLD = 10000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date_value, pk_value):
+    raw = f'{date_value.isoformat()}|{pk_value}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        date_part, pk_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(pk_part)
+    except (ValueError, UnicodeDecodeError, binascii.Error) as exc:
+        raise InvalidCursor(token) from exc
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, after=None, before=None, per_page=50,
+                    date_field='order_date', pk_field='order_id'):
+    """
+    Return one page of `queryset`, newest first, by seeking on
+    (date_field, pk_field) instead of using OFFSET.
+
+    `after` continues past the last row of a page and `before` goes back
+    from its first row; both are tokens produced by `encode_cursor`. Any
+    filters already on the queryset become part of the seek predicate.
+    """
+    if before:
+        date_value, pk_value = decode_cursor(before)
+        rows = list(
+            queryset.filter(
+                Q(**{f'{date_field}__gt': date_value})
+                | Q(**{date_field: date_value, f'{pk_field}__gt': pk_value})
+            ).order_by(date_field, pk_field)[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after:
+            date_value, pk_value = decode_cursor(after)
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__lt': date_value})
+                | Q(**{date_field: date_value, f'{pk_field}__lt': pk_value})
+            )
+        rows = list(queryset.order_by(f'-{date_field}', f'-{pk_field}')[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = bool(after)
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, date_field), getattr(row, pk_field))
+
+    return KeysetPage(
+        rows,
+        next_cursor=cursor_for(rows[-1]) if rows and has_next else None,
+        previous_cursor=cursor_for(rows[0]) if rows and has_previous else None,
+    )
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Row count of `model`'s table from the database's statistics, without
+    scanning it. None if the backend has no estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # rowids are handed out in order, so the largest is close to the row
+            # count unless many rows were deleted
+            cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large tables (admin changelists, customer_list): an
+    unfiltered list takes its count from table statistics instead of COUNT(*), which
+    is a full scan on InnoDB. Filtered lists are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
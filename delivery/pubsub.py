@@ -0,0 +1,98 @@
+"""
+In-process publish/subscribe for order status changes.
+
+Each live connection (see views.api_order_events) holds one Subscription
+for one order. A subscription keeps only the latest published payload,
+so a slow client never queues up history: it skips straight to the
+current status when it catches up. Memory per connection is therefore
+constant, and the total number of subscriptions is capped. The hub only
+holds subscriptions weakly, so a connection dropped before its stream
+started cannot leak one.
+
+publish() may be called from any thread (it is triggered on commit of an
+Order save); delivery is handed to each subscriber's event loop. The hub
+lives in one process, so run the ASGI server with a single worker per hub,
+or put a shared broker in front of it, for changes made elsewhere to
+reach every client.
+"""
+import asyncio
+import threading
+import weakref
+
+
+MAX_SUBSCRIBERS = 10000
+
+
+class Subscription:
+    __slots__ = ('order_id', 'loop', 'event', 'latest', 'release', '__weakref__')
+
+    def __init__(self, order_id, loop):
+        self.order_id = order_id
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.latest = None
+        self.release = None
+
+    def _deliver(self, payload):
+        self.latest = payload
+        self.event.set()
+
+    async def get(self, timeout=None):
+        """Wait for the next payload; None if `timeout` passes first."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        return self.latest
+
+
+class StatusHub:
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscriptions = {}
+        self._count = 0
+        # re-entrant: a finalizer can run on this thread while it holds the lock
+        self._lock = threading.RLock()
+
+    def subscribe(self, order_id):
+        """Return a Subscription (call from the event loop), or None if full."""
+        subscription = Subscription(order_id, asyncio.get_running_loop())
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subscriptions.setdefault(order_id, weakref.WeakSet()).add(subscription)
+            self._count += 1
+        # runs once: on unsubscribe() or when the subscription is collected
+        subscription.release = weakref.finalize(subscription, self._release, order_id)
+        return subscription
+
+    def _release(self, order_id):
+        with self._lock:
+            self._count -= 1
+            if not self._subscriptions.get(order_id, True):
+                del self._subscriptions[order_id]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.get(subscription.order_id, set()).discard(subscription)
+        subscription.release()
+
+    def publish(self, order_id, payload):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(order_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, payload)
+            except RuntimeError:
+                # the connection's loop is closed; its subscription goes with it
+                pass
+        return len(subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+
+hub = StatusHub()
@@ -0,0 +1,276 @@
+"""
+Named, parameterized reports behind one result cache.
+
+A Report is a raw SQL statement or an ORM query with declared parameters.
+run_report() looks a result up under a key made of its parameters and the
+current version (see delivery.versions) of every table the report reads,
+so a write to any of them moves the report on to a new key and a repeat
+view costs two cache round trips and no queries. Entries also expire
+after the report's ttl, which bounds anything the invalidation misses.
+
+Reports marked precompute aggregate whole tables, so they are expensive
+to recompute after every new order. The precompute_reports command
+computes their entry for the current table versions ahead of the page;
+run it from cron every minute or so. A request that gets there first
+still computes the report inline.
+"""
+import hashlib
+import textwrap
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .metrics import registry
+from .models import Order
+from .versions import table_versions
+
+
+REPORT_TIMEOUT = 60 * 5
+PRECOMPUTED_TIMEOUT = 60 * 60
+
+REPORT_DURATION = registry.histogram(
+    'delivery_report_duration_seconds', 'Time spent computing a report.', ['report'])
+REPORT_CACHE_EVENTS = registry.counter(
+    'delivery_report_cache_total', 'Report lookups served from the cache (hits) or computed (misses).',
+    ['report', 'event'])
+
+
+class Param:
+    """
+    A report parameter read from the query string. The raw value goes
+    through `cast`; anything that does not cast, is not one of `choices`
+    or is out of range becomes the default. `prep` turns the cleaned value
+    into what the SQL statement expects.
+    """
+
+    def __init__(self, name, default=None, cast=str, choices=None, minimum=None, maximum=None, prep=None,
+                 label=None):
+        self.name = name
+        self.label = label or name.capitalize()
+        self.default = default
+        self.cast = cast
+        self.choices = choices
+        self.minimum = minimum
+        self.maximum = maximum
+        self.prep = prep or (lambda value: value)
+
+    def clean(self, raw):
+        if raw in (None, ''):
+            return self.default
+        try:
+            value = self.cast(raw)
+        except (TypeError, ValueError, ArithmeticError):
+            return self.default
+        if self.choices is not None and value not in self.choices:
+            return self.default
+        if self.minimum is not None and value < self.minimum or self.maximum is not None and value > self.maximum:
+            return self.default
+        return value
+
+
+class Report:
+    """
+    `sql` is run with the prepped parameters as named (%(name)s)
+    placeholders; `query` is called with the cleaned ones and returns rows.
+    `tables` are the tables the result depends on, `columns` (label, kind)
+    pairs for the page, and `transform` reshapes each raw row.
+    """
+
+    def __init__(self, name, title, description, columns, tables, sql=None, query=None, params=(),
+                 transform=None, precompute=False, ttl=None):
+        self.name = name
+        self.title = title
+        self.description = description
+        self.columns = columns
+        self.tables = tuple(tables)
+        self.sql = textwrap.dedent(sql).strip() if sql else None
+        self.query = query
+        self.params = tuple(params)
+        self.transform = transform
+        self.precompute = precompute
+        self.ttl = ttl or (PRECOMPUTED_TIMEOUT if precompute else REPORT_TIMEOUT)
+
+    def clean(self, data):
+        return {param.name: param.clean(data.get(param.name)) for param in self.params}
+
+    def statement(self, params):
+        """The SQL behind the report, for display."""
+        return self.sql if self.query is None else str(self.query(**params).query)
+
+    def execute(self, params):
+        if self.query is not None:
+            rows = [tuple(row) for row in self.query(**params)]
+        else:
+            # every table a report reads routes the same way
+            with connections[router.db_for_read(Order)].cursor() as cursor:
+                cursor.execute(self.sql, {param.name: param.prep(params[param.name]) for param in self.params})
+                rows = cursor.fetchall()
+        if self.transform is not None:
+            rows = [self.transform(row) for row in rows]
+        return rows
+
+
+REPORTS = {}
+
+
+def register(report):
+    REPORTS[report.name] = report
+    return report
+
+
+""" CACHE """
+def _entry_key(report, params, versions):
+    digest = hashlib.sha1(repr((sorted(params.items()), versions)).encode()).hexdigest()
+    return f'report:{report.name}:{digest}'
+
+
+def _lookup(report, params):
+    """(cache key, cached entry or None) at the current table versions."""
+    # versions are read before the query runs, so a write that lands
+    # meanwhile leaves the entry under a key that is already out of date
+    key = _entry_key(report, params, table_versions(*report.tables))
+    return key, cache.get(key)
+
+
+def _store(report, params, key):
+    started = time.perf_counter()
+    rows = report.execute(params)
+    duration = time.perf_counter() - started
+    REPORT_DURATION.observe(duration, report=report.name)
+    entry = {'rows': rows, 'statement': report.statement(params), 'computed_at': timezone.now(),
+             'duration': duration}
+    cache.set(key, entry, report.ttl)
+    return entry
+
+
+def run_report(report, params):
+    """
+    (entry, cached) for cleaned `params`; entry holds 'rows', 'statement',
+    'computed_at' and 'duration' (seconds the computation took).
+    """
+    key, entry = _lookup(report, params)
+    if entry is not None:
+        REPORT_CACHE_EVENTS.inc(report=report.name, event='hits')
+        return entry, True
+    REPORT_CACHE_EVENTS.inc(report=report.name, event='misses')
+    return _store(report, params, key), False
+
+
+def precompute_reports(force=False):
+    """
+    Compute the default-parameter result of every precompute report that
+    has none at the current table versions (all of them with `force`), and
+    extend the lifetime of the rest. Returns {report name: seconds taken}
+    for the ones computed.
+    """
+    recomputed = {}
+    for report in REPORTS.values():
+        if not report.precompute:
+            continue
+        params = report.clean({})
+        key, entry = _lookup(report, params)
+        if force or entry is None:
+            recomputed[report.name] = _store(report, params, key)['duration']
+        else:
+            cache.touch(key, report.ttl)
+    return recomputed
+
+
+def report_stats(report):
+    """This process's computations and cache lookups of `report`."""
+    runs, total = REPORT_DURATION.totals(report=report.name)
+    return {
+        'runs': runs,
+        'mean_ms': total / runs * 1000 if runs else None,
+        'hits': REPORT_CACHE_EVENTS.value(report=report.name, event='hits'),
+        'misses': REPORT_CACHE_EVENTS.value(report=report.name, event='misses'),
+    }
+
+
+""" REPORTS """
+STATUS_FIELD = Order._meta.get_field('status')
+RATING_CHOICES = ('3.0', '3.5', '4.0', '4.5')
+
+
+def limit_param(default=10):
+    return Param('limit', default, cast=int, minimum=1, maximum=100)
+
+
+register(Report(
+    'recent_orders', 'INNER JOIN Query', 'Latest orders with customer and restaurant details',
+    columns=[('Order ID', None), ('Customer Name', None), ('Restaurant Name', None), ('Amount', 'money'),
+             ('Status', 'status')],
+    tables=('order_table', 'customer', 'restaurant'),
+    sql="""
+        SELECT
+            o.order_id,
+            c.name AS customer_name,
+            r.name AS restaurant_name,
+            o.total_amount,
+            o.status
+        FROM order_table o
+        INNER JOIN customer c ON o.customer_id = c.customer_id
+        INNER JOIN restaurant r ON o.restaurant_id = r.restaurant_id
+        WHERE %(status)s IS NULL OR o.status = %(status)s
+        ORDER BY o.order_date DESC
+        LIMIT %(limit)s
+    """,
+    params=[limit_param(), Param('status', choices=Order.Status.labels,
+                                 prep=lambda label: STATUS_FIELD.code_of.get(label))],
+    # the raw row carries the stored status code; show the label as the ORM does
+    transform=lambda row: (*row[:4], STATUS_FIELD.label_of[row[4]]),
+))
+
+register(Report(
+    'popular_items', 'LEFT JOIN Query', 'All menu items with their order count, even if never ordered',
+    columns=[('Item Name', None), ('Restaurant', None), ('Times Ordered', 'count')],
+    tables=('menu_item', 'order_item', 'restaurant'),
+    sql="""
+        SELECT
+            mi.name AS item_name,
+            r.name AS restaurant_name,
+            COUNT(oi.order_item_id) AS times_ordered
+        FROM menu_item mi
+        LEFT JOIN order_item oi ON mi.item_id = oi.menu_item_id
+        LEFT JOIN restaurant r ON mi.restaurant_id = r.restaurant_id
+        GROUP BY mi.item_id, mi.name, r.name
+        ORDER BY times_ordered DESC
+        LIMIT %(limit)s
+    """,
+    params=[limit_param()],
+    precompute=True,
+))
+
+register(Report(
+    'revenue_by_status', 'AGGREGATE Query (COUNT + GROUP BY)', 'Orders and total revenue per status',
+    columns=[('Status', 'status'), ('Order Count', 'count'), ('Total Revenue', 'money')],
+    tables=('order_table',),
+    query=lambda: Order.objects.values_list('status').annotate(
+        order_count=Count('pk'), total_revenue=Sum('total_amount')).order_by('status'),
+    precompute=True,
+))
+
+register(Report(
+    'top_rated_customers', 'SUB-QUERY', 'Customers who ordered from restaurants rated above a minimum',
+    columns=[('Customer Name', 'strong'), ('Email', None)],
+    tables=('customer', 'order_table', 'restaurant'),
+    sql="""
+        SELECT
+            c.name AS customer_name,
+            c.email
+        FROM customer c
+        WHERE c.customer_id IN (
+            SELECT DISTINCT o.customer_id
+            FROM order_table o
+            INNER JOIN restaurant r ON o.restaurant_id = r.restaurant_id
+            WHERE r.rating > %(min_rating)s
+        )
+        LIMIT %(limit)s
+    """,
+    params=[Param('min_rating', '4.0', choices=RATING_CHOICES, prep=Decimal, label='Minimum rating'),
+            limit_param()],
+))
@@ -0,0 +1,403 @@
+"""
+Hourly and daily pre-aggregates behind the analytics page.
+
+Hour rows are rebuilt from the source tables for every hour that received
+new orders (order_id above the RollupState watermark) or was marked dirty
+because an already rolled-up order or order item changed. Day rows are
+then re-summed from the hour rows of the affected days. Buckets are
+always recomputed whole, so refreshing twice never double counts.
+
+Auto-increment ids are handed out before commit, so an order or event can
+become visible after a higher id has already been read. The watermarks
+therefore only move up to the ids seen at a refresh at least
+ROLLUP_COMMIT_LAG_SECONDS ago. Every refresh compares the count, highest
+and sum of the ids above them with the last run's, and re-reads all of
+those rows when they differ, so a row that committed late is rolled up by
+the next refresh.
+
+The duration histograms count, per day and restaurant or courier, how long
+orders spent in a status, from the OrderStatusEvent log. A day is rebuilt
+when it received new events (event_id above the watermark), holds a dirty
+hour, or holds events of orders in a dirty hour, which covers orders moved
+to another restaurant or courier. Percentiles are read off the cumulative
+bucket counts, so they are the upper bound of the bucket they fall in.
+
+The analytics page only reads these tables; refreshing is left to the
+refresh_rollups management command, run from cron every few minutes.
+Refreshing or resetting moves the rollup tables' data versions on (see
+delivery.versions), which is what the analytics page's cached fragments
+are keyed by.
+"""
+import math
+from collections import defaultdict
+
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum, Max, Q, F, Value, Case, When, IntegerField
+from django.db.models.functions import Coalesce, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import (
+    MenuItem, Restaurant, DeliveryPersonnel, Order, OrderItem,
+    RestaurantRollup, MenuItemRollup, CourierRollup, StatusRollup,
+    RestaurantDurationRollup, CourierDurationRollup, OrderStatusEvent,
+    RollupState, RollupDirtyBucket,
+)
+from .versions import touch_tables
+
+
+HOUR, DAY = 'hour', 'day'
+ONE_HOUR, ONE_DAY = timedelta(hours=1), timedelta(days=1)
+RANGES_PER_QUERY = 100
+
+# model -> (dimension columns, summed columns)
+ROLLUP_FIELDS = {
+    RestaurantRollup: (('restaurant_id',), ('order_count', 'revenue')),
+    MenuItemRollup: (('menu_item_id',), ('times_ordered', 'total_quantity')),
+    CourierRollup: (('delivery_person_id',), ('total_deliveries', 'completed')),
+    StatusRollup: (('status',), ('order_count', 'revenue')),
+}
+
+# duration model -> (owner column on Order, statuses timed)
+DURATION_ROLLUPS = {
+    RestaurantDurationRollup: ('restaurant_id', ('Preparing',)),
+    CourierDurationRollup: ('delivery_person_id', ('Out for Delivery',)),
+}
+# histogram bucket upper bounds, roughly log-spaced
+DURATION_BOUNDS = (1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 30, 40, 50, 60, 75, 90, 120, 180, 240)
+PERCENTILES = (50, 90, 99)
+ROLLUP_TABLES = tuple(model._meta.db_table for model in [*ROLLUP_FIELDS, *DURATION_ROLLUPS])
+
+
+def hour_bucket(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(value):
+    return hour_bucket(value).replace(hour=0)
+
+
+def mark_dirty(*dates):
+    """Queue the hours containing `dates` for recomputation."""
+    buckets = {hour_bucket(d) for d in dates if d is not None}
+    if not buckets:
+        return
+    now = timezone.now()
+    RollupDirtyBucket.objects.bulk_create(
+        [RollupDirtyBucket(bucket=b, marked_at=now) for b in buckets],
+        update_conflicts=True,
+        unique_fields=['bucket'] if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=['marked_at'],
+    )
+
+
+def _merge_ranges(buckets, width):
+    ranges = []
+    for start in sorted(buckets):
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + width
+        else:
+            ranges.append([start, start + width])
+    return ranges
+
+
+def _in_ranges(field, ranges):
+    q = Q()
+    for start, end in ranges:
+        q |= Q(**{f'{field}__gte': start, f'{field}__lt': end})
+    return q
+
+
+def _chunks(ranges):
+    for i in range(0, len(ranges), RANGES_PER_QUERY):
+        yield ranges[i:i + RANGES_PER_QUERY]
+
+
+def insert_from(model, queryset, renames=None, **constants):
+    """
+    INSERT the rows of a values()/annotate() queryset into `model`'s table
+    with a single INSERT ... SELECT, so aggregates never round-trip through
+    Python. Output names are model field names unless mapped in `renames`.
+    """
+    renames = renames or {}
+    queryset = queryset.annotate(**{name: Value(value) for name, value in constants.items()})
+    compiler = queryset.query.get_compiler(queryset.db)
+    sql, params = compiler.as_sql()
+    # the compiler decides the SELECT order, so read the aliases back from it
+    names = [renames.get(alias, alias) for _, _, alias in compiler.select]
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(model._meta.get_field(name).column) for name in names)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(model._meta.db_table)} ({columns}) {sql}', params)
+
+
+def _rebuild_hours(ranges):
+    for model in ROLLUP_FIELDS:
+        model.objects.filter(_in_ranges('bucket', ranges), period=HOUR).delete()
+
+    orders = Order.objects.filter(_in_ranges('order_date', ranges)).annotate(
+        bucket=TruncHour('order_date')
+    ).order_by()
+    items = OrderItem.objects.filter(_in_ranges('order__order_date', ranges)).annotate(
+        bucket=TruncHour('order__order_date')
+    ).order_by()
+
+    insert_from(RestaurantRollup, orders.values('bucket', 'restaurant_id').annotate(
+        order_count=Count('order_id'), revenue=Sum('total_amount')
+    ), period=HOUR)
+    insert_from(StatusRollup, orders.values('bucket', 'status').annotate(
+        order_count=Count('order_id'), revenue=Sum('total_amount')
+    ), period=HOUR)
+    insert_from(CourierRollup, orders.filter(delivery_person__isnull=False).values(
+        'bucket', 'delivery_person_id'
+    ).annotate(
+        total_deliveries=Count('order_id'), completed=Count('order_id', filter=Q(status='Delivered'))
+    ), period=HOUR)
+    insert_from(MenuItemRollup, items.values('bucket', 'menu_item_id').annotate(
+        times_ordered=Count('order_item_id'), total_quantity=Sum('quantity')
+    ), period=HOUR)
+
+
+def _rebuild_days(ranges):
+    for model, (dimensions, measures) in ROLLUP_FIELDS.items():
+        model.objects.filter(_in_ranges('bucket', ranges), period=DAY).delete()
+        hours = model.objects.filter(_in_ranges('bucket', ranges), period=HOUR).order_by()
+        # annotations cannot reuse model field names, hence the renames
+        insert_from(model, hours.annotate(day=TruncDay('bucket')).values('day', *dimensions).annotate(
+            **{m + '_sum': Sum(m) for m in measures}
+        ), renames={'day': 'bucket', **{m + '_sum': m for m in measures}}, period=DAY)
+
+
+def _duration_bucket():
+    return Case(
+        *(When(duration_seconds__lte=minutes * 60, then=Value(minutes)) for minutes in DURATION_BOUNDS),
+        default=Value(None), output_field=IntegerField(),
+    )
+
+
+def _rebuild_durations(ranges):
+    events = OrderStatusEvent.objects.filter(
+        _in_ranges('changed_at', ranges), duration_seconds__isnull=False
+    ).annotate(bucket=TruncDay('changed_at'), le=_duration_bucket()).order_by()
+    for model, (owner, statuses) in DURATION_ROLLUPS.items():
+        model.objects.filter(_in_ranges('bucket', ranges)).delete()
+        insert_from(model, events.filter(
+            from_status__in=statuses, **{f'order__{owner}__isnull': False}
+        ).annotate(owner=F(f'order__{owner}')).values('bucket', 'from_status', 'owner', 'le').annotate(
+            order_count=Count('event_id')
+        ), renames={'from_status': 'status', 'owner': owner, 'le': 'le_minutes'})
+
+
+def _commit_lag():
+    return timedelta(seconds=getattr(settings, 'ROLLUP_COMMIT_LAG_SECONDS', 300))
+
+
+def _watermarks(state, now, lag):
+    """The watermarks this refresh ends with: the pending ids, once they are `lag` old."""
+    if state.pending_at is not None and state.pending_at <= now - lag:
+        return state.pending_order_id, state.pending_event_id
+    return state.last_order_id, state.last_event_id
+
+
+def _window(order_watermark, event_watermark):
+    """Count, highest and sum of the order and the event ids above the watermarks."""
+    window = []
+    for model, pk, watermark in ((Order, 'order_id', order_watermark),
+                                 (OrderStatusEvent, 'event_id', event_watermark)):
+        row = model.objects.filter(**{f'{pk}__gt': watermark}).aggregate(n=Count(pk), high=Max(pk), total=Sum(pk))
+        window.append((row['n'], row['high'] or watermark, row['total'] or 0))
+    return window
+
+
+def _digest(window):
+    return '|'.join(':'.join(map(str, part)) for part in window)
+
+
+def refresh_rollups(commit_lag=None):
+    """
+    Fold orders and status events created since the last run, and hours
+    marked dirty, into the rollup tables. Cost is proportional to the rows
+    in the affected hours and days, not to the size of the source tables.
+    A `commit_lag` of zero, for callers that know nothing else is writing,
+    moves the watermarks past every row at once.
+    """
+    lag = _commit_lag() if commit_lag is None else commit_lag
+    state, _ = RollupState.objects.get_or_create(pk=1)
+    if _watermarks(state, timezone.now(), lag) == (state.last_order_id, state.last_event_id) \
+            and _digest(_window(state.last_order_id, state.last_event_id)) == state.window_digest \
+            and not RollupDirtyBucket.objects.exists():
+        return 0
+
+    with transaction.atomic():
+        state = RollupState.objects.select_for_update().get(pk=1)
+        # taken before reading, so everything committed by now is seen below
+        now = timezone.now()
+        order_watermark, event_watermark = _watermarks(state, now, lag)
+        window = _window(order_watermark, event_watermark)
+        if not lag:
+            order_watermark, event_watermark = (high for _, high, _ in window)
+            window = [(0, high, 0) for _, high, _ in window]
+        dirty = list(RollupDirtyBucket.objects.values_list('bucket', 'marked_at'))
+        # rows arrived or committed late above the watermarks, or the
+        # watermarks are about to pass them: read everything above them again
+        rescan = (order_watermark, event_watermark, _digest(window)) != \
+            (state.last_order_id, state.last_event_id, state.window_digest)
+
+        hours = {bucket for bucket, _ in dirty}
+        if rescan:
+            hours.update(hour_bucket(d) for d in Order.objects.filter(
+                order_id__gt=state.last_order_id
+            ).values_list('order_date', flat=True))
+
+        for ranges in _chunks(_merge_ranges(hours, ONE_HOUR)):
+            _rebuild_hours(ranges)
+        days = {day_bucket(h) for h in hours}
+        for ranges in _chunks(_merge_ranges(days, ONE_DAY)):
+            _rebuild_days(ranges)
+
+        event_days = {day_bucket(bucket) for bucket, _ in dirty}
+        if rescan:
+            event_days.update(OrderStatusEvent.objects.filter(
+                event_id__gt=state.last_event_id
+            ).datetimes('changed_at', 'day', tzinfo=dt_timezone.utc))
+        for ranges in _chunks(_merge_ranges([bucket for bucket, _ in dirty], ONE_HOUR)):
+            event_days.update(OrderStatusEvent.objects.filter(
+                _in_ranges('order__order_date', ranges)
+            ).datetimes('changed_at', 'day', tzinfo=dt_timezone.utc))
+        for ranges in _chunks(_merge_ranges(event_days, ONE_DAY)):
+            _rebuild_durations(ranges)
+
+        # anything re-marked while we were running stays queued
+        for bucket, marked_at in dirty:
+            RollupDirtyBucket.objects.filter(bucket=bucket, marked_at__lte=marked_at).delete()
+        if (order_watermark, event_watermark) != (state.last_order_id, state.last_event_id):
+            state.pending_at = None
+        state.last_order_id, state.last_event_id = order_watermark, event_watermark
+        (orders_above, order_high, _), (events_above, event_high, _) = window
+        if state.pending_at is None and (orders_above or events_above):
+            state.pending_order_id, state.pending_event_id, state.pending_at = order_high, event_high, now
+        state.window_digest = _digest(window)
+        state.refreshed_at = now
+        state.save()
+        if hours or event_days:
+            touch_tables(*ROLLUP_TABLES)
+    return len(hours)
+
+
+def reset_rollups():
+    for model in [*ROLLUP_FIELDS, *DURATION_ROLLUPS]:
+        model.objects.all().delete()
+    RollupDirtyBucket.objects.all().delete()
+    RollupState.objects.update_or_create(pk=1, defaults={'last_order_id': 0, 'last_event_id': 0,
+                                                         'pending_order_id': 0, 'pending_event_id': 0,
+                                                         'pending_at': None, 'window_digest': '',
+                                                         'refreshed_at': None})
+    touch_tables(*ROLLUP_TABLES)
+
+
+""" READ SIDE """
+def _day_rows(model, start=None, end=None):
+    rows = model.objects.filter(period=DAY) if model in ROLLUP_FIELDS else model.objects.all()
+    if start:
+        rows = rows.filter(bucket__gte=datetime.combine(start, time.min, dt_timezone.utc))
+    if end:
+        rows = rows.filter(bucket__lt=datetime.combine(end, time.min, dt_timezone.utc) + ONE_DAY)
+    return rows.order_by()
+
+
+def orders_by_status(start=None, end=None):
+    return _day_rows(StatusRollup, start, end).values('status').annotate(
+        count=Sum('order_count'), revenue=Sum('revenue')
+    ).order_by('-count')
+
+
+def restaurant_totals(start=None, end=None, limit=None):
+    rows = _day_rows(RestaurantRollup, start, end).values('restaurant_id').annotate(
+        total_orders=Sum('order_count'), total_revenue=Sum('revenue')
+    ).filter(total_orders__gt=0).order_by('-total_revenue')
+    rows = list(rows[:limit] if limit else rows)
+    restaurants = Restaurant.objects.in_bulk([row['restaurant_id'] for row in rows])
+    result = []
+    for row in rows:
+        restaurant = restaurants.get(row['restaurant_id'])
+        if restaurant is None:
+            continue
+        restaurant.total_orders = row['total_orders']
+        restaurant.total_revenue = row['total_revenue']
+        restaurant.avg_order = row['total_revenue'] / row['total_orders']
+        result.append(restaurant)
+    return result
+
+
+def menu_item_totals(start=None, end=None, limit=None):
+    rows = _day_rows(MenuItemRollup, start, end).values('menu_item_id').annotate(
+        times_ordered=Sum('times_ordered'), total_quantity=Sum('total_quantity')
+    ).filter(times_ordered__gt=0).order_by('-times_ordered')
+    rows = list(rows[:limit] if limit else rows)
+    items = MenuItem.objects.in_bulk([row['menu_item_id'] for row in rows])
+    result = []
+    for row in rows:
+        item = items.get(row['menu_item_id'])
+        if item is None:
+            continue
+        item.times_ordered = row['times_ordered']
+        item.total_quantity = row['total_quantity']
+        result.append(item)
+    return result
+
+
+def courier_totals(start=None, end=None):
+    day_filter = Q(rollups__period=DAY)
+    if start:
+        day_filter &= Q(rollups__bucket__gte=datetime.combine(start, time.min, dt_timezone.utc))
+    if end:
+        day_filter &= Q(rollups__bucket__lt=datetime.combine(end, time.min, dt_timezone.utc) + ONE_DAY)
+    return DeliveryPersonnel.objects.annotate(
+        total_deliveries=Coalesce(Sum('rollups__total_deliveries', filter=day_filter), 0),
+        completed=Coalesce(Sum('rollups__completed', filter=day_filter), 0),
+    ).order_by('-total_deliveries')
+
+
+def _percentiles(histogram, total):
+    """{'p50': minutes, ...} from (le_minutes, count) pairs; None past the last bound."""
+    histogram = sorted(histogram, key=lambda bucket: (bucket[0] is None, bucket[0]))
+    result = {}
+    for pct in PERCENTILES:
+        rank, seen = math.ceil(total * pct / 100), 0
+        for le_minutes, count in histogram:
+            seen += count
+            if seen >= rank:
+                break
+        result[f'p{pct}'] = le_minutes
+    return result
+
+
+def duration_percentiles(model, start=None, end=None, limit=None):
+    """
+    The restaurants or couriers (per `model`) with the most orders through
+    their timed status, busiest first, each with .samples and .percentiles.
+    """
+    owner, statuses = DURATION_ROLLUPS[model]
+    rows = _day_rows(model, start, end).filter(status__in=statuses)
+    top = rows.values(owner).annotate(samples=Sum('order_count')).order_by('-samples', owner)
+    top = list(top[:limit] if limit else top)
+    ids = [row[owner] for row in top]
+
+    histograms = defaultdict(list)
+    for owner_id, le_minutes, count in rows.filter(**{f'{owner}__in': ids}).values_list(
+        owner, 'le_minutes'
+    ).annotate(count=Sum('order_count')):
+        histograms[owner_id].append((le_minutes, count))
+
+    objects = model._meta.get_field(owner.removesuffix('_id')).related_model.objects.in_bulk(ids)
+    result = []
+    for row in top:
+        obj = objects.get(row[owner])
+        if obj is None:
+            continue
+        obj.samples = row['samples']
+        obj.percentiles = _percentiles(histograms[row[owner]], row['samples'])
+        result.append(obj)
+    return result
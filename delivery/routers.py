@@ -0,0 +1,119 @@
+"""
+Read replica routing.
+
+Views wrapped in reads_from_replica send their ORM reads to the database
+alias named by settings.REPLICA_DATABASE, when that alias is configured.
+Everything else, and every write, goes to "default", as do reads made
+inside a transaction on the primary, so select_for_update() and
+read-modify-write code see their own transaction.
+
+A replica lags behind the primary. A client that has just placed or moved
+an order gets a cookie that keeps its reads on the primary for
+REPLICA_STICKY_SECONDS, so it reads its own writes. The menu views stay on
+the primary: they are served from delivery.menu_cache, which would keep a
+menu read from a lagging replica until the next edit.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+STICKY_COOKIE = 'read_primary'
+
+_read_alias = ContextVar('read_alias', default=None)
+_END = object()
+
+
+def replica_alias():
+    """The configured replica alias, or None if reads have nowhere else to go."""
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    if alias != DEFAULT_DB_ALIAS and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the primary's rows
+        return True
+
+
+def is_sticky(request):
+    return STICKY_COOKIE in request.COOKIES
+
+
+def stick_to_primary(response):
+    """Keep the client's reads on the primary until the replica has caught up."""
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+    if seconds and replica_alias():
+        response.set_cookie(STICKY_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    return response
+
+
+@contextmanager
+def replica_reads(request=None):
+    """Send the ORM reads made in the block to the replica, unless `request` is sticky."""
+    alias = None if request is not None and is_sticky(request) else replica_alias()
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def _stream_from_replica(request, chunks):
+    # a streaming body is read after the view has returned
+    chunks = iter(chunks)
+    while True:
+        with replica_reads(request):
+            chunk = next(chunks, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+async def _astream_from_replica(request, chunks):
+    chunks = aiter(chunks)
+    while True:
+        with replica_reads(request):
+            chunk = await anext(chunks, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+def reads_from_replica(view):
+    """Run `view`, and the body of a streaming response it returns, under replica_reads()."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            with replica_reads(request):
+                response = await view(request, *args, **kwargs)
+            if response.streaming and response.is_async:
+                response.streaming_content = _astream_from_replica(request, response.streaming_content)
+            return response
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            with replica_reads(request):
+                response = view(request, *args, **kwargs)
+            if response.streaming and not response.is_async:
+                response.streaming_content = _stream_from_replica(request, response.streaming_content)
+            return response
+    return wrapped
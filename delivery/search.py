@@ -0,0 +1,169 @@
+"""
+Full-text search over menu items.
+
+Every MenuItem has a MenuSearchEntry row with its searchable text: the
+dish name (title), its description (body), and its category with the
+restaurant's name and cuisine (tags). delivery.signals rewrites an entry
+when that text changes; rebuild_search_index() recreates them in bulk
+after raw loads such as populate_data.
+
+The entries are indexed by the database's own full-text engine, set up by
+migration 0008: an FTS5 table on SQLite, FULLTEXT indexes on MySQL. Each
+query has to match every term, the last one as a prefix since it may be
+a word still being typed. Dishes whose name holds every term rank first,
+then the ones found through the tags or description. Other backends fall
+back to icontains filters with the same tiers, which scan the table.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+
+from .fields import label_sql
+from .models import Restaurant, MenuItem, MenuSearchEntry
+from .rollups import insert_from
+
+
+MAX_TERMS = 6
+FTS_TABLE = 'menu_search_fts'
+FULLTEXT_VENDORS = ('sqlite', 'mysql')
+# result tiers, best first: every term in the dish name, then anywhere
+TIERS = ('title', 'any')
+
+RESULT_FIELDS = ('item_id', 'name', 'description', 'price', 'category', 'is_available',
+                 'restaurant_id', 'restaurant__name', 'restaurant__cuisine_type')
+
+_WORD = re.compile(r'\w+')
+
+
+def query_terms(text):
+    """The distinct lower-cased words of a search string, at most MAX_TERMS."""
+    return list(dict.fromkeys(_WORD.findall(text.lower())))[:MAX_TERMS]
+
+
+def rebuild_search_index(item_ids=None):
+    """Rewrite the search entries of `item_ids` (default: every menu item) in two statements."""
+    items = MenuItem.objects.order_by()
+    entries = MenuSearchEntry.objects.all()
+    if item_ids is not None:
+        items = items.filter(pk__in=item_ids)
+        entries = entries.filter(pk__in=item_ids)
+    with transaction.atomic():
+        entries.delete()
+        insert_from(MenuSearchEntry, items.values('item_id').annotate(
+            title=F('name'),
+            body=F('description'),
+            tags=Concat(label_sql('category', MenuItem._meta.get_field('category')), Value(' '),
+                        'restaurant__name', Value(' '),
+                        label_sql('restaurant__cuisine_type', Restaurant._meta.get_field('cuisine_type'))),
+        ), renames={'item_id': 'menu_item'})
+
+
+def _filters(available, min_price, max_price):
+    clauses, params = [], []
+    if available is not None:
+        clauses.append('m.is_available = %s')
+        params.append(available)
+    if min_price is not None:
+        clauses.append('m.price >= %s')
+        params.append(min_price)
+    if max_price is not None:
+        clauses.append('m.price <= %s')
+        params.append(max_price)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def _tier_sql(tier, terms, filters):
+    """
+    (id column, SELECT of that column, params) for the items in `tier` that
+    pass `filters`. Ordering by the id column walks the full-text index in
+    order, so a LIMIT stops the scan early.
+    """
+    qn = connection.ops.quote_name
+    where, params = filters
+    if connection.vendor == 'sqlite':
+        every = ' AND '.join([*(f'"{term}"' for term in terms[:-1]), f'"{terms[-1]}"*'])
+        match = f'{{title}} : ({every})' if tier == 'title' else f'({every}) NOT {{title}} : ({every})'
+        column = f'{FTS_TABLE}.rowid'
+        sql = (f'SELECT {column} FROM {FTS_TABLE} JOIN {qn("menu_item")} m ON m.item_id = {column} '
+               f'WHERE {FTS_TABLE} MATCH %s{where}')
+        return column, sql, [match, *params]
+
+    every = ' '.join([*(f'+{term}' for term in terms[:-1]), f'+{terms[-1]}*'])
+    title = 'MATCH(s.title) AGAINST (%s IN BOOLEAN MODE)'
+    match = title if tier == 'title' else f'MATCH(s.title, s.body, s.tags) AGAINST (%s IN BOOLEAN MODE) AND NOT {title}'
+    column = 's.menu_item_id'
+    sql = (f'SELECT {column} FROM {qn("menu_search")} s JOIN {qn("menu_item")} m ON m.item_id = {column} '
+           f'WHERE {match}{where}')
+    return column, sql, [every] * match.count('%s') + params
+
+
+def _fallback_tier(tier, terms, available, min_price, max_price):
+    in_title = Q()
+    anywhere = Q()
+    for term in terms:
+        in_title &= Q(search_entry__title__icontains=term)
+        anywhere &= (Q(search_entry__title__icontains=term) | Q(search_entry__body__icontains=term)
+                     | Q(search_entry__tags__icontains=term))
+    items = MenuItem.objects.filter(in_title) if tier == 'title' else MenuItem.objects.filter(anywhere).exclude(in_title)
+    if available is not None:
+        items = items.filter(is_available=available)
+    if min_price is not None:
+        items = items.filter(price__gte=min_price)
+    if max_price is not None:
+        items = items.filter(price__lte=max_price)
+    return items.order_by('item_id').values_list('item_id', flat=True)
+
+
+def _tier_ids(tier, terms, available, min_price, max_price, limit, offset):
+    if connection.vendor not in FULLTEXT_VENDORS:
+        return list(_fallback_tier(tier, terms, available, min_price, max_price)[offset:offset + limit])
+    column, sql, params = _tier_sql(tier, terms, _filters(available, min_price, max_price))
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} ORDER BY {column} LIMIT %s OFFSET %s', [*params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _tier_size(tier, terms, available, min_price, max_price, cap):
+    """How many ids `tier` holds, counting no further than `cap`."""
+    if connection.vendor not in FULLTEXT_VENDORS:
+        return _fallback_tier(tier, terms, available, min_price, max_price)[:cap].count()
+    _, sql, params = _tier_sql(tier, terms, _filters(available, min_price, max_price))
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM ({sql} LIMIT %s) capped', [*params, cap])
+        return cursor.fetchone()[0]
+
+
+def _ranked_ids(terms, available, min_price, max_price, limit, offset):
+    """
+    Items whose name holds every term come first, then the ones that match
+    through the tags or description, each tier in item_id order. Both tiers
+    are read in index order and stop at the LIMIT, so a page costs about
+    the same whether a term matches a hundred items or a hundred thousand.
+    """
+    ids = []
+    for tier in TIERS:
+        found = _tier_ids(tier, terms, available, min_price, max_price, limit - len(ids), offset)
+        ids += found
+        if len(ids) == limit:
+            break
+        if found:
+            offset = 0
+        elif offset:
+            # the page starts in a later tier: skip what this one held
+            offset -= _tier_size(tier, terms, available, min_price, max_price, offset)
+    return ids
+
+
+def search_menu(terms, available=True, min_price=None, max_price=None, page=1, per_page=20):
+    """
+    One page of menu items matching every term in `terms`, best first, as
+    RESULT_FIELDS dicts. Returns (rows, has_next). `available=None`
+    includes items whether or not they are available.
+    """
+    ids = _ranked_ids(terms, available, min_price, max_price, per_page + 1, (page - 1) * per_page)
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    rows = {row['item_id']: row for row in MenuItem.objects.filter(pk__in=ids).values(*RESULT_FIELDS).order_by()}
+    return [rows[item_id] for item_id in ids if item_id in rows], has_next
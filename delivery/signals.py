@@ -0,0 +1,330 @@
+from decimal import Decimal
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Customer, Restaurant, MenuItem, Order, OrderItem, OrderStatusEvent, DeliveryPersonnel
+from .rollups import mark_dirty
+from .menu_cache import invalidate_menus
+from .versions import touch_tables
+from .stats import (
+    apply_stats_deltas, is_active, counts_toward_totals, apply_customer_deltas, apply_restaurant_deltas,
+)
+from .dispatch import release_couriers
+from .pubsub import hub
+from .search import rebuild_search_index
+from .transitions import status_event
+from .metrics import record_query
+
+
+COUNTER_FIELDS = {
+    Customer: 'total_customers',
+    Restaurant: 'total_restaurants',
+    MenuItem: 'total_menu_items',
+}
+
+
+# the fields copied into MenuSearchEntry (see delivery.search)
+MENU_ITEM_SEARCH_FIELDS = ('name', 'description', 'category', 'restaurant_id')
+RESTAURANT_SEARCH_FIELDS = ('name', 'cuisine_type')
+
+
+def search_text(instance, fields):
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+""" INSTRUMENTATION """
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # a no-op outside requests handled by delivery.middleware
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+""" ORDER STATE TRACKING """
+TRACKED_ORDER_FIELDS = {'status': '_loaded_status', 'customer_id': '_loaded_customer_id',
+                        'restaurant_id': '_loaded_restaurant_id', 'total_amount': '_loaded_total',
+                        'status_changed_at': '_loaded_status_changed_at'}
+
+
+@receiver(post_init, sender=Order)
+def remember_loaded_state(sender, instance, **kwargs):
+    # read __dict__ directly so deferred fields are not fetched per row
+    for field, attr in TRACKED_ORDER_FIELDS.items():
+        setattr(instance, attr, instance.__dict__.get(field))
+
+
+@receiver(pre_save, sender=Order)
+def fetch_unknown_state(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if all(getattr(instance, attr) is not None for attr in TRACKED_ORDER_FIELDS.values()):
+        return
+    row = Order.objects.filter(pk=instance.pk).values(*TRACKED_ORDER_FIELDS).first() or {}
+    for field, attr in TRACKED_ORDER_FIELDS.items():
+        setattr(instance, attr, row.get(field))
+
+
+@receiver(pre_save, sender=Order)
+def stamp_status_change(sender, instance, raw, **kwargs):
+    if not raw and not instance._state.adding and instance.status != instance._loaded_status:
+        instance.status_changed_at = timezone.now()
+
+
+@receiver(post_init, sender=MenuItem)
+def remember_loaded_restaurant(sender, instance, **kwargs):
+    instance._loaded_restaurant_id = instance.__dict__.get('restaurant_id')
+    instance._loaded_search_text = search_text(instance, MENU_ITEM_SEARCH_FIELDS)
+
+
+@receiver(post_init, sender=Restaurant)
+def remember_loaded_search_text(sender, instance, **kwargs):
+    instance._loaded_search_text = search_text(instance, RESTAURANT_SEARCH_FIELDS)
+
+
+""" DASHBOARD COUNTERS """
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=MenuItem)
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        apply_stats_deltas(**{COUNTER_FIELDS[sender]: 1})
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=MenuItem)
+def count_deleted(sender, instance, **kwargs):
+    apply_stats_deltas(**{COUNTER_FIELDS[sender]: -1})
+
+
+@receiver(post_save, sender=Order)
+def count_order_saved(sender, instance, created, **kwargs):
+    if created:
+        apply_stats_deltas(total_orders=1, active_orders=int(is_active(instance.status)))
+    elif instance._loaded_status is not None:
+        was_active, now_active = is_active(instance._loaded_status), is_active(instance.status)
+        apply_stats_deltas(active_orders=int(now_active) - int(was_active))
+
+
+@receiver(post_delete, sender=Order)
+def count_order_deleted(sender, instance, **kwargs):
+    status = instance._loaded_status or instance.status
+    apply_stats_deltas(total_orders=-1, active_orders=-int(is_active(status)))
+
+
+""" ANALYTICS ROLLUPS """
+# new orders, even ones that commit after a higher id, are picked up through
+# the lagging rollup watermark; only changes to orders that may already be
+# rolled up need their hour recomputed
+@receiver(post_save, sender=Order)
+def mark_order_hour_dirty(sender, instance, created, **kwargs):
+    if not created:
+        mark_dirty(instance.order_date)
+
+
+@receiver(post_delete, sender=Order)
+def mark_deleted_order_hour_dirty(sender, instance, **kwargs):
+    mark_dirty(instance.order_date)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def mark_order_item_hour_dirty(sender, instance, **kwargs):
+    order = instance._state.fields_cache.get('order')
+    if order is not None:
+        order_date = order.order_date
+    else:
+        order_date = Order.objects.filter(pk=instance.order_id).values_list('order_date', flat=True).first()
+    mark_dirty(order_date)
+
+
+@receiver(post_delete, sender=OrderStatusEvent)
+def mark_deleted_event_hour_dirty(sender, instance, **kwargs):
+    # the duration histograms of the day the event was counted in
+    mark_dirty(instance.changed_at)
+
+
+""" MENU CACHE """
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_menu(sender, instance, **kwargs):
+    invalidate_menus(instance.pk)
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_item_menu(sender, instance, **kwargs):
+    # an item moved to another restaurant changes both menus
+    invalidate_menus(instance.restaurant_id, instance._loaded_restaurant_id)
+
+
+""" DATA VERSIONS """
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=DeliveryPersonnel)
+@receiver(post_delete, sender=DeliveryPersonnel)
+def touch_table(sender, instance, **kwargs):
+    touch_tables(sender._meta.db_table)
+
+
+""" COURIERS """
+@receiver(post_save, sender=Order)
+def release_courier_on_close(sender, instance, created, **kwargs):
+    if instance._loaded_status is not None and is_active(instance._loaded_status) \
+            and not is_active(instance.status):
+        release_couriers(instance.delivery_person_id)
+
+
+@receiver(post_delete, sender=Order)
+def release_courier_on_delete(sender, instance, **kwargs):
+    release_couriers(instance.delivery_person_id)
+
+
+""" CUSTOMER AND RESTAURANT TOTALS """
+def order_share(owner_id, status, total):
+    """What one order adds to its owner's totals: (owner, orders, money)."""
+    if not counts_toward_totals(status):
+        return owner_id, 0, Decimal('0')
+    return owner_id, 1, Decimal(str(total))
+
+
+def order_share_change(instance, created, owner_field):
+    """(old share, new share) of a saved order, or None if its share did not change."""
+    new = order_share(getattr(instance, owner_field), instance.status, instance.total_amount)
+    if created:
+        old = (new[0], 0, Decimal('0'))
+    elif instance._loaded_status is None:
+        return None
+    else:
+        old = order_share(getattr(instance, TRACKED_ORDER_FIELDS[owner_field]),
+                          instance._loaded_status, instance._loaded_total)
+    return None if old == new else (old, new)
+
+
+def deleted_order_share(instance, owner_field):
+    # the row that was deleted held the loaded values, not unsaved edits
+    owner = getattr(instance, TRACKED_ORDER_FIELDS[owner_field]) or getattr(instance, owner_field)
+    total = instance._loaded_total if instance._loaded_total is not None else instance.total_amount
+    return order_share(owner, instance._loaded_status or instance.status, total)
+
+
+@receiver(post_save, sender=Order)
+def update_customer_stats(sender, instance, created, **kwargs):
+    change = order_share_change(instance, created, 'customer_id')
+    if change is None:
+        return
+    old, new = change
+    same_customer = old[0] == new[0]
+    # the order newly counts for new[0], so it may be their latest
+    order_date = instance.order_date if new[1] and not (same_customer and old[1]) else None
+    # a cancelled or moved order may have been the old customer's latest
+    recount_last = bool(old[1]) and not (same_customer and new[1])
+    if same_customer:
+        apply_customer_deltas(new[0], new[1] - old[1], new[2] - old[2], order_date, recount_last)
+    else:
+        apply_customer_deltas(old[0], -old[1], -old[2], recount_last=recount_last)
+        apply_customer_deltas(new[0], new[1], new[2], order_date)
+
+
+@receiver(post_delete, sender=Order)
+def update_customer_stats_on_delete(sender, instance, **kwargs):
+    customer_id, orders, spent = deleted_order_share(instance, 'customer_id')
+    if orders:
+        apply_customer_deltas(customer_id, -orders, -spent, recount_last=True)
+
+
+@receiver(post_save, sender=Order)
+def update_restaurant_stats(sender, instance, created, **kwargs):
+    change = order_share_change(instance, created, 'restaurant_id')
+    if change is None:
+        return
+    old, new = change
+    if old[0] == new[0]:
+        apply_restaurant_deltas(new[0], new[1] - old[1], new[2] - old[2])
+    else:
+        apply_restaurant_deltas(old[0], -old[1], -old[2])
+        apply_restaurant_deltas(new[0], new[1], new[2])
+
+
+@receiver(post_delete, sender=Order)
+def update_restaurant_stats_on_delete(sender, instance, **kwargs):
+    restaurant_id, orders, revenue = deleted_order_share(instance, 'restaurant_id')
+    if orders:
+        apply_restaurant_deltas(restaurant_id, -orders, -revenue)
+
+
+@receiver(post_save, sender=MenuItem)
+def update_menu_size(sender, instance, created, **kwargs):
+    if created:
+        apply_restaurant_deltas(instance.restaurant_id, menu_items=1)
+    elif instance._loaded_restaurant_id not in (None, instance.restaurant_id):
+        apply_restaurant_deltas(instance._loaded_restaurant_id, menu_items=-1)
+        apply_restaurant_deltas(instance.restaurant_id, menu_items=1)
+
+
+@receiver(post_delete, sender=MenuItem)
+def update_menu_size_on_delete(sender, instance, **kwargs):
+    apply_restaurant_deltas(instance._loaded_restaurant_id or instance.restaurant_id, menu_items=-1)
+
+
+""" SEARCH INDEX """
+@receiver(post_save, sender=MenuItem)
+def index_menu_item(sender, instance, created, **kwargs):
+    if created or instance._loaded_search_text != search_text(instance, MENU_ITEM_SEARCH_FIELDS):
+        rebuild_search_index([instance.pk])
+
+
+@receiver(post_save, sender=Restaurant)
+def reindex_restaurant_menu(sender, instance, created, **kwargs):
+    # a new restaurant has no menu yet; entries of deleted items cascade away
+    if not created and instance._loaded_search_text != search_text(instance, RESTAURANT_SEARCH_FIELDS):
+        rebuild_search_index(MenuItem.objects.filter(restaurant_id=instance.pk).values('pk'))
+    instance._loaded_search_text = search_text(instance, RESTAURANT_SEARCH_FIELDS)
+
+
+""" STATUS HISTORY """
+@receiver(post_save, sender=Order)
+def record_status_event(sender, instance, created, **kwargs):
+    # Order.save() runs in a transaction, so the event commits with the change
+    if created:
+        event = status_event(instance.pk, None, instance.status, None, instance.status_changed_at)
+    elif instance._loaded_status is not None and instance._loaded_status != instance.status:
+        event = status_event(instance.pk, instance._loaded_status, instance.status,
+                             instance._loaded_status_changed_at, instance.status_changed_at)
+    else:
+        return
+    event.save()
+
+
+""" LIVE STATUS """
+@receiver(post_save, sender=Order)
+def publish_status_change(sender, instance, created, **kwargs):
+    if not created and instance._loaded_status == instance.status:
+        return
+    order_id, payload = instance.pk, {'order_id': instance.pk, 'status': instance.status}
+    transaction.on_commit(lambda: hub.publish(order_id, payload))
+
+
+# registered last: the receivers above compare against the state as loaded
+@receiver(post_save, sender=Order)
+def remember_saved_state(sender, instance, **kwargs):
+    for field, attr in TRACKED_ORDER_FIELDS.items():
+        setattr(instance, attr, getattr(instance, field))
+
+
+@receiver(post_save, sender=MenuItem)
+def remember_saved_restaurant(sender, instance, **kwargs):
+    instance._loaded_restaurant_id = instance.restaurant_id
+    instance._loaded_search_text = search_text(instance, MENU_ITEM_SEARCH_FIELDS)
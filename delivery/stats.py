@@ -0,0 +1,166 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Customer, Restaurant, MenuItem, Order, DashboardStats
+
+
+INACTIVE_STATUSES = ('Delivered', 'Cancelled')
+STATS_ID = 1
+
+
+def is_active(status):
+    return status not in INACTIVE_STATUSES
+
+
+def compute_dashboard_stats():
+    return {
+        'total_customers': Customer.objects.count(),
+        'total_restaurants': Restaurant.objects.count(),
+        'total_orders': Order.objects.count(),
+        'total_menu_items': MenuItem.objects.count(),
+        'active_orders': Order.objects.exclude(status__in=INACTIVE_STATUSES).count(),
+    }
+
+
+def rebuild_dashboard_stats():
+    with transaction.atomic():
+        stats, _ = DashboardStats.objects.update_or_create(
+            pk=STATS_ID, defaults=compute_dashboard_stats()
+        )
+    return stats
+
+
+def get_dashboard_stats():
+    try:
+        return DashboardStats.objects.get(pk=STATS_ID)
+    except DashboardStats.DoesNotExist:
+        return rebuild_dashboard_stats()
+
+
+def apply_stats_deltas(**deltas):
+    """Add `deltas` (counter name -> change) to the stats row in one UPDATE."""
+    changes = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if not changes:
+        return
+    if not DashboardStats.objects.filter(pk=STATS_ID).update(**changes):
+        # first write ever: counting from scratch already includes this change
+        rebuild_dashboard_stats()
+
+
+""" PER-ROW TOTALS """
+# Customer and Restaurant carry totals over every order that was not
+# cancelled, kept current by delivery.signals
+UNCOUNTED_STATUS = 'Cancelled'
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def counts_toward_totals(status):
+    return status != UNCOUNTED_STATUS
+
+
+def _counted_orders(owner):
+    return Order.objects.filter(**{owner: OuterRef('pk')}).exclude(status=UNCOUNTED_STATUS).order_by().values(owner)
+
+
+def _count(queryset):
+    return Coalesce(Subquery(queryset.annotate(n=Count('*')).values('n')), 0)
+
+
+def _revenue(orders):
+    return Coalesce(Subquery(orders.annotate(total=Sum('total_amount')).values('total'), output_field=MONEY),
+                    Value(Decimal('0.00')), output_field=MONEY)
+
+
+def _increments(**deltas):
+    return {name: F(name) + delta for name, delta in deltas.items() if delta}
+
+
+def _drift(model, expressions, chunk_size):
+    fields = list(expressions)
+    rows = model.objects.order_by('pk').values('pk', *fields).annotate(
+        **{f'actual_{name}': expression for name, expression in expressions.items()}
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        stored = {name: row[name] for name in fields}
+        actual = {name: row[f'actual_{name}'] for name in fields}
+        if stored != actual:
+            yield row['pk'], stored, actual
+
+
+def _rebuild(model, expressions, pks):
+    rows = model.objects.all()
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+    return rows.update(**expressions)
+
+
+""" CUSTOMER STATS """
+def _last_order_date():
+    return Subquery(_counted_orders('customer').annotate(latest=Max('order_date')).values('latest'))
+
+
+def customer_stats_expressions():
+    """Customer field -> expression recomputing it from the orders table."""
+    orders = _counted_orders('customer')
+    return {
+        'order_count': _count(orders),
+        'total_spent': _revenue(orders),
+        'last_order_date': _last_order_date(),
+    }
+
+
+def apply_customer_deltas(customer_id, orders=0, spent=0, order_date=None, recount_last=False):
+    """
+    Adjust one customer's totals in a single UPDATE. `order_date` moves
+    last_order_date forward; `recount_last` re-reads it from the orders
+    table, for when the latest counted order may have gone away.
+    """
+    changes = _increments(order_count=orders, total_spent=spent)
+    if recount_last:
+        changes['last_order_date'] = _last_order_date()
+    elif order_date is not None:
+        # GREATEST is NULL on MySQL and SQLite while last_order_date still is
+        changes['last_order_date'] = Coalesce(Greatest('last_order_date', Value(order_date)), Value(order_date))
+    if changes:
+        Customer.objects.filter(pk=customer_id).update(**changes)
+
+
+def rebuild_customer_stats(customer_ids=None):
+    """Recompute the totals of `customer_ids` (default: everyone) from their orders."""
+    return _rebuild(Customer, customer_stats_expressions(), customer_ids)
+
+
+def customer_stats_drift(chunk_size=2000):
+    """Yield (customer_id, stored, actual) for every customer whose totals are off."""
+    return _drift(Customer, customer_stats_expressions(), chunk_size)
+
+
+""" RESTAURANT STATS """
+def restaurant_stats_expressions():
+    """Restaurant field -> expression recomputing it from orders and menu items."""
+    orders = _counted_orders('restaurant')
+    return {
+        'order_count': _count(orders),
+        'revenue': _revenue(orders),
+        'menu_size': _count(MenuItem.objects.filter(restaurant=OuterRef('pk')).order_by().values('restaurant')),
+    }
+
+
+def apply_restaurant_deltas(restaurant_id, orders=0, revenue=0, menu_items=0):
+    """Adjust one restaurant's totals in a single UPDATE."""
+    changes = _increments(order_count=orders, revenue=revenue, menu_size=menu_items)
+    if changes:
+        Restaurant.objects.filter(pk=restaurant_id).update(**changes)
+
+
+def rebuild_restaurant_stats(restaurant_ids=None):
+    """Recompute the totals of `restaurant_ids` (default: every restaurant)."""
+    return _rebuild(Restaurant, restaurant_stats_expressions(), restaurant_ids)
+
+
+def restaurant_stats_drift(chunk_size=2000):
+    """Yield (restaurant_id, stored, actual) for every restaurant whose totals are off."""
+    return _drift(Restaurant, restaurant_stats_expressions(), chunk_size)
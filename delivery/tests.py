@@ -1,3 +1,1796 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gc
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import Permission, User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db.models import Count, Max, Sum, Q
+from django.db import connection, router, transaction
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .models import (
+    Customer, Restaurant, MenuItem, DeliveryPersonnel, Order, OrderItem, OrderStatusEvent, RollupDirtyBucket,
+    RollupState, RestaurantDurationRollup, CourierDurationRollup,
+)
+from .pagination import keyset_paginate, EstimatedCountPaginator
+from .stats import compute_dashboard_stats, get_dashboard_stats, customer_stats_drift, restaurant_stats_drift
+from . import menu_cache, metrics, orders, reports, rollups, routers, throttle, versions, views
+from .coalesce import COALESCED
+from .middleware import record_request
+from .menu_cache import menu_cache_stats
+from .search import search_menu
+from .export import day_range, export_chunks
+from .transitions import TransitionError, transition_orders
+from .dispatch import assign_courier, dispatch_pending
+from .pubsub import hub
+from .management.commands import bench_views
+
+
+def make_customer(n=1):
+    return Customer.objects.create(
+        name=f'Customer {n}', email=f'customer{n}@example.com',
+        phone='9800000000', address='Thamel, Kathmandu'
+    )
+
+
+def make_restaurant(n=1, **kwargs):
+    fields = {'name': f'Restaurant {n}', 'address': 'Lazimpat', 'phone': '014000000',
+              'rating': Decimal('4.0'), 'cuisine_type': 'Indian'}
+    fields.update(kwargs)
+    return Restaurant.objects.create(**fields)
+
+
+def make_order(customer, restaurant, **kwargs):
+    fields = {'total_amount': Decimal('100.00'), 'delivery_address': customer.address}
+    fields.update(kwargs)
+    return Order.objects.create(customer=customer, restaurant=restaurant, **fields)
+
+
+def make_staff(*codenames, username='staff'):
+    user = User.objects.create_user(username, f'{username}@example.com', 'pw', is_staff=True)
+    user.user_permissions.set(Permission.objects.filter(content_type__app_label='delivery', codename__in=codenames))
+    return user
+
+
+async def read_stream(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+class CustomerStatsTests(TestCase):
+
+    def assertNoDrift(self):
+        self.assertEqual(list(customer_stats_drift()), [])
+
+    def test_totals_track_random_changes(self):
+        rng = random.Random(7)
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        customers = [make_customer(i) for i in range(4)]
+        restaurant = make_restaurant()
+        for step in range(150):
+            orders = list(Order.objects.all())
+            action = rng.choice(['order', 'order', 'status', 'status', 'total', 'move', 'delete'])
+            if action == 'order' or not orders:
+                make_order(rng.choice(customers), restaurant, status=rng.choice(statuses),
+                           total_amount=Decimal(rng.randint(100, 900)))
+                continue
+            order = rng.choice(orders)
+            if action == 'delete':
+                order.delete()
+                continue
+            if action == 'status':
+                order.status = rng.choice(statuses)
+            elif action == 'total':
+                order.total_amount = Decimal(rng.randint(100, 900))
+            else:
+                order.customer = rng.choice(customers)
+            order.save()
+            if step % 25 == 0:
+                self.assertNoDrift()
+        self.assertNoDrift()
+
+    def test_cancelling_the_latest_order_rewinds_last_order_date(self):
+        customer = make_customer()
+        restaurant = make_restaurant()
+        first = make_order(customer, restaurant, total_amount=Decimal('100.00'))
+        latest = make_order(customer, restaurant, total_amount=Decimal('40.00'))
+        customer.refresh_from_db()
+        self.assertEqual((customer.order_count, customer.total_spent), (2, Decimal('140.00')))
+        self.assertEqual(customer.last_order_date, latest.order_date)
+
+        latest.status = 'Cancelled'
+        latest.save()
+        customer.refresh_from_db()
+        self.assertEqual((customer.order_count, customer.total_spent), (1, Decimal('100.00')))
+        self.assertEqual(customer.last_order_date, first.order_date)
+
+        first.delete()
+        customer.refresh_from_db()
+        self.assertEqual((customer.order_count, customer.total_spent, customer.last_order_date),
+                         (0, Decimal('0.00'), None))
+
+    def test_status_changes_that_keep_the_totals_cost_no_update(self):
+        order = make_order(make_customer(), make_restaurant())
+        order.status = 'Preparing'
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertFalse(any('UPDATE "customer"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_reconcile_command_reports_then_fixes_drift(self):
+        make_order(make_customer(), make_restaurant())
+        Customer.objects.update(order_count=5)  # bypasses signals
+        out = StringIO()
+        call_command('reconcile_stats', '--only', 'customer', '--check', stdout=out)
+        self.assertIn('order_count 5 -> 1', out.getvalue())
+        self.assertEqual(len(list(customer_stats_drift())), 1)
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertNoDrift()
+
+    def test_customer_list_is_ranked_searchable_and_flat_in_orders(self):
+        restaurant = make_restaurant()
+        customers = [make_customer(i) for i in range(3)]
+        for i, customer in enumerate(customers):
+            make_order(customer, restaurant, total_amount=Decimal(100 * (i + 1)))
+        url = reverse('delivery:customer_list')
+        response = self.client.get(url)
+        self.assertEqual([c.pk for c in response.context['customers']], [c.pk for c in reversed(customers)])
+
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for _ in range(20):
+            make_order(customers[0], restaurant)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        self.assertFalse(any('order_table' in q['sql'] for q in after.captured_queries))
+
+        response = self.client.get(url, {'q': 'customer1@'})
+        self.assertEqual([c.pk for c in response.context['customers']], [customers[1].pk])
+
+
+class RestaurantStatsTests(TestCase):
+
+    def assertNoDrift(self):
+        self.assertEqual(list(restaurant_stats_drift()), [])
+
+    def test_totals_track_random_changes(self):
+        rng = random.Random(11)
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        customer = make_customer()
+        restaurants = [make_restaurant(i) for i in range(3)]
+        for step in range(150):
+            orders = list(Order.objects.all())
+            items = list(MenuItem.objects.all())
+            action = rng.choice(['order', 'status', 'total', 'move', 'delete', 'item', 'move_item', 'delete_item'])
+            if action == 'item' or (action in ('move_item', 'delete_item') and not items):
+                MenuItem.objects.create(restaurant=rng.choice(restaurants), name=f'Dish {step}',
+                                        price=Decimal('90.00'), category='Snack')
+            elif action == 'move_item':
+                item = rng.choice(items)
+                item.restaurant = rng.choice(restaurants)
+                item.save()
+            elif action == 'delete_item':
+                rng.choice(items).delete()
+            elif action == 'order' or not orders:
+                make_order(customer, rng.choice(restaurants), status=rng.choice(statuses),
+                           total_amount=Decimal(rng.randint(100, 900)))
+            elif action == 'delete':
+                rng.choice(orders).delete()
+            else:
+                order = rng.choice(orders)
+                if action == 'status':
+                    order.status = rng.choice(statuses)
+                elif action == 'total':
+                    order.total_amount = Decimal(rng.randint(100, 900))
+                else:
+                    order.restaurant = rng.choice(restaurants)
+                order.save()
+            if step % 25 == 0:
+                self.assertNoDrift()
+        self.assertNoDrift()
+
+    def test_reconcile_command_fixes_restaurants(self):
+        restaurant = make_restaurant()
+        MenuItem.objects.create(restaurant=restaurant, name='Momo', price=Decimal('150.00'), category='Snack')
+        Restaurant.objects.update(menu_size=0, revenue=Decimal('1.00'))  # bypasses signals
+        out = StringIO()
+        call_command('reconcile_stats', '--only', 'restaurant', stdout=out)
+        self.assertIn('menu_size 0 -> 1', out.getvalue())
+        self.assertNoDrift()
+
+    def test_restaurant_list_filters_and_costs_one_page(self):
+        customer = make_customer()
+        for i, (cuisine, rating) in enumerate([('Indian', '4.60'), ('Indian', '3.20'), ('Chinese', '4.10')]):
+            restaurant = make_restaurant(i, cuisine_type=cuisine, rating=Decimal(rating))
+            make_order(customer, restaurant)
+        url = reverse('delivery:restaurant_list')
+
+        response = self.client.get(url, {'cuisine': 'Indian', 'min_rating': '4.0'})
+        self.assertEqual([r.cuisine_type for r in response.context['restaurants']], ['Indian'])
+        self.assertEqual(response.context['restaurants'][0].order_count, 1)
+        response = self.client.get(url, {'cuisine': 'Klingon', 'min_rating': 'lots'})
+        self.assertEqual([r.rating for r in response.context['restaurants']],
+                         [Decimal('4.60'), Decimal('4.10'), Decimal('3.20')])
+
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        restaurant = Restaurant.objects.first()
+        for i in range(20):
+            make_order(customer, restaurant)
+            MenuItem.objects.create(restaurant=restaurant, name=f'Dish {i}', price=Decimal('90.00'), category='Snack')
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        self.assertFalse(any('order_table' in q['sql'] or 'menu_item' in q['sql'] for q in after.captured_queries))
+
+
+class OrderListPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = make_customer()
+        restaurant = make_restaurant()
+        cls.orders = [make_order(customer, restaurant, status='Delivered' if i % 2 else 'Pending')
+                      for i in range(7)]
+        # two orders share a timestamp so the order_id tiebreak matters
+        now = timezone.now()
+        for i, order in enumerate(cls.orders):
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(minutes=i // 2))
+        cls.expected = list(Order.objects.order_by('-order_date', '-order_id').values_list('order_id', flat=True))
+
+    def walk(self, queryset, per_page):
+        seen, page = [], keyset_paginate(queryset, per_page=per_page)
+        while True:
+            seen.extend(o.order_id for o in page)
+            if not page.has_next:
+                return seen, page
+            page = keyset_paginate(queryset, after=page.next_cursor, per_page=per_page)
+
+    def test_forward_walk_visits_every_order_once(self):
+        seen, _ = self.walk(Order.objects.all(), per_page=3)
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_walk_returns_same_pages(self):
+        queryset = Order.objects.all()
+        first = keyset_paginate(queryset, per_page=3)
+        second = keyset_paginate(queryset, after=first.next_cursor, per_page=3)
+        back = keyset_paginate(queryset, before=second.previous_cursor, per_page=3)
+        self.assertEqual([o.order_id for o in back], [o.order_id for o in first])
+        self.assertFalse(back.has_previous)
+        self.assertTrue(back.has_next)
+
+    def test_status_filter_is_part_of_seek(self):
+        queryset = Order.objects.filter(status='Delivered')
+        seen, _ = self.walk(queryset, per_page=2)
+        expected = list(queryset.order_by('-order_date', '-order_id').values_list('order_id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_is_a_single_query(self):
+        first = keyset_paginate(Order.objects.all(), per_page=3)
+        with self.assertNumQueries(1):
+            keyset_paginate(Order.objects.all(), after=first.next_cursor, per_page=3)
+
+    def test_view_rejects_bad_cursor(self):
+        response = self.client.get(reverse('delivery:order_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_renders_page(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('delivery:order_list'), {'status': 'Pending'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['orders']), 4)
+
+    def test_view_ignores_unknown_status(self):
+        response = self.client.get(reverse('delivery:order_list'), {'status': 'Bogus'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['status_filter'], '')
+        unfiltered = self.client.get(reverse('delivery:order_list')).context['orders']
+        self.assertEqual(list(response.context['orders']), list(unfiltered))
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_order(make_customer(), make_restaurant())
+
+    def test_views_avoid_full_table_scans(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+
+class DashboardStatsTests(TestCase):
+
+    def assertStatsMatch(self):
+        stats = get_dashboard_stats()
+        stored = {name: getattr(stats, name) for name in compute_dashboard_stats()}
+        self.assertEqual(stored, compute_dashboard_stats())
+
+    def test_counters_track_random_changes(self):
+        rng = random.Random(42)
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        get_dashboard_stats()
+        for step in range(200):
+            action = rng.choice(['customer', 'restaurant', 'item', 'order', 'order', 'status',
+                                 'delete_order', 'delete_item', 'delete_restaurant', 'delete_customer'])
+            customers = list(Customer.objects.all())
+            restaurants = list(Restaurant.objects.all())
+            orders = list(Order.objects.all())
+            if action == 'customer' or not customers:
+                make_customer(step)
+            elif action == 'restaurant' or not restaurants:
+                make_restaurant(step)
+            elif action == 'item':
+                MenuItem.objects.create(restaurant=rng.choice(restaurants), name=f'Item {step}',
+                                        price=Decimal('50.00'), category='Snack')
+            elif action == 'order':
+                make_order(rng.choice(customers), rng.choice(restaurants), status=rng.choice(statuses))
+            elif action == 'status' and orders:
+                order = rng.choice(orders)
+                order.status = rng.choice(statuses)
+                order.save()
+            elif action == 'delete_order' and orders:
+                rng.choice(orders).delete()
+            elif action == 'delete_item':
+                item = MenuItem.objects.order_by('?').first()
+                if item:
+                    item.delete()
+            elif action == 'delete_restaurant' and rng.random() < 0.3:
+                rng.choice(restaurants).delete()
+            elif action == 'delete_customer' and rng.random() < 0.3:
+                rng.choice(customers).delete()
+            if step % 25 == 0:
+                self.assertStatsMatch()
+        self.assertStatsMatch()
+
+    def test_status_update_through_deferred_instance(self):
+        order = make_order(make_customer(), make_restaurant())
+        deferred = Order.objects.only('order_id').get(pk=order.pk)
+        deferred.status = 'Delivered'
+        deferred.save()
+        self.assertStatsMatch()
+
+    def test_rebuild_fixes_drift(self):
+        make_order(make_customer(), make_restaurant())
+        Order.objects.update(status='Cancelled')  # bypasses signals
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertStatsMatch()
+
+    def test_home_reads_one_stats_row(self):
+        cache.clear()
+        get_dashboard_stats()
+        with self.assertNumQueries(2):
+            self.client.get(reverse('delivery:home'))
+
+
+class AnalyticsRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [make_customer(i) for i in range(3)]
+        cls.restaurants = [make_restaurant(i) for i in range(3)]
+        cls.items = [MenuItem.objects.create(restaurant=r, name=f'Dish {i}', price=Decimal('120.00'),
+                                             category='Main Course')
+                     for r in cls.restaurants for i in range(3)]
+        cls.couriers = [DeliveryPersonnel.objects.create(name=f'Courier {i}', phone='9800000000',
+                                                         vehicle_type='Bike') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def place(self, rng, when):
+        restaurant = rng.choice(self.restaurants)
+        order = make_order(rng.choice(self.customers), restaurant,
+                           total_amount=Decimal(rng.randint(100, 2000)) / 4,
+                           status=rng.choice(['Pending', 'Delivered', 'Cancelled']),
+                           delivery_person=rng.choice(self.couriers + [None]))
+        Order.objects.filter(pk=order.pk).update(order_date=when)
+        for item in rng.sample([i for i in self.items if i.restaurant_id == restaurant.pk], 2):
+            OrderItem.objects.create(order=order, menu_item=item, quantity=rng.randint(1, 3),
+                                     item_price=item.price)
+        return order
+
+    def live(self):
+        return {
+            'status': {r['status']: (r['count'], r['revenue']) for r in Order.objects.values('status').annotate(
+                count=Count('order_id'), revenue=Sum('total_amount')).order_by()},
+            'restaurants': {r.pk: (r.total_orders, r.total_revenue) for r in Restaurant.objects.annotate(
+                total_orders=Count('orders'), total_revenue=Sum('orders__total_amount')).filter(total_orders__gt=0)},
+            'items': {i.pk: (i.times_ordered, i.total_quantity) for i in MenuItem.objects.annotate(
+                times_ordered=Count('order_items'), total_quantity=Sum('order_items__quantity')
+            ).filter(times_ordered__gt=0)},
+            'couriers': {c.pk: (c.total, c.completed) for c in DeliveryPersonnel.objects.annotate(
+                total=Count('orders'), completed=Count('orders', filter=Q(orders__status='Delivered')))},
+        }
+
+    def rolled_up(self, start=None, end=None):
+        return {
+            'status': {r['status']: (r['count'], r['revenue']) for r in rollups.orders_by_status(start, end)},
+            'restaurants': {r.pk: (r.total_orders, r.total_revenue) for r in rollups.restaurant_totals(start, end)},
+            'items': {i.pk: (i.times_ordered, i.total_quantity) for i in rollups.menu_item_totals(start, end)},
+            'couriers': {c.pk: (c.total_deliveries, c.completed) for c in rollups.courier_totals(start, end)},
+        }
+
+    def test_rollups_match_live_aggregates(self):
+        rng = random.Random(7)
+        base = timezone.now() - timedelta(days=3)
+        orders = [self.place(rng, base + timedelta(minutes=rng.randint(0, 4000))) for _ in range(30)]
+        rollups.refresh_rollups()
+        self.assertEqual(self.rolled_up(), self.live())
+
+        for order in rng.sample(orders, 10):
+            order.refresh_from_db()
+            order.status = 'Delivered'
+            order.delivery_person = rng.choice(self.couriers)
+            order.save()
+        for order in rng.sample(orders, 3):
+            order.delete()
+        OrderItem.objects.filter(order__in=Order.objects.all()).first().delete()
+        orders += [self.place(rng, base + timedelta(minutes=rng.randint(0, 4000))) for _ in range(5)]
+        rollups.refresh_rollups()
+        self.assertEqual(self.rolled_up(), self.live())
+
+    def test_date_range_selects_days(self):
+        rng = random.Random(3)
+        day = timezone.now().replace(hour=12) - timedelta(days=5)
+        early = self.place(rng, day)
+        self.place(rng, day + timedelta(days=2))
+        rollups.refresh_rollups()
+        window = self.rolled_up(start=day.date(), end=day.date())
+        self.assertEqual(sum(n for n, _ in window['status'].values()), 1)
+        self.assertEqual(window['restaurants'], {early.restaurant_id: (1, early.total_amount)})
+
+    def test_refresh_cost_does_not_grow_with_table(self):
+        rng = random.Random(11)
+        now = timezone.now()
+        for _ in range(20):
+            self.place(rng, now - timedelta(days=rng.randint(1, 20)))
+        rollups.refresh_rollups()
+        with self.assertNumQueries(4):
+            rollups.refresh_rollups()  # nothing new: watermark and dirty queue checks only
+
+        self.place(rng, now)
+        with CaptureQueriesContext(connection) as one_new:
+            rollups.refresh_rollups()
+        for _ in range(20):
+            self.place(rng, now)
+        with CaptureQueriesContext(connection) as many_new:
+            rollups.refresh_rollups()
+        self.assertEqual(len(one_new), len(many_new))
+
+    def test_orders_committing_below_a_higher_id_are_rolled_up(self):
+        rng = random.Random(5)
+        now = timezone.now()
+        first = self.place(rng, now - timedelta(days=2))
+        make_order(self.customers[0], self.restaurants[0], order_id=first.pk + 10)
+        rollups.refresh_rollups()
+        with self.assertNumQueries(4):
+            rollups.refresh_rollups()
+
+        # an id handed out before the one above, committed after it was read
+        make_order(self.customers[1], self.restaurants[1], order_id=first.pk + 5, status='Delivered',
+                   delivery_person=self.couriers[1])
+        rollups.refresh_rollups()
+        self.assertEqual(self.rolled_up(), self.live())
+
+        # once the commit lag has passed, the watermark moves up to the id seen then
+        self.assertEqual(RollupState.objects.get().last_order_id, 0)
+        RollupState.objects.update(pending_at=now - timedelta(hours=1))
+        rollups.refresh_rollups()
+        self.assertEqual(RollupState.objects.get().last_order_id, first.pk + 10)
+        with self.assertNumQueries(4):
+            rollups.refresh_rollups()
+
+        # with nothing else writing, e.g. populate_data, it moves past new orders at once
+        latest = self.place(rng, now)
+        rollups.refresh_rollups(commit_lag=timedelta(0))
+        self.assertEqual(RollupState.objects.get().last_order_id, latest.pk)
+        self.assertEqual(self.rolled_up(), self.live())
+
+    def test_view_renders_from_rollups(self):
+        self.place(random.Random(1), timezone.now())
+        response = self.client.get(reverse('delivery:analytics'))
+        self.assertEqual(len(response.context['top_restaurants']), 0)  # not refreshed yet
+
+        rollups.refresh_rollups()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('delivery:analytics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['top_restaurants']), 1)
+        self.assertFalse(any('rollup_state' in q['sql'] for q in ctx.captured_queries))
+
+
+class MenuCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        cls.item = MenuItem.objects.create(restaurant=cls.restaurant, name='Momo', price=Decimal('150.00'),
+                                           category='Snack')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('delivery:api_restaurant_menu', args=[self.restaurant.pk])
+
+    def menu(self):
+        return self.client.get(self.url).json()['menu_items']
+
+    def test_repeat_reads_skip_the_database(self):
+        self.menu()
+        before = menu_cache_stats()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.menu()[0]['name'], 'Momo')
+        after = menu_cache_stats()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'], before['misses'])
+
+    def test_edits_are_never_served_stale(self):
+        self.menu()
+        self.item.price = Decimal('175.00')
+        self.item.save()
+        self.assertEqual(self.menu()[0]['price'], '175.00')
+
+        MenuItem.objects.create(restaurant=self.restaurant, name='Thukpa', price=Decimal('200.00'),
+                                category='Main Course')
+        self.assertEqual(len(self.menu()), 2)
+
+        self.item.delete()
+        self.assertEqual([i['name'] for i in self.menu()], ['Thukpa'])
+
+    def test_moving_an_item_invalidates_both_menus(self):
+        other = make_restaurant(2)
+        other_url = reverse('delivery:api_restaurant_menu', args=[other.pk])
+        self.menu()
+        self.client.get(other_url)
+        self.item.restaurant = other
+        self.item.save()
+        self.assertEqual(self.menu(), [])
+        self.assertEqual(len(self.client.get(other_url).json()['menu_items']), 1)
+
+    def test_admin_availability_toggle_invalidates(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        self.menu()
+        self.client.post(reverse('admin:delivery_menuitem_changelist'), {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1',
+            'form-0-item_id': str(self.item.pk), '_save': 'Save',
+        })
+        self.assertEqual(self.menu(), [])
+
+        version = versions.table_versions(MenuItem._meta.db_table)
+        self.client.post(reverse('admin:delivery_menuitem_changelist'), {
+            'action': 'mark_available', '_selected_action': [str(self.item.pk)],
+        })
+        self.assertEqual(len(self.menu()), 1)
+        # reports and fragments built from the table are stale too
+        self.assertNotEqual(versions.table_versions(MenuItem._meta.db_table), version)
+
+    def test_conditional_get_returns_304_until_edited(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # whole-second dates would hide an edit made in the same second
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        self.item.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+    def test_detail_page_uses_cached_menu(self):
+        page = reverse('delivery:restaurant_detail', args=[self.restaurant.pk])
+        self.client.get(page)
+        with self.assertNumQueries(0):
+            response = self.client.get(page)
+        self.assertContains(response, 'Momo')
+        self.assertEqual(self.client.get(reverse('delivery:restaurant_detail', args=[999])).status_code, 404)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = make_customer()
+        restaurant = make_restaurant()
+        momo = MenuItem.objects.create(restaurant=restaurant, name='Momo', price=Decimal('150.00'), category='Snack')
+        tea = MenuItem.objects.create(restaurant=restaurant, name='Tea', price=Decimal('40.00'), category='Beverage')
+        cls.orders = []
+        for day in (1, 2, 2, 5):
+            order = make_order(customer, restaurant)
+            Order.objects.filter(pk=order.pk).update(order_date=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc))
+            cls.orders.append(order.pk)
+        OrderItem.objects.create(order_id=cls.orders[1], menu_item=momo, quantity=2, item_price=momo.price)
+        OrderItem.objects.create(order_id=cls.orders[1], menu_item=tea, quantity=1, item_price=tea.price)
+        cls.staff = make_staff('view_order', 'view_customer')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(reverse('delivery:export_orders'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_a_row_per_line_in_the_range(self):
+        rows = list(csv.DictReader(self.export(start='2024-03-02', end='2024-03-02').splitlines()))
+        self.assertEqual([(int(r['order_id']), r['menu_item_name'], r['quantity']) for r in rows],
+                         [(self.orders[1], 'Momo', '2'), (self.orders[1], 'Tea', '1'), (self.orders[2], '', '')])
+        self.assertEqual(rows[0]['customer_name'], 'Customer 1')
+        self.assertEqual(rows[0]['item_price'], '150.00')
+        self.assertEqual(rows[0]['order_date'], '2024-03-02T12:00:00+00:00')
+
+    def test_jsonl_and_batches_cover_every_order_once(self):
+        rows = [json.loads(line) for line in self.export(format='jsonl', start='2024-03-01').splitlines()]
+        self.assertEqual([row['order_id'] for row in rows], [self.orders[0], *self.orders[1:2] * 2, *self.orders[2:]])
+        self.assertIsNone(rows[0]['order_item_id'])
+
+        # two queries per batch of orders, however many lines they have
+        with self.assertNumQueries(4):
+            batched = ''.join(export_chunks('jsonl', day_range(), batch_size=3))
+        self.assertEqual([json.loads(line) for line in batched.splitlines()], rows)
+
+    def test_only_staff_who_may_view_orders_and_customers_export(self):
+        url = reverse('delivery:export_orders')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(make_staff('view_order', username='clerk'))
+        with self.assertNumQueries(4):  # session, user and permissions, never the orders
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_bad_ranges_are_rejected(self):
+        url = reverse('delivery:export_orders')
+        for params in [{'start': 'March'}, {'start': '2024-03-05', 'end': '2024-03-01'}, {'format': 'xlsx'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_command_writes_the_same_export(self):
+        out = StringIO()
+        call_command('export_orders', '--start', '2024-03-05', '--format', 'jsonl', stdout=out)
+        self.assertEqual(out.getvalue(), self.export(start='2024-03-05', format='jsonl'))
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nepali = make_restaurant(1, name='Kathmandu Kitchen', cuisine_type='Continental')
+        cls.indian = make_restaurant(2, name='Delhi Darbar', cuisine_type='Indian')
+        cls.momo = MenuItem.objects.create(restaurant=cls.nepali, name='Chicken Momo', price=Decimal('180.00'),
+                                           category='Snack', description='Steamed dumplings')
+        cls.thali = MenuItem.objects.create(restaurant=cls.nepali, name='Dal Bhat', price=Decimal('350.00'),
+                                            category='Main Course', description='Rice with chicken curry')
+        cls.tikka = MenuItem.objects.create(restaurant=cls.indian, name='Chicken Tikka', price=Decimal('420.00'),
+                                            category='Main Course', is_available=False)
+
+    def search(self, **params):
+        response = self.client.get(reverse('delivery:api_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_name_matches_rank_above_description_and_tags(self):
+        self.assertEqual(self.search(q='chicken', available='any'), ['Chicken Momo', 'Chicken Tikka', 'Dal Bhat'])
+        self.assertEqual(self.search(q='chick'), ['Chicken Momo', 'Dal Bhat'])
+        self.assertEqual(self.search(q='kathmandu mo'), ['Chicken Momo'])
+        self.assertEqual(self.search(q='momo delhi'), [])
+        # category and cuisine are indexed by label, not by their stored code
+        self.assertEqual(self.search(q='continental snack'), ['Chicken Momo'])
+
+    def test_filters_and_pages(self):
+        self.assertEqual(self.search(q='chicken', max_price='200'), ['Chicken Momo'])
+        self.assertEqual(self.search(q='chicken', available='0'), ['Chicken Tikka'])
+        for i in range(3):
+            MenuItem.objects.create(restaurant=self.indian, name=f'Paneer {i}', price=Decimal('200.00'),
+                                    category='Main Course', description='Served with chicken')
+        names = []
+        for page in range(1, 4):
+            rows, has_next = search_menu(['chicken'], page=page, per_page=2)
+            names += [row['name'] for row in rows]
+        self.assertEqual(names, ['Chicken Momo', 'Dal Bhat', 'Paneer 0', 'Paneer 1', 'Paneer 2'])
+        self.assertFalse(has_next)
+
+    def test_index_follows_edits(self):
+        self.momo.name = 'Veg Momo'
+        self.momo.save()
+        self.assertEqual(self.search(q='veg'), ['Veg Momo'])
+        self.nepali.name = 'Patan Kitchen'
+        self.nepali.save()
+        self.assertEqual(self.search(q='patan'), ['Veg Momo', 'Dal Bhat'])
+        self.assertEqual(self.search(q='kathmandu'), [])
+        self.thali.delete()
+        self.assertEqual(self.search(q='patan'), ['Veg Momo'])
+
+    def test_bad_queries_are_rejected(self):
+        url = reverse('delivery:api_search')
+        for params in [{}, {'q': '!!'}, {'q': 'momo', 'min_price': 'cheap'}, {'q': 'momo', 'available': 'yes'},
+                       {'q': 'momo', 'page': '0'}, {'q': 'momo', 'max_price': '-1'}]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+
+
+class OrderPlacementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurant = make_restaurant()
+        cls.items = [MenuItem.objects.create(restaurant=cls.restaurant, name=f'Dish {i}',
+                                             price=Decimal('100.00') + i, category='Main Course')
+                     for i in range(10)]
+        get_dashboard_stats()
+
+    def post(self, items, **extra):
+        payload = {'customer_id': self.customer.pk, 'restaurant_id': self.restaurant.pk, 'items': items}
+        payload.update(extra)
+        return self.client.post(reverse('delivery:api_place_order'), json.dumps(payload),
+                                content_type='application/json')
+
+    def lines(self, count, quantity=2):
+        return [{'menu_item_id': item.pk, 'quantity': quantity} for item in self.items[:count]]
+
+    def test_total_is_computed_server_side(self):
+        response = self.post(self.lines(3) + [{'menu_item_id': self.items[0].pk, 'quantity': 1, 'price': '1'}])
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.json()['order_id'])
+        # 3 x 100 + 2 x 101 + 2 x 102
+        self.assertEqual(order.total_amount, Decimal('706.00'))
+        self.assertEqual(order.order_items.count(), 3)
+        self.assertEqual(order.delivery_address, self.customer.address)
+        self.assertEqual(get_dashboard_stats().total_orders, 1)
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        # customer, prices, savepoint, order, stats counter, customer and restaurant
+        # totals, status event, items, release
+        for count in (1, 10):
+            with self.assertNumQueries(10):
+                self.post(self.lines(count))
+        self.assertEqual(list(Order.objects.annotate(n=Count('order_items')).order_by('n')
+                              .values_list('n', flat=True)), [1, 10])
+
+    def test_invalid_orders_write_nothing(self):
+        other_item = MenuItem.objects.create(restaurant=make_restaurant(2), name='Pizza',
+                                             price=Decimal('500.00'), category='Main Course')
+        MenuItem.objects.filter(pk=self.items[1].pk).update(is_available=False)
+        bad_requests = [
+            [],
+            [{'menu_item_id': other_item.pk, 'quantity': 1}],
+            [{'menu_item_id': self.items[1].pk, 'quantity': 1}],
+            [{'menu_item_id': self.items[0].pk, 'quantity': 0}],
+            [{'quantity': 1}],
+        ]
+        for items in bad_requests:
+            response = self.post(items)
+            self.assertEqual(response.status_code, 400, items)
+            self.assertFalse(response.json()['success'])
+        self.assertEqual(self.post(self.lines(1), customer_id=999).status_code, 400)
+        self.assertEqual(self.client.get(reverse('delivery:api_place_order')).status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+    def test_admin_recalculates_total(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.post(reverse('admin:delivery_order_add'), {
+            'status': 'Pending', 'customer': self.customer.pk, 'restaurant': self.restaurant.pk,
+            'delivery_address': 'Baneshwor',
+            'order_items-TOTAL_FORMS': '2', 'order_items-INITIAL_FORMS': '0',
+            'order_items-0-menu_item': self.items[0].pk, 'order_items-0-quantity': '2',
+            'order_items-0-item_price': '100.00',
+            'order_items-1-menu_item': self.items[1].pk, 'order_items-1-quantity': '1',
+            'order_items-1-item_price': '101.00',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('301.00'))
+
+
+class TransitionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [make_customer(i) for i in range(3)]
+        cls.restaurant = make_restaurant()
+        cls.courier = DeliveryPersonnel.objects.create(name='Courier', phone='9811111111', vehicle_type='Bike',
+                                                       is_available=False)
+
+    def orders(self, count, status='Pending', **kwargs):
+        return [make_order(self.customers[i % 3], self.restaurant, status=status,
+                           total_amount=Decimal(100 + i), **kwargs).pk for i in range(count)]
+
+    def assertDerivedDataMatches(self):
+        stats = get_dashboard_stats()
+        self.assertEqual({name: getattr(stats, name) for name in compute_dashboard_stats()}, compute_dashboard_stats())
+        self.assertEqual(list(customer_stats_drift()), [])
+        self.assertEqual(list(restaurant_stats_drift()), [])
+
+    def test_only_allowed_moves_are_made(self):
+        pending = self.orders(3)
+        delivered = self.orders(1, status='Delivered')
+        before = timezone.now()
+        moved, rejected = transition_orders([*pending, *delivered, 999], 'Confirmed')
+        self.assertEqual(moved, pending)
+        self.assertEqual(rejected, {delivered[0]: 'Delivered', 999: None})
+        self.assertFalse(Order.objects.filter(pk__in=pending).exclude(status='Confirmed').exists())
+        self.assertFalse(Order.objects.filter(pk__in=pending, status_changed_at__lt=before).exists())
+
+        self.assertEqual(transition_orders(pending, 'Out for Delivery'), ([], dict.fromkeys(pending, 'Confirmed')))
+        with self.assertRaises(TransitionError):
+            transition_orders(pending, 'Pending')
+
+    def test_bulk_moves_keep_derived_data_current(self):
+        order_ids = self.orders(9, delivery_person=self.courier)
+        RollupDirtyBucket.objects.all().delete()
+        with mock.patch.object(hub, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            transition_orders(order_ids[:6], 'Cancelled', batch_size=4)
+        self.assertEqual(sorted(call.args[0] for call in publish.call_args_list), order_ids[:6])
+        self.assertTrue(RollupDirtyBucket.objects.exists())
+        self.assertDerivedDataMatches()
+        self.assertFalse(DeliveryPersonnel.objects.get(pk=self.courier.pk).is_available)
+
+        for target in ('Confirmed', 'Preparing', 'Out for Delivery', 'Delivered'):
+            transition_orders(order_ids[6:], target)
+        self.assertDerivedDataMatches()
+        self.assertTrue(DeliveryPersonnel.objects.get(pk=self.courier.pk).is_available)
+
+    def test_query_count_is_per_batch_not_per_order(self):
+        for count in (10, 50):
+            order_ids = self.orders(count)
+            with CaptureQueriesContext(connection) as ctx:
+                transition_orders(order_ids, 'Cancelled', batch_size=100)
+            if count == 10:
+                small = len(ctx)
+        self.assertEqual(len(ctx), small)
+
+    def test_api_reports_moved_and_rejected(self):
+        pending = self.orders(2)
+        url = reverse('delivery:api_transition_orders')
+        self.client.force_login(make_staff('change_order'))
+        response = self.client.post(url, json.dumps({'ids': [*pending, 999], 'status': 'Confirmed'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['moved'], pending)
+        self.assertEqual(response.json()['rejected'], [{'order_id': 999, 'status': None}])
+        for payload in [{'ids': pending, 'status': 'Eaten'}, {'ids': ['x'], 'status': 'Confirmed'}, [1]]:
+            response = self.client.post(url, json.dumps(payload), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_api_is_for_staff_with_change_permission(self):
+        pending = self.orders(2)
+        url = reverse('delivery:api_transition_orders')
+        body = json.dumps({'ids': pending, 'status': 'Cancelled'})
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 403)
+        self.client.force_login(make_staff('view_order'))
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 403)
+        self.assertEqual(set(Order.objects.filter(pk__in=pending).values_list('status', flat=True)), {'Pending'})
+
+        # a session is not enough without the CSRF token
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(make_staff('change_order', username='dispatcher'))
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+        client.get(reverse('admin:index'))
+        response = client.post(url, body, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.json()['moved'], pending)
+
+    def test_admin_uses_the_state_machine(self):
+        pending = self.orders(2)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.client.post(reverse('admin:delivery_order_changelist'), {
+            'action': 'move_to_confirmed', '_selected_action': [str(pk) for pk in pending],
+        })
+        self.assertEqual(set(Order.objects.filter(pk__in=pending).values_list('status', flat=True)), {'Confirmed'})
+
+        order = Order.objects.get(pk=pending[0])
+        response = self.client.post(reverse('admin:delivery_order_change', args=[order.pk]), {
+            'status': 'Delivered', 'customer': order.customer_id, 'restaurant': order.restaurant_id,
+            'delivery_address': order.delivery_address,
+            'order_items-TOTAL_FORMS': '0', 'order_items-INITIAL_FORMS': '0',
+        })
+        self.assertContains(response, 'cannot move from Confirmed to Delivered')
+
+
+class StatusHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurants = [make_restaurant(i) for i in range(2)]
+        cls.couriers = [DeliveryPersonnel.objects.create(name=f'Courier {i}', phone='9811111111',
+                                                         vehicle_type='Bike') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def events(self, order_id):
+        return list(OrderStatusEvent.objects.filter(order_id=order_id).order_by('event_id').values_list(
+            'from_status', 'to_status', 'duration_seconds'
+        ))
+
+    def timed_order(self, restaurant, courier, prep_minutes, delivery_minutes, left_at):
+        """A delivered order with its history, leaving the kitchen at `left_at`."""
+        order = make_order(self.customer, restaurant, delivery_person=courier, status='Delivered')
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(order=order, from_status='Preparing', to_status='Out for Delivery',
+                             changed_at=left_at, duration_seconds=prep_minutes * 60),
+            OrderStatusEvent(order=order, from_status='Out for Delivery', to_status='Delivered',
+                             changed_at=left_at + timedelta(minutes=delivery_minutes),
+                             duration_seconds=delivery_minutes * 60),
+        ])
+        return order
+
+    def test_saves_and_bulk_moves_append_events(self):
+        order = make_order(self.customer, self.restaurants[0])
+        Order.objects.filter(pk=order.pk).update(status_changed_at=timezone.now() - timedelta(minutes=3))
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'Confirmed'
+        order.save()
+        order.delivery_address = 'Patan'
+        order.save()
+        Order.objects.filter(pk=order.pk).update(status_changed_at=timezone.now() - timedelta(minutes=12))
+        transition_orders([order.pk], 'Preparing')
+
+        events = self.events(order.pk)
+        self.assertEqual([(old, new) for old, new, _ in events],
+                         [(None, 'Pending'), ('Pending', 'Confirmed'), ('Confirmed', 'Preparing')])
+        self.assertIsNone(events[0][2])
+        self.assertAlmostEqual(events[1][2], 180, delta=5)
+        self.assertAlmostEqual(events[2][2], 720, delta=5)
+        changed_at = Order.objects.values_list('status_changed_at', flat=True).get(pk=order.pk)
+        self.assertEqual(OrderStatusEvent.objects.filter(order=order).latest('event_id').changed_at, changed_at)
+
+    def test_bulk_moves_insert_events_per_batch(self):
+        order_ids = [make_order(self.customer, self.restaurants[0]).pk for _ in range(5)]
+        with CaptureQueriesContext(connection) as ctx:
+            transition_orders(order_ids, 'Confirmed', batch_size=2)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "order_status_event"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(OrderStatusEvent.objects.filter(to_status='Confirmed').count(), 5)
+
+    def test_percentiles_come_from_incremental_histograms(self):
+        day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        for minutes in range(1, 11):
+            self.timed_order(self.restaurants[0], self.couriers[0], minutes * 2, 30, day)
+        self.timed_order(self.restaurants[1], self.couriers[1], 500, 9, day)
+        rollups.refresh_rollups()
+
+        restaurants = rollups.duration_percentiles(RestaurantDurationRollup)
+        self.assertEqual([(r.pk, r.samples) for r in restaurants],
+                         [(self.restaurants[0].pk, 10), (self.restaurants[1].pk, 1)])
+        self.assertEqual(restaurants[0].percentiles, {'p50': 10, 'p90': 20, 'p99': 20})
+        self.assertEqual(restaurants[1].percentiles, {'p50': None, 'p90': None, 'p99': None})
+        couriers = rollups.duration_percentiles(CourierDurationRollup, limit=1)
+        self.assertEqual([(c.pk, c.percentiles['p50']) for c in couriers], [(self.couriers[0].pk, 30)])
+        self.assertEqual(rollups.duration_percentiles(RestaurantDurationRollup, end=(day - timedelta(days=1)).date()),
+                         [])
+
+        # only the day of the new event is rebuilt; a reassigned courier moves their samples
+        order = self.timed_order(self.restaurants[1], self.couriers[1], 3, 9, day + timedelta(days=1))
+        with CaptureQueriesContext(connection) as ctx:
+            rollups.refresh_rollups()
+        self.assertEqual(sum('DELETE FROM "courier_duration_rollup"' in q['sql'] for q in ctx.captured_queries), 1)
+        order.delivery_person = self.couriers[0]
+        order.save()
+        rollups.refresh_rollups()
+        counts = CourierDurationRollup.objects.values('delivery_person_id').annotate(n=Sum('order_count'))
+        self.assertEqual({row['delivery_person_id']: row['n'] for row in counts},
+                         {self.couriers[0].pk: 11, self.couriers[1].pk: 1})
+
+        OrderStatusEvent.objects.filter(order=order).delete()
+        rollups.refresh_rollups()
+        self.assertEqual(RestaurantDurationRollup.objects.aggregate(n=Sum('order_count'))['n'], 11)
+
+    def test_events_committing_below_a_higher_id_are_rolled_up(self):
+        day = timezone.now() - timedelta(days=1)
+        order = self.timed_order(self.restaurants[0], self.couriers[0], 5, 10, day)
+        seen = OrderStatusEvent.objects.aggregate(high=Max('event_id'))['high'] + 10
+        OrderStatusEvent.objects.create(event_id=seen, order=order, from_status='Out for Delivery',
+                                        to_status='Delivered', changed_at=day)
+        rollups.refresh_rollups()
+
+        # an id handed out before the one above, committed after it was read
+        OrderStatusEvent.objects.create(event_id=seen - 5, order=order, from_status='Preparing',
+                                        to_status='Out for Delivery', changed_at=day, duration_seconds=30 * 60)
+        rollups.refresh_rollups()
+        restaurants = rollups.duration_percentiles(RestaurantDurationRollup)
+        self.assertEqual([(r.samples, r.percentiles['p99']) for r in restaurants], [(2, 30)])
+
+        # once the commit lag has passed, the watermark moves up to the id seen then
+        RollupState.objects.update(pending_at=timezone.now() - timedelta(hours=1))
+        rollups.refresh_rollups()
+        self.assertEqual(RollupState.objects.get().last_event_id, seen)
+        with self.assertNumQueries(4):
+            rollups.refresh_rollups()
+
+    def test_analytics_page_shows_percentiles(self):
+        self.timed_order(self.restaurants[0], self.couriers[0], 14, 25, timezone.now() - timedelta(hours=1))
+        rollups.refresh_rollups()
+        response = self.client.get(reverse('delivery:analytics'))
+        self.assertContains(response, 'Preparation Time')
+        self.assertEqual([r.pk for r in response.context['prep_times']], [self.restaurants[0].pk])
+        self.assertEqual(response.context['delivery_times'][0].percentiles['p90'], 25)
+
+
+class ReportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurant = make_restaurant(rating=Decimal('4.5'))
+        cls.order = make_order(cls.customer, cls.restaurant, status='Delivered')
+        MenuItem.objects.create(restaurant=cls.restaurant, name='Momo', price=Decimal('150.00'),
+                                category='Starter')
+
+    def setUp(self):
+        cache.clear()
+
+    def rows(self, name, **params):
+        report = reports.REPORTS[name]
+        return reports.run_report(report, report.clean(params))
+
+    def test_repeat_views_do_not_query(self):
+        response = self.client.get(reverse('delivery:sql_demo'), {'limit': '5'})
+        self.assertContains(response, self.customer.email)
+        self.assertContains(response, 'Never Ordered')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('delivery:sql_demo'), {'limit': '5'})
+        self.assertContains(response, 'Served from cache', count=len(reports.REPORTS))
+
+    def test_parameters_are_cleaned_and_passed_to_the_query(self):
+        report = reports.REPORTS['recent_orders']
+        self.assertEqual(report.clean({'limit': '1000', 'status': 'Lost'}), {'limit': 10, 'status': None})
+        make_order(self.customer, self.restaurant)
+        entry, _ = self.rows('recent_orders', status='Delivered')
+        self.assertEqual([row[0] for row in entry['rows']], [self.order.pk])
+        self.assertEqual(entry['rows'][0][4], 'Delivered')
+        self.assertEqual(self.rows('top_rated_customers', min_rating='4.5')[0]['rows'], [])
+        self.assertEqual(len(self.rows('top_rated_customers', min_rating='4.0')[0]['rows']), 1)
+
+    def test_writes_invalidate_the_reports_reading_the_table(self):
+        self.rows('recent_orders')
+        self.rows('top_rated_customers')
+        self.assertTrue(self.rows('recent_orders')[1])
+        order = make_order(self.customer, self.restaurant)
+        entry, cached = self.rows('recent_orders')
+        self.assertFalse(cached)
+        self.assertEqual(entry['rows'][0][0], order.pk)
+
+        transition_orders([order.pk], 'Confirmed')
+        self.assertFalse(self.rows('recent_orders')[1])
+
+    def test_precomputed_reports_follow_writes(self):
+        self.assertEqual(set(reports.precompute_reports()), {'popular_items', 'revenue_by_status'})
+        self.assertEqual(reports.precompute_reports(), {})
+        self.assertTrue(self.rows('revenue_by_status')[1])
+
+        # a write moves the report to a new key, which precomputing fills ahead of the page
+        make_order(self.customer, self.restaurant, status='Cancelled')
+        self.assertEqual(set(reports.precompute_reports()), {'revenue_by_status'})
+        entry, cached = self.rows('revenue_by_status')
+        self.assertTrue(cached)
+        self.assertEqual([row[0] for row in entry['rows']], ['Cancelled', 'Delivered'])
+
+        # without it the page computes the report itself rather than serve the old result
+        make_order(self.customer, self.restaurant, status='Pending')
+        entry, cached = self.rows('revenue_by_status')
+        self.assertFalse(cached)
+        self.assertEqual([row[0] for row in entry['rows']], ['Cancelled', 'Delivered', 'Pending'])
+
+
+class FragmentCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurant = make_restaurant()
+        cls.courier = DeliveryPersonnel.objects.create(name='Courier 1', phone='9800000000', vehicle_type='Bike')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home_fragment_skips_the_recent_orders_query(self):
+        first = make_order(self.customer, self.restaurant)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('delivery:home'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('delivery:home'))
+        self.assertContains(response, f'#{first.pk}')
+
+        second = make_order(self.customer, self.restaurant)
+        self.assertContains(self.client.get(reverse('delivery:home')), f'#{second.pk}')
+        Customer.objects.filter(pk=self.customer.pk).update(name='Renamed')  # bypasses the signals
+        self.assertNotContains(self.client.get(reverse('delivery:home')), 'Renamed')
+        self.customer.refresh_from_db()
+        self.customer.save()
+        self.assertContains(self.client.get(reverse('delivery:home')), 'Renamed')
+
+    def test_analytics_fragment_follows_rollups_and_couriers(self):
+        make_order(self.customer, self.restaurant, delivery_person=self.courier, status='Delivered')
+        rollups.refresh_rollups()
+        self.assertContains(self.client.get(reverse('delivery:analytics')), 'Available')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('delivery:analytics'))
+
+        self.courier.is_available = False
+        self.courier.save()
+        self.assertContains(self.client.get(reverse('delivery:analytics')), 'Busy')
+
+        make_order(self.customer, self.restaurant)
+        rollups.refresh_rollups()
+        response = self.client.get(reverse('delivery:analytics'))
+        self.assertEqual(response.context['orders_by_status'].get(status='Pending')['count'], 1)
+
+        # another date range is another fragment
+        response = self.client.get(reverse('delivery:analytics'), {'start': '2000-01-01', 'end': '2000-01-02'})
+        self.assertContains(response, 'No data available')
+
+
+class CourierDispatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurant = make_restaurant()
+        cls.couriers = [DeliveryPersonnel.objects.create(name=f'Courier {i}', phone='9811111111',
+                                                         vehicle_type='Bike') for i in range(3)]
+
+    def test_backlog_is_drained_oldest_first(self):
+        orders = [make_order(self.customer, self.restaurant) for _ in range(5)]
+        make_order(self.customer, self.restaurant, status='Out for Delivery')
+        self.assertEqual(dispatch_pending(batch_size=2), 3)
+        assigned = Order.objects.filter(delivery_person__isnull=False)
+        self.assertEqual(sorted(assigned.values_list('order_id', flat=True)), [o.pk for o in orders[:3]])
+        self.assertEqual(len(set(assigned.values_list('delivery_person', flat=True))), 3)
+        self.assertFalse(DeliveryPersonnel.objects.filter(is_available=True).exists())
+        self.assertIsNone(assign_courier(orders[4].pk))
+
+    def test_closing_an_order_releases_its_courier(self):
+        order = make_order(self.customer, self.restaurant)
+        courier_id = assign_courier(order.pk)
+        self.assertIsNotNone(courier_id)
+        self.assertIsNone(assign_courier(order.pk))
+
+        order = Order.objects.only('order_id', 'status').get(pk=order.pk)
+        order.status = 'Delivered'
+        order.save()
+        self.assertTrue(DeliveryPersonnel.objects.get(pk=courier_id).is_available)
+
+    def test_assignment_reaches_courier_rollups(self):
+        order = make_order(self.customer, self.restaurant)
+        rollups.refresh_rollups()
+        courier_id = assign_courier(order.pk)
+        rollups.refresh_rollups()
+        totals = {c.pk: c.total_deliveries for c in rollups.courier_totals()}
+        self.assertEqual(totals[courier_id], 1)
+
+
+class ApiThrottleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = make_order(make_customer(), make_restaurant())
+
+    def setUp(self):
+        throttle.buckets().clear()
+
+    @override_settings(API_RATE_LIMIT_RATE=0.5, API_RATE_LIMIT_BURST=3)
+    def test_client_over_the_burst_is_refused(self):
+        url = reverse('delivery:api_order_status', args=[self.order.pk])
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        for _ in range(3):
+            self.assertEqual(client.get(url).status_code, 200)
+        refused = throttle.THROTTLED.value(view='api_order_status')
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(throttle.THROTTLED.value(view='api_order_status'), refused + 1)
+
+        # other clients have their own bucket
+        self.assertEqual(Client(REMOTE_ADDR='10.0.0.2').get(url).status_code, 200)
+        with override_settings(API_RATE_LIMIT_RATE=0):
+            self.assertEqual(client.get(url).status_code, 200)
+
+    @override_settings(API_RATE_LIMIT_RATE=0.5, API_RATE_LIMIT_BURST=1,
+                       API_RATE_LIMIT_CLIENT_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_async_views_and_forwarded_clients(self):
+        url = reverse('delivery:api_restaurant_menu_async', args=[self.order.restaurant_id])
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.3, 10.1.1.1').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.3').status_code, 429)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='10.0.0.4').status_code, 200)
+
+    @override_settings(API_RATE_LIMIT_RATE=0.5, API_RATE_LIMIT_BURST=1)
+    def test_async_batch_status_is_limited(self):
+        url = reverse('delivery:api_order_status_batch')
+        client = Client(REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(client.get(url, {'ids': self.order.pk}).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url, {'ids': self.order.pk}).status_code, 429)
+
+    def test_buckets_refill(self):
+        for backend in (throttle.LocalBuckets(), throttle.CacheBuckets()):
+            self.assertEqual(backend.take('client', 100, 1), 0)
+            self.assertGreater(backend.take('client', 100, 1), 0)
+            time.sleep(0.02)
+            self.assertEqual(backend.take('client', 100, 1), 0)
+
+
+class BatchStatusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        customer, restaurant = make_customer(), make_restaurant()
+        cls.orders = [make_order(customer, restaurant) for _ in range(5)]
+        cls.url = reverse('delivery:api_orders_status')
+
+    def setUp(self):
+        throttle.buckets().clear()
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_every_order_in_one_query(self):
+        ids = [order.pk for order in self.orders]
+        # several chunks, so the separators between them are exercised
+        with mock.patch.object(orders, 'STATUS_CHUNK_SIZE', 2), self.assertNumQueries(1):
+            body = self.read(self.post({'ids': ids + [999999]}))
+        self.assertTrue(body['success'])
+        self.assertEqual(sorted(row['order_id'] for row in body['orders']), ids)
+        self.assertEqual(body['orders'][0]['status'], 'Pending')
+        self.assertEqual(body['missing'], [999999])
+        # each order reads the same as from the single-order API
+        single = self.client.get(reverse('delivery:api_order_status', args=[ids[0]])).json()
+        del single['success']
+        self.assertIn(single, body['orders'])
+
+    def test_since_lists_only_changed_orders(self):
+        ids = [order.pk for order in self.orders]
+        since = self.read(self.post({'ids': ids}))['as_of']
+        Order.objects.filter(pk__in=ids).update(status_changed_at=timezone.now() - timedelta(hours=1))
+        moved = self.orders[1]
+        moved.status = 'Preparing'
+        moved.save()
+
+        body = self.read(self.post({'ids': ids, 'since': since}))
+        self.assertEqual([row['order_id'] for row in body['orders']], [moved.pk])
+        self.assertEqual(body['orders'][0]['status'], 'Preparing')
+        self.assertNotIn('missing', body)
+        self.assertGreater(datetime.fromisoformat(body['as_of']), datetime.fromisoformat(since))
+
+        # a timestamp without an offset is UTC
+        naive = (timezone.now() + timedelta(minutes=1)).replace(tzinfo=None).isoformat()
+        self.assertEqual(self.read(self.post({'ids': ids, 'since': naive}))['orders'], [])
+
+    def test_bad_requests(self):
+        too_many = list(range(1, orders.MAX_BATCH_STATUS_IDS + 2))
+        for payload in ([1, 2], {}, {'ids': 'a,b'}, {'ids': too_many}, {'ids': [1], 'since': 'yesterday'},
+                        {'ids': [1], 'since': 5}):
+            with self.subTest(payload=payload), self.assertNumQueries(0):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+        response = self.client.post(self.url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+
+class CoalescingTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        throttle.buckets().clear()
+        self.restaurant = make_restaurant()
+        MenuItem.objects.create(restaurant=self.restaurant, name='Momo', price=Decimal('150.00'), category='Snack')
+        self.order = make_order(make_customer(), self.restaurant)
+
+    def gated(self, fn, flight, waiters):
+        """`fn`, holding the first call until `waiters` others are waiting for it."""
+        target = COALESCED.value(flight=flight) + waiters
+
+        def wrapper(*args, **kwargs):
+            deadline = time.monotonic() + 5
+            while COALESCED.value(flight=flight) < target and time.monotonic() < deadline:
+                time.sleep(0.001)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def herd(self, url):
+        """GET `url` from THREADS threads at once; (responses, queries run across all of them)."""
+        barrier = threading.Barrier(self.THREADS)
+        lock = threading.Lock()
+        responses, queries = [], []
+
+        def count(execute, sql, params, many, context):
+            with lock:
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def worker():
+            try:
+                barrier.wait()
+                with connection.execute_wrapper(count):
+                    response = Client().get(url)
+                with lock:
+                    responses.append(response)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return responses, queries
+
+    def test_simultaneous_status_calls_run_one_query(self):
+        before = COALESCED.value(flight='order_status')
+        gate = self.gated(orders.status_payload, 'order_status', self.THREADS - 1)
+        with mock.patch.object(orders, 'status_payload', gate):
+            responses, queries = self.herd(reverse('delivery:api_order_status', args=[self.order.pk]))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual({r.status_code for r in responses}, {200})
+        self.assertEqual({r.content for r in responses}, {responses[0].content})
+        self.assertEqual(COALESCED.value(flight='order_status'), before + self.THREADS - 1)
+
+    def test_simultaneous_menu_misses_load_once(self):
+        gate = self.gated(menu_cache.load_menu, 'menu', self.THREADS - 1)
+        with mock.patch.object(menu_cache, 'load_menu', gate):
+            responses, queries = self.herd(reverse('delivery:api_restaurant_menu', args=[self.restaurant.pk]))
+        self.assertEqual(len(queries), 2)  # the restaurant and its items
+        self.assertEqual({len(r.json()['menu_items']) for r in responses}, {1})
+
+    async def test_concurrent_async_calls_share_one_load(self):
+        before = COALESCED.value(flight='order_status')
+        with mock.patch.object(orders, 'status_payload', wraps=orders.status_payload) as payload:
+            results = await asyncio.gather(*(orders.aorder_status(self.order.pk) for _ in range(20)),
+                                           orders.aorder_status(999))
+        self.assertEqual(payload.call_count, 1)
+        self.assertEqual(results[:20], [results[0]] * 20)
+        self.assertIsNone(results[20])
+        self.assertEqual(COALESCED.value(flight='order_status'), before + 19)
+
+
+class ConcurrentDispatchTests(TransactionTestCase):
+    THREADS = 8
+
+    def test_no_courier_is_assigned_twice(self):
+        customer, restaurant = make_customer(), make_restaurant()
+        for i in range(20):
+            DeliveryPersonnel.objects.create(name=f'Courier {i}', phone='9811111111', vehicle_type='Bike')
+        order_ids = [make_order(customer, restaurant).pk for _ in range(60)]
+
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(ids):
+            try:
+                barrier.wait()
+                for order_id in ids:
+                    assign_courier(order_id)
+                dispatch_pending(batch_size=5)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(order_ids[i::self.THREADS],))
+                   for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        per_courier = Order.objects.filter(delivery_person__isnull=False).values(
+            'delivery_person').annotate(n=Count('order_id'))
+        self.assertEqual(len(per_courier), 20)
+        self.assertEqual({row['n'] for row in per_courier}, {1})
+        self.assertFalse(DeliveryPersonnel.objects.filter(is_available=True).exists())
+
+
+class AsyncApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = make_restaurant()
+        MenuItem.objects.create(restaurant=cls.restaurant, name='Momo', price=Decimal('150.00'), category='Snack')
+        customer = make_customer()
+        courier = DeliveryPersonnel.objects.create(name='Ram', phone='9811111111', vehicle_type='Bike')
+        cls.orders = [make_order(customer, cls.restaurant, delivery_person=courier if i % 2 else None)
+                      for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_order_status_matches_sync_view(self):
+        for order in self.orders[:2]:
+            sync = await sync_to_async(self.client.get)(reverse('delivery:api_order_status', args=[order.pk]))
+            response = await self.async_client.get(reverse('delivery:api_order_status_async', args=[order.pk]))
+            self.assertEqual(response.json(), sync.json())
+        response = await self.async_client.get(reverse('delivery:api_order_status_async', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_menu_matches_sync_view_and_honours_etag(self):
+        url = reverse('delivery:api_restaurant_menu_async', args=[self.restaurant.pk])
+        sync = await sync_to_async(self.client.get)(
+            reverse('delivery:api_restaurant_menu', args=[self.restaurant.pk]))
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json(), sync.json())
+        self.assertEqual(response['ETag'], sync['ETag'])
+        response = await self.async_client.get(url, headers={'if-none-match': sync['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_batch_status_streams_the_sync_body(self):
+        ids = [o.pk for o in self.orders] + [999, self.orders[0].pk]
+        with mock.patch.object(orders, 'STATUS_CHUNK_SIZE', 2):
+            sync = await sync_to_async(lambda: json.loads(b''.join(self.client.post(
+                reverse('delivery:api_orders_status'), json.dumps({'ids': ids}), content_type='application/json'
+            ).streaming_content)))()
+            response = await self.async_client.get(reverse('delivery:api_order_status_batch'),
+                                                   {'ids': ','.join(map(str, ids))})
+            data = json.loads(await read_stream(response.streaming_content))
+        self.assertEqual(sorted(o['order_id'] for o in data['orders']), sorted(o.pk for o in self.orders))
+        self.assertEqual(data['missing'], [999])
+        self.assertEqual({o['delivery_person'] for o in data['orders']}, {None, 'Ram'})
+        del data['as_of'], sync['as_of']
+        self.assertEqual(data, sync)
+
+        too_many = ','.join(map(str, range(1, orders.MAX_BATCH_STATUS_IDS + 2)))
+        for params in ({'ids': 'x'}, {'ids': too_many}, {'ids': '1', 'since': 'yesterday'}):
+            response = await self.async_client.get(reverse('delivery:api_order_status_batch'), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_batch_status_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('delivery:api_order_status_batch'),
+                                       {'ids': ','.join(str(o.pk) for o in self.orders)})
+            self.assertEqual(len(json.loads(async_to_sync(read_stream)(response.streaming_content))['orders']), 5)
+
+
+class LiveStatusTests(TestCase):
+    CLIENTS = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = make_order(make_customer(), make_restaurant())
+
+    async def open_stream(self, order_id):
+        response = await self.async_client.get(reverse('delivery:api_order_events', args=[order_id]))
+        stream = aiter(response.streaming_content)
+        return stream, await anext(stream)
+
+    def events(self, chunk):
+        return [json.loads(line[6:]) for line in chunk.decode().splitlines() if line.startswith('data: ')]
+
+    async def set_status(self, status):
+        def save():
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.get(pk=self.order.pk)
+                order.status = status
+                order.save()
+        await sync_to_async(save)()
+
+    async def test_idle_subscribers_cost_no_queries(self):
+        streams = []
+        for _ in range(self.CLIENTS):
+            stream, first = await self.open_stream(self.order.pk)
+            self.assertEqual(self.events(first), [{'order_id': self.order.pk, 'status': 'Pending'}])
+            streams.append(stream)
+        self.assertEqual(hub.subscriber_count(), self.CLIENTS)
+
+        waiting = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        queries = []
+        # assertNumQueries cannot be entered from async code
+        with connection.execute_wrapper(lambda execute, *args: queries.append(args[0]) or execute(*args)):
+            await asyncio.sleep(0.2)
+        self.assertEqual(queries, [])
+        self.assertFalse(any(task.done() for task in waiting))
+
+        await self.set_status('Confirmed')
+        chunks = await asyncio.gather(*waiting)
+        self.assertTrue(all(self.events(c) == [{'order_id': self.order.pk, 'status': 'Confirmed'}]
+                            for c in chunks))
+
+        # a final status ends every stream and frees its subscription
+        await self.set_status('Delivered')
+        for stream in streams:
+            self.assertEqual(self.events(await anext(stream))[0]['status'], 'Delivered')
+            with self.assertRaises(StopAsyncIteration):
+                await anext(stream)
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    async def test_slow_client_only_sees_latest_status(self):
+        stream, _ = await self.open_stream(self.order.pk)
+        for status in ('Confirmed', 'Preparing', 'Out for Delivery'):
+            await self.set_status(status)
+        await asyncio.sleep(0)
+        self.assertEqual(self.events(await anext(stream)), [{'order_id': self.order.pk,
+                                                             'status': 'Out for Delivery'}])
+        await stream.aclose()
+        # the view's generator is finalized by the event loop once dropped
+        gc.collect()
+        await asyncio.sleep(0)
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    async def test_unknown_order_and_unstarted_streams_do_not_leak(self):
+        response = await self.async_client.get(reverse('delivery:api_order_events', args=[999]))
+        self.assertEqual(response.status_code, 404)
+        # a client that disconnects before the server starts streaming
+        response = await views.api_order_events(RequestFactory().get('/'), order_id=self.order.pk)
+        self.assertEqual(hub.subscriber_count(), 1)
+        del response
+        gc.collect()
+        self.assertEqual(hub.subscriber_count(), 0)
+
+
+class CodedChoiceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.restaurant = make_restaurant(cuisine_type='Fast Food')
+        for category in ('Snack', 'Beverage', 'Main Course'):
+            MenuItem.objects.create(restaurant=cls.restaurant, name=category, price=Decimal('90.00'), category=category)
+        cls.order = make_order(cls.customer, cls.restaurant, status='Out for Delivery')
+
+    def stored(self, table, column, pk_column, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM {table} WHERE {pk_column} = %s', [pk])
+            return cursor.fetchone()[0]
+
+    def test_columns_store_codes_and_read_back_labels(self):
+        self.assertEqual(self.stored('order_table', 'status', 'order_id', self.order.pk), Order.Status.OUT_FOR_DELIVERY)
+        self.assertEqual(self.stored('restaurant', 'cuisine_type', 'restaurant_id', self.restaurant.pk),
+                         Restaurant.Cuisine.FAST_FOOD)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.status, 'Out for Delivery')
+        self.assertEqual(list(Order.objects.filter(status__in=['Out for Delivery', 'Pending'])
+                              .values_list('status', flat=True)), ['Out for Delivery'])
+        # codes follow the labels' alphabetical order, so menus keep their order
+        self.assertEqual(list(MenuItem.objects.values_list('category', flat=True)),
+                         ['Beverage', 'Main Course', 'Snack'])
+
+    def test_unknown_labels_are_rejected(self):
+        with self.assertRaises(ValueError):
+            Order.objects.filter(status='Eaten').exists()
+        order = Order(customer=self.customer, restaurant=self.restaurant, total_amount=Decimal('10.00'),
+                      delivery_address='Patan', status='Eaten')
+        with self.assertRaises(ValidationError):
+            order.full_clean()
+
+    def test_admin_and_raw_sql_pages_show_labels(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:delivery_order_changelist'), {'status__exact': 'Out for Delivery'})
+        self.assertContains(response, f'#{self.order.pk}')
+        response = self.client.get(reverse('admin:delivery_restaurant_changelist'), {'q': 'fast'})
+        self.assertContains(response, self.restaurant.name)
+        response = self.client.get(reverse('delivery:sql_demo'))
+        self.assertContains(response, 'Out for Delivery')
+
+
+class AdminQueryCountTests(TestCase):
+    PAGES = ['admin:delivery_order_changelist', 'admin:delivery_orderitem_changelist',
+             'admin:delivery_menuitem_changelist', 'admin:delivery_customer_changelist',
+             'admin:delivery_orderitem_add']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def grow(self, total):
+        # every order brings its own customer, restaurant and menu item
+        while Order.objects.count() < total:
+            n = Order.objects.count() + 1
+            restaurant = make_restaurant(n)
+            item = MenuItem.objects.create(restaurant=restaurant, name=f'Dish {n}', price=Decimal('100.00'),
+                                           category='Snack')
+            order = make_order(make_customer(n), restaurant)
+            OrderItem.objects.create(order=order, menu_item=item, quantity=1, item_price=item.price)
+
+    def query_counts(self):
+        first = Order.objects.order_by('order_id').first()
+        urls = [reverse(name) for name in self.PAGES] + [
+            reverse('admin:delivery_order_change', args=[first.pk]),
+            reverse('admin:autocomplete') + '?app_label=delivery&model_name=orderitem&field_name=menu_item',
+        ]
+        counts = {}
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(ctx.captured_queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.grow(3)
+        self.query_counts()  # warm the per-process ContentType cache
+        small = self.query_counts()
+        self.grow(30)
+        self.assertEqual(self.query_counts(), small)
+
+    def test_estimated_count_skips_count_star(self):
+        self.grow(5)
+        with mock.patch('delivery.pagination.ESTIMATE_THRESHOLD', 1):
+            with CaptureQueriesContext(connection) as ctx:
+                paginator = EstimatedCountPaginator(Order.objects.order_by('-order_date'), 2)
+                self.assertEqual(paginator.count, 5)
+            self.assertNotIn('COUNT(', ctx.captured_queries[0]['sql'].upper())
+            # filtered lists are counted exactly
+            filtered = EstimatedCountPaginator(Order.objects.filter(order_id__lte=2), 2)
+            self.assertEqual(filtered.count, 2)
+
+
+class InstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = make_order(make_customer(), make_restaurant())
+
+    def server_timing(self, response):
+        return dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing_reports_queries_and_templates(self):
+        response = self.client.get(reverse('delivery:order_list'))
+        timing = self.server_timing(response)
+        self.assertIn('desc="1 queries"', timing['db'])
+        self.assertNotEqual(timing['tpl'], 'dur=0.0')
+
+    async def test_async_views_are_measured(self):
+        response = await self.async_client.get(reverse('delivery:api_order_status_async', args=[self.order.pk]))
+        self.assertIn('desc="1 queries"', self.server_timing(response)['db'])
+
+    def test_metrics_endpoint_has_histograms_per_view(self):
+        self.client.get(reverse('delivery:order_list'))
+        self.client.force_login(make_staff())
+        body = self.client.get(reverse('delivery:metrics')).content.decode()
+        self.assertIn('# TYPE delivery_db_queries_per_request histogram', body)
+        self.assertRegex(body, r'delivery_db_queries_per_request_bucket\{view="delivery:order_list",le="1.0"\} [1-9]')
+        self.assertRegex(body, r'delivery_request_duration_seconds_count\{view="delivery:order_list"\} [1-9]')
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint_is_for_staff_and_scrapers(self):
+        url = reverse('delivery:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'authorization': 'Bearer s3cret'}).status_code, 200)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, headers={'authorization': 'Bearer '}).status_code, 403)
+        self.client.force_login(User.objects.create_user('clerk', 'clerk@example.com', 'pw'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_repeated_statements_are_logged_as_n_plus_one(self):
+        collected, token = metrics.start_request()
+        for i in range(12):
+            list(Order.objects.filter(order_id__in=range(i + 1)))
+        Customer.objects.count()
+        metrics.end_request(token)
+        self.assertEqual(collected.queries, 13)
+
+        before = metrics.N_PLUS_ONE.value(view='<unresolved>')
+        with self.assertLogs('delivery.metrics', 'WARNING') as logs:
+            record_request(RequestFactory().get('/'), None, collected, time.perf_counter())
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('12 times', logs.output[0])
+        self.assertEqual(metrics.N_PLUS_ONE.value(view='<unresolved>'), before + 1)
+
+
+class ViewBenchmarkTests(TestCase):
+
+    def test_every_route_keeps_its_query_count_as_data_grows(self):
+        counts = []
+        for size in (100, 400):
+            bench_views.seed(size)
+            results = bench_views.run_routes(bench_views.sample_requests(), repeat=1)
+            counts.append({name: row['queries'] for name, row in results.items()})
+        self.assertEqual(set(counts[0]), {pattern.name for pattern in bench_views.urls.urlpatterns})
+        self.assertEqual(counts[1], counts[0])
+
+    def test_regressions_and_super_linear_scaling_are_reported(self):
+        def row(queries, ms, peak_kb=100.0):
+            return {'queries': queries, 'ms': ms, 'peak_kb': peak_kb}
+
+        baseline = {'1000': {'a': row(2, 10.0), 'b': row(1, 10.0), 'c': row(1, 10.0)}}
+        results = {'1000': {'a': row(2, 12.0), 'b': row(3, 40.0), 'c': row(1, 10.0, peak_kb=200.0)}}
+        self.assertEqual(bench_views.regressions(results, baseline, memory_tolerance=0.25), [
+            'b @ 1000: 3 queries, baseline 1',
+            'c @ 1000: peak_kb 200.0, baseline 100.0 (+100%)',
+        ])
+        # timings from another machine only warn
+        self.assertEqual(bench_views.slowdowns(results, baseline, time_tolerance=0.5),
+                         ['b @ 1000: ms 40.0, baseline 10.0 (+300%)'])
+
+        results['4000'] = {'a': row(5, 40.0), 'b': row(3, 400.0, peak_kb=120.0)}
+        self.assertEqual(bench_views.scaling_problems(results, max_exponent=1.25), [
+            'a: 2 queries at 1000 orders, 5 at 4000',
+            'b: ms grows as size^1.66 (40.0ms -> 400.0ms)',
+        ])
+
+
+# a second database only exists under food_delivery.settings_replica
+REPLICA = routers.replica_alias()
+needs_replica = skipUnless(REPLICA, 'no replica configured, see food_delivery.settings_replica')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', REPLICA} - {None}
+
+    def setUp(self):
+        cache.clear()
+        self.customer = make_customer()
+        self.restaurant = make_restaurant()
+
+    def copy_to_replica(self, name):
+        # the same row as on the primary, told apart by its name
+        Customer.objects.using(REPLICA).create(pk=self.customer.pk, name=name, email=self.customer.email,
+                                               phone=self.customer.phone, address=self.customer.address)
+
+    @override_settings(REPLICA_DATABASE='missing')
+    def test_without_a_replica_everything_stays_on_default(self):
+        with routers.replica_reads() as alias:
+            self.assertIsNone(alias)
+            self.assertEqual(router.db_for_read(Order), 'default')
+        self.assertNotIn(routers.STICKY_COOKIE, routers.stick_to_primary(HttpResponse()).cookies)
+
+    @needs_replica
+    def test_read_only_views_read_the_replica(self):
+        self.copy_to_replica('Replica Copy')
+        response = self.client.get(reverse('delivery:customer_list'))
+        self.assertContains(response, 'Replica Copy')
+        self.assertNotContains(response, self.customer.name)
+
+        for name in ('home', 'restaurant_list', 'order_list', 'analytics', 'sql_demo', 'api_search'):
+            self.assertEqual(self.client.get(reverse(f'delivery:{name}'), {'q': 'dish'}).status_code, 200, name)
+
+    @needs_replica
+    def test_streamed_exports_read_the_replica(self):
+        make_order(self.customer, self.restaurant)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        lines = b''.join(self.client.get(reverse('delivery:export_orders')).streaming_content).splitlines()
+        self.assertEqual(len(lines), 1)
+
+    @needs_replica
+    def test_async_streamed_statuses_read_the_replica(self):
+        order = make_order(self.customer, self.restaurant)
+        response = self.client.get(reverse('delivery:api_order_status_batch'), {'ids': order.pk})
+        self.assertEqual(json.loads(async_to_sync(read_stream)(response.streaming_content))['missing'], [order.pk])
+
+    @needs_replica
+    def test_reads_in_a_transaction_use_the_primary(self):
+        self.copy_to_replica('Replica Copy')
+        with routers.replica_reads():
+            self.assertEqual(Customer.objects.get(pk=self.customer.pk).name, 'Replica Copy')
+            with transaction.atomic():
+                self.assertEqual(Customer.objects.get(pk=self.customer.pk).name, self.customer.name)
+            Customer.objects.filter(pk=self.customer.pk).update(name='Renamed')
+        self.assertEqual(Customer.objects.using(REPLICA).get(pk=self.customer.pk).name, 'Replica Copy')
+
+    @needs_replica
+    def test_placing_an_order_keeps_the_client_on_the_primary(self):
+        item = MenuItem.objects.create(restaurant=self.restaurant, name='Dish', price=Decimal('100.00'),
+                                       category='Main Course')
+        response = self.client.post(reverse('delivery:api_place_order'), json.dumps({
+            'customer_id': self.customer.pk, 'restaurant_id': self.restaurant.pk,
+            'items': [{'menu_item_id': item.pk, 'quantity': 1}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+        status_url = reverse('delivery:api_order_status', args=[response.json()['order_id']])
+        # the replica has not seen the order yet, the client that placed it reads the primary
+        self.assertEqual(self.client.get(status_url).status_code, 200)
+        self.assertEqual(self.client_class().get(status_url).status_code, 404)
@@ -0,0 +1,131 @@
+"""
+Per-client token-bucket rate limiting for the public JSON APIs.
+
+Each client has a bucket of API_RATE_LIMIT_BURST tokens that refills at
+API_RATE_LIMIT_RATE tokens a second. Every request to a view wrapped in
+rate_limited takes a token; a request that finds the bucket empty is
+answered with a 429 and a Retry-After header before it reaches the
+database. A rate of 0 turns the limit off.
+
+Clients are told apart by IP address, read from the request.META key
+named by API_RATE_LIMIT_CLIENT_HEADER. Behind a reverse proxy, set it to
+the header the proxy fills in (e.g. HTTP_X_FORWARDED_FOR).
+
+The buckets live in the backend named by API_RATE_LIMIT_BACKEND, any class
+whose take(key, rate, burst) returns the seconds until the next token (0
+when one was taken). LocalBuckets keeps them in this process, so every
+worker allows the full rate on its own. CacheBuckets keeps them in the
+default cache, shared by every process. Its read-modify-write is not
+atomic, so concurrent requests can each take the same token, which is
+close enough for an abuse guard.
+"""
+import math
+import threading
+import time
+from functools import cache as memoize, wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from .metrics import registry
+
+
+THROTTLED = registry.counter(
+    'delivery_throttled_requests_total', 'Requests refused with a 429 by the API rate limit.', ['view'])
+
+
+def _refill(tokens, stamp, now, rate, burst):
+    return min(burst, tokens + (now - stamp) * rate)
+
+
+class LocalBuckets:
+    # forget clients whose bucket has refilled once this many are tracked
+    max_clients = 100_000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, stamp, now, rate, burst)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets = {client: bucket for client, bucket in self._buckets.items()
+                                 if _refill(*bucket, now, rate, burst) < burst}
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        cache_key = f'throttle:{key}'
+        tokens, stamp = cache.get(cache_key, (burst, now))
+        tokens = _refill(tokens, stamp, now, rate, burst)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        # a bucket left alone until it is full again is the same as no bucket
+        cache.set(cache_key, (tokens - 1 if not wait else tokens, now), math.ceil(burst / rate) + 1)
+        return wait
+
+
+@memoize
+def _backend(path):
+    return import_string(path)()
+
+
+def buckets():
+    return _backend(getattr(settings, 'API_RATE_LIMIT_BACKEND', 'delivery.throttle.LocalBuckets'))
+
+
+def client_key(request):
+    header = getattr(settings, 'API_RATE_LIMIT_CLIENT_HEADER', 'REMOTE_ADDR')
+    address = request.META.get(header) or request.META.get('REMOTE_ADDR', '')
+    # X-Forwarded-For lists the client first
+    return address.split(',')[0].strip()
+
+
+def throttle(request, view_name):
+    """A 429 response if the client is over its rate, else None (and a token is taken)."""
+    rate = getattr(settings, 'API_RATE_LIMIT_RATE', 0)
+    if not rate:
+        return None
+    wait = buckets().take(client_key(request), rate, getattr(settings, 'API_RATE_LIMIT_BURST', 1))
+    if not wait:
+        return None
+    THROTTLED.inc(view=view_name)
+    response = JsonResponse({
+        'success': False,
+        'error': 'Too many requests, slow down'
+    }, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limited(view):
+    """Refuse requests to `view` from clients over the API rate limit."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            refused = throttle(request, view.__name__)
+            if refused is not None:
+                return refused
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            refused = throttle(request, view.__name__)
+            if refused is not None:
+                return refused
+            return view(request, *args, **kwargs)
+    return wrapped
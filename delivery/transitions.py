@@ -0,0 +1,115 @@
+"""
+The order status state machine and bulk status changes.
+
+An order moves Pending -> Confirmed -> Preparing -> Out for Delivery ->
+Delivered and can be cancelled until it leaves the kitchen; Delivered and
+Cancelled are final. transition_orders() moves any number of orders to
+one status in batches: the orders of a batch that may make the move are
+locked and read with one SELECT, then changed with one UPDATE guarded by
+the same source statuses. update() skips delivery.signals, so each batch
+then writes its OrderStatusEvent rows with one INSERT and brings the
+dashboard counters, customer and restaurant totals, rollup hours, report
+cache, couriers and live status subscribers up to date itself.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .dispatch import release_couriers
+from .models import Order, OrderStatusEvent
+from .pubsub import hub
+from .versions import touch_tables
+from .rollups import mark_dirty
+from .stats import (
+    apply_stats_deltas, is_active, counts_toward_totals, rebuild_customer_stats, rebuild_restaurant_stats,
+)
+
+
+# status -> the statuses an order may move to from it
+TRANSITIONS = {
+    'Pending': ('Confirmed', 'Cancelled'),
+    'Confirmed': ('Preparing', 'Cancelled'),
+    'Preparing': ('Out for Delivery', 'Cancelled'),
+    'Out for Delivery': ('Delivered',),
+    'Delivered': (),
+    'Cancelled': (),
+}
+TRANSITION_BATCH_SIZE = 1000
+MAX_TRANSITION_IDS = 10000
+
+
+class TransitionError(ValueError):
+    """The requested status is not one an order can be moved to."""
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def source_statuses(target):
+    """The statuses from which an order may move to `target`."""
+    sources = [status for status, targets in TRANSITIONS.items() if target in targets]
+    if not sources:
+        raise TransitionError(f'Orders cannot be moved to {target!r}')
+    return sources
+
+
+def status_event(order_id, from_status, to_status, entered_at, now):
+    """The OrderStatusEvent of an order that entered `from_status` at `entered_at`."""
+    duration = None
+    if from_status and entered_at is not None:
+        duration = max(0, round((now - entered_at).total_seconds()))
+    return OrderStatusEvent(order_id=order_id, from_status=from_status, to_status=to_status,
+                            changed_at=now, duration_seconds=duration)
+
+
+def _move_batch(order_ids, target, sources, now):
+    rows = list(Order.objects.select_for_update().filter(pk__in=order_ids, status__in=sources).values_list(
+        'order_id', 'status', 'customer_id', 'restaurant_id', 'delivery_person_id', 'order_date',
+        'status_changed_at'
+    ).order_by())
+    if not rows:
+        return []
+    found = {row[0] for row in rows}
+    moved = [order_id for order_id in order_ids if order_id in found]
+    Order.objects.filter(pk__in=moved, status__in=sources).update(status=target, status_changed_at=now)
+    OrderStatusEvent.objects.bulk_create([status_event(row[0], row[1], target, row[6], now) for row in rows])
+
+    apply_stats_deltas(active_orders=sum(int(is_active(target)) - int(is_active(row[1])) for row in rows))
+    recount = [row for row in rows if counts_toward_totals(row[1]) != counts_toward_totals(target)]
+    if recount:
+        rebuild_customer_stats({row[2] for row in recount})
+        rebuild_restaurant_stats({row[3] for row in recount})
+    if not is_active(target):
+        release_couriers(*(row[4] for row in rows if is_active(row[1])))
+    mark_dirty(*(row[5] for row in rows))
+    touch_tables(Order._meta.db_table)
+    return moved
+
+
+def transition_orders(order_ids, target, batch_size=TRANSITION_BATCH_SIZE):
+    """
+    Move every order in `order_ids` that the state machine allows to
+    `target`, in one transaction. Returns (moved, rejected): the ids that
+    moved, and a dict mapping every other id to the order's current
+    status, or None if there is no such order.
+    """
+    sources = source_statuses(target)
+    order_ids = list(dict.fromkeys(order_ids))
+    now = timezone.now()
+    moved = []
+    with transaction.atomic():
+        for start in range(0, len(order_ids), batch_size):
+            moved += _move_batch(order_ids[start:start + batch_size], target, sources, now)
+
+        moved_ids = set(moved)
+        left = [order_id for order_id in order_ids if order_id not in moved_ids]
+        rejected = dict.fromkeys(left)
+        for start in range(0, len(left), batch_size):
+            rejected.update(Order.objects.filter(pk__in=left[start:start + batch_size])
+                            .values_list('order_id', 'status').order_by())
+
+        def publish():
+            for order_id in moved:
+                hub.publish(order_id, {'order_id': order_id, 'status': target})
+        transaction.on_commit(publish)
+    return moved, rejected
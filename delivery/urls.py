@@ -18,9 +18,22 @@ urlpatterns = [
 
     path('analytics/', views.analytics, name='analytics'),
     path('sql-demo/', views.sql_queries_demo, name='sql_demo'),
+    path('exports/orders/', views.export_orders, name='export_orders'),
 
 
     path('api/restaurant/<int:restaurant_id>/menu/', views.api_restaurant_menu, name='api_restaurant_menu'),
     path('api/order/<int:order_id>/status/', views.api_order_status, name='api_order_status'),
+    path('api/orders/status/', views.api_orders_status, name='api_orders_status'),
+    path('api/orders/', views.api_place_order, name='api_place_order'),
+    path('api/orders/transition/', views.api_transition_orders, name='api_transition_orders'),
+
+    path('api/async/restaurant/<int:restaurant_id>/menu/', views.api_restaurant_menu_async,
+         name='api_restaurant_menu_async'),
+    path('api/async/order/<int:order_id>/status/', views.api_order_status_async, name='api_order_status_async'),
+    path('api/async/orders/status/', views.api_order_status_batch, name='api_order_status_batch'),
+    path('api/order/<int:order_id>/events/', views.api_order_events, name='api_order_events'),
+    path('api/search/', views.api_search, name='api_search'),
+
+    path('metrics', views.metrics, name='metrics'),
     
 ]
\ No newline at end of file
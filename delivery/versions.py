@@ -0,0 +1,48 @@
+"""
+Per-table data versions.
+
+Each table has a version token in the default cache that moves on
+whenever its rows change: delivery.signals touches the table on every
+save and delete, and code that writes with update(), bulk_create() or
+raw SQL touches the tables whose cached columns it changes. Anything
+built from a table can carry the versions it was built at and be
+recognised as stale once they move on; delivery.reports does this for
+its results and the analytics and home templates for their {% cache %}
+fragments.
+
+Like menu_cache, the versions must live in a cache every process serving
+requests shares.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(table):
+    return f'table:version:{table}'
+
+
+def table_versions(*tables):
+    """The current version of each of `tables`, in order."""
+    keys = [_version_key(table) for table in tables]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        version = time.time_ns()
+        for key in missing:
+            cache.add(key, version, timeout=None)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def touch_tables(*tables):
+    """
+    Move the version of `tables` on now, so this transaction reads its own
+    writes, and again on commit, so nothing cached from pre-commit data by
+    other requests survives.
+    """
+    def bump():
+        cache.set_many({_version_key(table): time.time_ns() for table in tables}, timeout=None)
+    bump()
+    transaction.on_commit(bump)
@@ -1,73 +1,177 @@
 from django.shortcuts import render, get_object_or_404
-from .models import Customer, Restaurant, MenuItem, Order, OrderItem, DeliveryPersonnel
-from django.db.models import Count, Sum, Avg, Q
-from django.http import JsonResponse
-from django.db import connection
+from .models import (
+    Customer, Restaurant, MenuItem, Order, DeliveryPersonnel, RestaurantDurationRollup, CourierDurationRollup,
+)
+from django.db.models import Q
+from django.http import JsonResponse, Http404, StreamingHttpResponse, HttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.utils.crypto import constant_time_compare
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+import json
+from decimal import Decimal
+from functools import wraps
+from urllib.parse import urlencode
+from .pagination import keyset_paginate, InvalidCursor, EstimatedCountPaginator
+from .stats import get_dashboard_stats, INACTIVE_STATUSES
+from . import reports, rollups, versions
+from .menu_cache import get_menu, aget_menu, amenu_version, menu_etag
+from .orders import (
+    place_order, parse_order_ids, parse_since, order_status, aorder_status, status_chunks, astatus_chunks,
+    OrderError,
+)
+from .pubsub import hub
+from .search import query_terms, search_menu
+from .export import EXPORT_FORMATS, day_range, export_chunks
+from .transitions import transition_orders, TransitionError, MAX_TRANSITION_IDS
+from .metrics import registry
+from .routers import reads_from_replica, stick_to_primary
+from .throttle import rate_limited
 
 # Create your views here.
 
+# the tables on the home and analytics pages are {% cache %} fragments keyed
+# by the data versions (delivery.versions) of everything they show, so the
+# querysets behind them are left lazy and only run on a miss
+FRAGMENT_TIMEOUT = 60 * 10
+HOME_TABLES = (Order._meta.db_table, Customer._meta.db_table, Restaurant._meta.db_table)
+ANALYTICS_TABLES = (*rollups.ROLLUP_TABLES, Restaurant._meta.db_table, MenuItem._meta.db_table,
+                    DeliveryPersonnel._meta.db_table)
+
+
+def data_version(tables):
+    return '-'.join(map(str, versions.table_versions(*tables)))
+
+
+def staff_required(*perms):
+    """Refuse the view with a 403 unless a logged-in staff user holding every one of `perms` asks."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            user = request.user
+            if not (user.is_active and user.is_staff and user.has_perms(perms)):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Staff permission required'
+                }, status=403)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
 
 """ HOME VIEW """
+@reads_from_replica
 def home(request):
-    active_orders_count = Order.objects.exclude(
-        status__in=['Delivered', 'Cancelled']
-    ).count()
+    stats = get_dashboard_stats()
 
     context = {
-        'total_customers': Customer.objects.count(),
-        'total_restaurants': Restaurant.objects.count(),
-        'total_orders': Order.objects.count(),
-        'total_menu_items': MenuItem.objects.count(),
-        'active_orders': active_orders_count,
+        'total_customers': stats.total_customers,
+        'total_restaurants': stats.total_restaurants,
+        'total_orders': stats.total_orders,
+        'total_menu_items': stats.total_menu_items,
+        'active_orders': stats.active_orders,
         'recent_orders': Order.objects.select_related('customer', 'restaurant').order_by('-order_date')[:5],
+        'data_version': data_version(HOME_TABLES),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
     }
     
     return render(request,'delivery/home.html',context)
 
 
 """ RESTAURANT VIEW """
+RESTAURANTS_PER_PAGE = 12
+RATING_FILTERS = ['3.0', '3.5', '4.0', '4.5']
+
+@reads_from_replica
 def restaurant_list(request):
-    restaurants = Restaurant.objects.prefetch_related('menu_items').annotate(
-    total_orders= Count('orders'),
-    total_revenue= Sum('orders__total_amount')
-    ).order_by('-rating')
+    # order count, revenue and menu size are stored on the row (kept by
+    # delivery.signals), so no orders or menu items are read here
+    restaurants = Restaurant.objects.order_by('-rating', '-restaurant_id')
 
+    cuisine = request.GET.get('cuisine', '')
+    if cuisine not in dict(Restaurant.CUISINE_CHOICES):
+        cuisine = ''
+    if cuisine:
+        restaurants = restaurants.filter(cuisine_type=cuisine)
+
+    min_rating = request.GET.get('min_rating', '')
+    if min_rating not in RATING_FILTERS:
+        min_rating = ''
+    if min_rating:
+        restaurants = restaurants.filter(rating__gte=Decimal(min_rating))
+
+    page = EstimatedCountPaginator(restaurants, RESTAURANTS_PER_PAGE).get_page(request.GET.get('page'))
 
     context = {
-        'restaurants': restaurants
+        'restaurants': page.object_list,
+        'page': page,
+        'cuisine': cuisine,
+        'min_rating': min_rating,
+        'cuisine_choices': Restaurant.CUISINE_CHOICES,
+        'rating_filters': RATING_FILTERS,
+        'filter_query': urlencode({key: value for key, value in
+                                   (('cuisine', cuisine), ('min_rating', min_rating)) if value})
     }
     return render(request, 'delivery/restaurants.html', context)
 
+@condition(etag_func=lambda request, restaurant_id: menu_etag(restaurant_id, 'page'))
 def restaurant_detail(request, restaurant_id):
-    restaurant = get_object_or_404(Restaurant, restaurant_id=restaurant_id)
-    menu_items = restaurant.menu_items.filter(is_available=True)
+    menu = get_menu(restaurant_id)
+    if menu['restaurant'] is None:
+        raise Http404('No Restaurant matches the given query.')
 
     
     context = {
-        'restaurant': restaurant,
-        'menu_items': menu_items
+        'restaurant': menu['restaurant'],
+        'menu_items': menu['menu_items']
     }
 
     return render(request, 'delivery/restaurant_detail.html', context) 
 
 """ ORDERS VIEW """
+ORDERS_PER_PAGE = 50
+
+@reads_from_replica
 def order_list(request):
 
+    # only the columns orders.html renders
     orders = Order.objects.select_related(
         'customer', 'restaurant', 'delivery_person'
-    ).prefetch_related('order_items__menu_item').order_by('-order_date')
+    ).only(
+        'order_id', 'order_date', 'total_amount', 'status',
+        'customer__name', 'restaurant__name', 'delivery_person__name'
+    )
 
-    status_filter = request.GET.get('status')
+    # status is stored as a code: a label it does not know cannot be filtered on
+    status_filter = request.GET.get('status', '')
+    if status_filter not in Order.Status.labels:
+        status_filter = ''
     if status_filter:
-            orders = orders.filter(status=status_filter)
-        
+        orders = orders.filter(status=status_filter)
+
+    try:
+        page = keyset_paginate(
+            orders,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=ORDERS_PER_PAGE
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+
     context = {
-            'orders': orders,
+            'orders': page.object_list,
+            'page': page,
             'status_filter': status_filter
     }
     return render(request, 'delivery/orders.html', context)
 
 
+@reads_from_replica
 def order_detail(request, order_id):
     order = get_object_or_404(
         Order.objects.select_related('customer', 'restaurant', 'delivery_person'),
@@ -84,149 +188,433 @@ def order_detail(request, order_id):
 
 
 """ CUSTOMERS VIEW """
+CUSTOMERS_PER_PAGE = 50
+
+@reads_from_replica
 def customer_list(request):
-    customers = Customer.objects.annotate(
-        total_orders=Count('orders'),
-        total_spent=Sum('orders__total_amount') # note for myself - __ is the seperator or syntax for spanning relationship orders __ total_amount isspecific field inside the order 
-    ).order_by('-total_spent')
-     
+    # ranked on the stored lifetime totals (kept by delivery.signals), so
+    # the page never reads the orders table
+    customers = Customer.objects.only(
+        'customer_id', 'name', 'email', 'phone', 'created_at',
+        'order_count', 'total_spent', 'last_order_date'
+    ).order_by('-total_spent', '-customer_id')
+
+    search = request.GET.get('q', '').strip()
+    if search:
+        customers = customers.filter(Q(name__icontains=search) | Q(email__icontains=search))
+
+    page = EstimatedCountPaginator(customers, CUSTOMERS_PER_PAGE).get_page(request.GET.get('page'))
 
     context = {
-         
-        'customers': customers
+        'customers': page.object_list,
+        'page': page,
+        'search': search
     }
     return render(request, 'delivery/customers.html', context)
 
 
 """ ANALYTICS / REPORTS VIEW """
+@reads_from_replica
 def analytics(request):
 
-    
-    orders_by_status = Order.objects.values('status').annotate(
-        count=Count('order_id'),
-        revenue=Sum('total_amount')
-    ).order_by('-count')
-    
-    top_restaurants = Restaurant.objects.annotate(
-        total_orders=Count('orders'),
-        total_revenue=Sum('orders__total_amount'),
-        avg_order=Avg('orders__total_amount')
-    ).filter(total_orders__gt=0).order_by('-total_revenue')[:5]
-    
-    popular_items = MenuItem.objects.annotate(
-        times_ordered=Count('order_items'),
-        total_quantity=Sum('order_items__quantity')
-    ).filter(times_ordered__gt=0).order_by('-times_ordered')[:10]
-    
-    delivery_stats = DeliveryPersonnel.objects.annotate(
-        total_deliveries=Count('orders'),
-        completed=Count('orders', filter=Q(orders__status='Delivered'))
-    ).order_by('-total_deliveries')
-    
+    # optional ?start=YYYY-MM-DD&end=YYYY-MM-DD, both inclusive
+    try:
+        start = parse_date(request.GET.get('start') or '')
+        end = parse_date(request.GET.get('end') or '')
+    except ValueError:
+        start = end = None
+
+    # reads the rollups as last materialized; manage.py refresh_rollups keeps them current
     context = {
-        'orders_by_status': orders_by_status,
-        'top_restaurants': top_restaurants,
-        'popular_items': popular_items,
-        'delivery_stats': delivery_stats
+        'orders_by_status': rollups.orders_by_status(start, end),
+        'top_restaurants': SimpleLazyObject(lambda: rollups.restaurant_totals(start, end, limit=5)),
+        'popular_items': SimpleLazyObject(lambda: rollups.menu_item_totals(start, end, limit=10)),
+        'delivery_stats': rollups.courier_totals(start, end),
+        'prep_times': SimpleLazyObject(
+            lambda: rollups.duration_percentiles(RestaurantDurationRollup, start, end, limit=10)),
+        'delivery_times': SimpleLazyObject(
+            lambda: rollups.duration_percentiles(CourierDurationRollup, start, end, limit=10)),
+        'start': start,
+        'end': end,
+        'data_version': data_version(ANALYTICS_TABLES),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
     }
     return render(request, 'delivery/analytics.html', context)
 
 
 
 
+@reads_from_replica
 def sql_queries_demo(request):
+    # every report comes from delivery.reports' cache while its tables are unchanged
+    results = []
+    fields = {}
+    for report in reports.REPORTS.values():
+        params = report.clean(request.GET)
+        for param in report.params:
+            fields.setdefault(param.name, (param, params[param.name]))
+        entry, cached = reports.run_report(report, params)
+        results.append({
+            'report': report,
+            'statement': entry['statement'],
+            'rows': [list(zip(row, (kind for _, kind in report.columns))) for row in entry['rows']],
+            'cached': cached,
+            'computed_at': entry['computed_at'],
+            'duration_ms': entry['duration'] * 1000,
+            'stats': reports.report_stats(report),
+        })
 
-    with connection.cursor() as cursor:
-        
-        cursor.execute("""
-            SELECT 
-                o.order_id,
-                c.name AS customer_name,
-                r.name AS restaurant_name,
-                o.total_amount,
-                o.status
-            FROM order_table o
-            INNER JOIN customer c ON o.customer_id = c.customer_id
-            INNER JOIN restaurant r ON o.restaurant_id = r.restaurant_id
-            ORDER BY o.order_date DESC
-            LIMIT 10
-        """)
-        inner_join_results = cursor.fetchall()
-        
-        cursor.execute("""
-            SELECT 
-                mi.name AS item_name,
-                r.name AS restaurant_name,
-                COUNT(oi.order_item_id) AS times_ordered
-            FROM menu_item mi
-            LEFT JOIN order_item oi ON mi.item_id = oi.menu_item_id
-            LEFT JOIN restaurant r ON mi.restaurant_id = r.restaurant_id
-            GROUP BY mi.item_id, mi.name, r.name
-            ORDER BY times_ordered DESC
-            LIMIT 10
-        """)
-        left_join_results = cursor.fetchall()
-
-        cursor.execute("""
-            SELECT 
-                status,
-                COUNT(*) AS order_count,
-                SUM(total_amount) AS total_revenue
-            FROM order_table
-            GROUP BY status
-        """)
-        aggregate_results = cursor.fetchall()
-        
-        cursor.execute("""
-            SELECT 
-                c.name AS customer_name,
-                c.email
-            FROM customer c
-            WHERE c.customer_id IN (
-                SELECT DISTINCT o.customer_id
-                FROM order_table o
-                INNER JOIN restaurant r ON o.restaurant_id = r.restaurant_id
-                WHERE r.rating > 4.0
-            )
-            LIMIT 10
-        """)
-        subquery_results = cursor.fetchall()
-    
     context = {
-        'inner_join_results': inner_join_results,
-        'left_join_results': left_join_results,
-        'aggregate_results': aggregate_results,
-        'subquery_results': subquery_results
+        'reports': results,
+        'fields': fields.values(),
     }
     return render(request, 'delivery/sql_demo.html', context)
 
 
+@rate_limited
+@condition(etag_func=lambda request, restaurant_id: menu_etag(restaurant_id, 'api'))
 def api_restaurant_menu(request, restaurant_id):
+    return menu_json(get_menu(restaurant_id))
+
 
-    menu_items = MenuItem.objects.filter(
-        restaurant_id=restaurant_id,
-        is_available=True
-    ).values('item_id', 'name', 'price', 'category', 'description')
+def menu_json(menu):
+    menu_items = [
+        {key: item[key] for key in ('item_id', 'name', 'price', 'category', 'description')}
+        for item in menu['menu_items']
+    ]
     
     return JsonResponse({
         'success': True,
-        'menu_items': list(menu_items)
+        'menu_items': menu_items
     })
 
 
+@rate_limited
+@reads_from_replica
 def api_order_status(request, order_id):
+    payload = order_status(order_id)
+    if payload is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Order not found'
+        }, status=404)
+
+    return JsonResponse({'success': True, **payload})
 
+
+@csrf_exempt
+@rate_limited
+@require_POST
+@reads_from_replica
+def api_orders_status(request):
+    """
+    {"ids": [1, 2, 3], "since": "2025-06-01T12:00:00Z"} -> the status of
+    every listed order, or with "since" of those whose status changed
+    after it, read with one IN query and streamed as the rows are read.
+    See delivery.orders.status_chunks.
+    """
     try:
-        order = Order.objects.select_related('delivery_person').get(order_id=order_id)
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValueError
+        order_ids = parse_order_ids(payload.get('ids'))
+        since = parse_since(payload.get('since'))
+    except (ValueError, TypeError) as e:
+        # OrderError carries a message fit for the client
+        error = str(e) if isinstance(e, OrderError) else 'Expected JSON with ids and an optional since'
         return JsonResponse({
-            'success': True,
-            'order_id': order.order_id,
-            'status': order.status,
-            'total_amount': str(order.total_amount),
-            'delivery_person': order.delivery_person.name if order.delivery_person else None
-        })
+            'success': False,
+            'error': error
+        }, status=400)
+
+    return StreamingHttpResponse(status_chunks(order_ids, since), content_type='application/json')
+
+
+""" ASYNC API """
+# Native coroutine versions of the JSON endpoints: under ASGI they wait on
+# the database without holding a worker thread. Responses match the sync views.
+
+@rate_limited
+@require_GET
+async def api_restaurant_menu_async(request, restaurant_id):
+    # conditional GET by hand: @condition would read the version synchronously
+    version = await amenu_version(restaurant_id)
+    etag = quote_etag(menu_etag(restaurant_id, 'api', version))
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = menu_json(await aget_menu(restaurant_id, version))
+    response.headers.setdefault('ETag', etag)
+    return response
+
+
+@rate_limited
+@reads_from_replica
+@require_GET
+async def api_order_status_async(request, order_id):
+    payload = await aorder_status(order_id)
+    if payload is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Order not found'
+        }, status=404)
+
+    return JsonResponse({'success': True, **payload})
+
+
+@rate_limited
+@reads_from_replica
+@require_GET
+async def api_order_status_batch(request):
+    """
+    ?ids=1,2,3&since=2025-06-01T12:00:00Z -> the same body as
+    api_orders_status, streamed as the rows are read. Long id lists are
+    better POSTed there than put in a URL.
+    """
+    try:
+        order_ids = parse_order_ids(request.GET.get('ids', ''))
+        since = parse_since(request.GET.get('since'))
+    except OrderError as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+    return StreamingHttpResponse(astatus_chunks(order_ids, since), content_type='application/json')
+
+
+EVENTS_KEEPALIVE = 15
+
+
+def sse_event(payload):
+    return f'data: {json.dumps(payload)}\n\n'
+
+
+@reads_from_replica
+@require_GET
+async def api_order_events(request, order_id):
+    """
+    Server-sent events with the order's status: the current one right
+    away, then every change until the order is delivered or cancelled.
+    Waiting costs no queries; changes arrive through the pubsub hub.
+    ASGI only: under WSGI the stream would tie up a worker.
+    """
+    # subscribe before reading, so a change in between is not lost
+    subscription = hub.subscribe(order_id)
+    if subscription is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Too many live connections, poll the status API instead'
+        }, status=503)
+    try:
+        current = await Order.objects.values('order_id', 'status').aget(order_id=order_id)
     except Order.DoesNotExist:
+        hub.unsubscribe(subscription)
         return JsonResponse({
             'success': False,
             'error': 'Order not found'
         }, status=404)
+
+    async def stream():
+        try:
+            last = current
+            yield f'retry: {EVENTS_KEEPALIVE * 1000}\n' + sse_event(last)
+            while last['status'] not in INACTIVE_STATUSES:
+                payload = await subscription.get(timeout=EVENTS_KEEPALIVE)
+                if payload is None:
+                    yield ': keep-alive\n\n'
+                elif payload['status'] != last['status']:
+                    last = payload
+                    yield sse_event(last)
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+def api_place_order(request):
+    try:
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValueError
+        order = place_order(
+            customer_id=payload['customer_id'],
+            restaurant_id=payload['restaurant_id'],
+            items=payload.get('items'),
+            delivery_address=payload.get('delivery_address'),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        # OrderError is a ValueError and carries a message fit for the client
+        error = str(e) if isinstance(e, OrderError) else 'Expected JSON with customer_id, restaurant_id and items'
+        return JsonResponse({
+            'success': False,
+            'error': error
+        }, status=400)
+
+    # the replica may not have the order yet when the client reads it back
+    return stick_to_primary(JsonResponse({
+        'success': True,
+        'order_id': order.order_id,
+        'status': order.status,
+        'total_amount': str(order.total_amount)
+    }, status=201))
+
+
+@staff_required('delivery.change_order')
+@require_POST
+def api_transition_orders(request):
+    """
+    {"ids": [1, 2, 3], "status": "Confirmed"} -> moves every listed order
+    the state machine allows to the status, in a few set-based statements,
+    and reports the others with their current status (null if missing).
+    Staff only, with a session and CSRF token, like the admin action.
+    """
+    try:
+        payload = json.loads(request.body)
+        if not isinstance(payload, dict):
+            raise ValueError
+        order_ids = parse_order_ids(payload.get('ids'), limit=MAX_TRANSITION_IDS)
+        moved, rejected = transition_orders(order_ids, payload.get('status'))
+    except (ValueError, TypeError) as e:
+        # OrderError and TransitionError carry a message fit for the client
+        error = str(e) if isinstance(e, (OrderError, TransitionError)) else 'Expected JSON with ids and status'
+        return JsonResponse({
+            'success': False,
+            'error': error
+        }, status=400)
+
+    return stick_to_primary(JsonResponse({
+        'success': True,
+        'status': payload['status'],
+        'moved': moved,
+        'rejected': [{'order_id': order_id, 'status': status} for order_id, status in rejected.items()]
+    }))
+
+
+""" SEARCH """
+SEARCH_PER_PAGE = 20
+SEARCH_MAX_PAGE = 50
+# ?available= value -> is_available filter
+AVAILABILITY_FILTERS = {'1': True, '0': False, 'any': None}
+
+
+def parse_price(value):
+    if value in (None, ''):
+        return None
+    price = Decimal(value)
+    if not price.is_finite() or price < 0:
+        raise ValueError(value)
+    return price
+
+
+@reads_from_replica
+@require_GET
+def api_search(request):
+    """
+    ?q=veg mo -> available dishes matching every word, the last one as a
+    prefix, those named after the query first. Also takes min_price,
+    max_price, available=1|0|any and page.
+    """
+    terms = query_terms(request.GET.get('q', ''))
+    if not terms:
+        return JsonResponse({
+            'success': False,
+            'error': 'Pass a search query in q'
+        }, status=400)
+    try:
+        min_price = parse_price(request.GET.get('min_price'))
+        max_price = parse_price(request.GET.get('max_price'))
+        available = AVAILABILITY_FILTERS[request.GET.get('available', '1')]
+        page = int(request.GET.get('page', 1))
+        if not 1 <= page <= SEARCH_MAX_PAGE:
+            raise ValueError(page)
+    except (ValueError, ArithmeticError, KeyError):
+        return JsonResponse({
+            'success': False,
+            'error': f'min_price and max_price must be prices, available 1, 0 or any, '
+                     f'and page between 1 and {SEARCH_MAX_PAGE}'
+        }, status=400)
+
+    rows, has_next = search_menu(terms, available=available, min_price=min_price, max_price=max_price,
+                                 page=page, per_page=SEARCH_PER_PAGE)
+    return JsonResponse({
+        'success': True,
+        'query': ' '.join(terms),
+        'page': page,
+        'has_next': has_next,
+        'results': [{
+            'item_id': row['item_id'],
+            'name': row['name'],
+            'description': row['description'],
+            'price': str(row['price']),
+            'category': row['category'],
+            'is_available': row['is_available'],
+            'restaurant': {
+                'restaurant_id': row['restaurant_id'],
+                'name': row['restaurant__name'],
+                'cuisine_type': row['restaurant__cuisine_type'],
+            },
+        } for row in rows]
+    })
+
+
+""" EXPORTS """
+def parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+@staff_required('delivery.view_order', 'delivery.view_customer')
+@reads_from_replica
+@require_GET
+def export_orders(request):
+    """
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD&format=csv|jsonl -> every order line
+    placed on those days (both inclusive, either may be left out), streamed
+    in batches as it is read. See delivery.export. The rows carry customer
+    names and emails, so only staff who may view orders and customers get it.
+    """
+    fmt = request.GET.get('format', 'csv')
+    try:
+        start = parse_day(request.GET.get('start'))
+        end = parse_day(request.GET.get('end'))
+        if fmt not in EXPORT_FORMATS or (start and end and end < start):
+            raise ValueError(fmt)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': f'start and end must be YYYY-MM-DD dates in order, format one of {", ".join(EXPORT_FORMATS)}'
+        }, status=400)
+
+    response = StreamingHttpResponse(export_chunks(fmt, day_range(start, end)), content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders_{start or "all"}_{end or "all"}.{fmt}"'
+    return response
+
+
+""" METRICS """
+def scrape_token_or_staff(view):
+    """staff_required(), but a scraper sending METRICS_TOKEN as a bearer token gets through too."""
+    staff_view = staff_required()(view)
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return view(request, *args, **kwargs)
+        return staff_view(request, *args, **kwargs)
+    return wrapped
+
+
+@scrape_token_or_staff
+@require_GET
+def metrics(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
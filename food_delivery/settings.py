@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'delivery.middleware.instrumentation_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,15 +55,24 @@ ROOT_URLCONF = 'food_delivery.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for delivery.middleware
+        'BACKEND': 'delivery.metrics.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # compile each template once per process instead of on every
+            # render, whatever DEBUG says; runserver's autoreloader clears it
+            # when a template changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -86,9 +96,83 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASS'), # This is the variable you created
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # a new connection per request by default: under ASGI (asgi.py, the
+        # async views and event streams) each request runs in its own thread
+        # and a persistent connection would be left open on the server. A
+        # WSGI deployment can set DB_CONN_MAX_AGE=60 to reuse connections,
+        # checked for liveness before each request
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replica (delivery.routers): the read-only views and JSON APIs read
+# from it, writes and everything else use default. A client that has just
+# placed or moved an order reads from default for REPLICA_STICKY_SECONDS,
+# which should cover the replication lag.
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['delivery.routers.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# delivery.menu_cache keeps its version counters here, so every worker must
+# share one cache: locmem is only correct for a single process, use
+# FileBasedCache locally or memcached/redis when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'food-delivery'),
+    }
+}
+
+
+# Instrumentation (delivery.middleware, scraped at /metrics)
+# Statements repeated more than METRICS_N_PLUS_ONE_THRESHOLD times in one
+# request, and any statement slower than METRICS_SLOW_QUERY_MS, are logged
+# to the "delivery.metrics" logger.
+
+METRICS_N_PLUS_ONE_THRESHOLD = 10
+METRICS_SLOW_QUERY_MS = 100
+
+
+# Analytics rollups (delivery.rollups): ids can commit out of order, so
+# orders and status events are re-scanned for this long after they were
+# first seen before the refresh watermarks move past them. It must exceed
+# the longest transaction that writes orders or their status events.
+
+ROLLUP_COMMIT_LAG_SECONDS = int(os.getenv('ROLLUP_COMMIT_LAG_SECONDS', 300))
+
+
+# Rate limit for the public order status and menu APIs (delivery.throttle):
+# each client may make API_RATE_LIMIT_BURST requests at once, then
+# API_RATE_LIMIT_RATE a second. 0 turns it off, e.g. for load tests.
+# The default backend counts per process; 'delivery.throttle.CacheBuckets'
+# counts across processes through the default cache.
+
+API_RATE_LIMIT_RATE = float(os.getenv('API_RATE_LIMIT_RATE', 20))
+API_RATE_LIMIT_BURST = int(os.getenv('API_RATE_LIMIT_BURST', 100))
+API_RATE_LIMIT_BACKEND = os.getenv('API_RATE_LIMIT_BACKEND', 'delivery.throttle.LocalBuckets')
+API_RATE_LIMIT_CLIENT_HEADER = os.getenv('API_RATE_LIMIT_CLIENT_HEADER', 'REMOTE_ADDR')
+
+
+# The Prometheus endpoint (/metrics) is for staff only. A scraper that cannot
+# log in sends 'Authorization: Bearer <METRICS_TOKEN>' instead; empty turns
+# that off.
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
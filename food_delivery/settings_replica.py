@@ -0,0 +1,26 @@
+"""
+Two local SQLite files standing in for the MySQL primary and its read
+replica, for trying out delivery.routers without a MySQL setup:
+
+    python manage.py migrate --settings=food_delivery.settings_replica
+    python manage.py migrate --database=replica --settings=food_delivery.settings_replica
+    python manage.py test delivery.tests.ReplicaRoutingTests --settings=food_delivery.settings_replica
+
+Nothing copies rows from one file to the other, so a read shows which
+database it went to; copy primary.sqlite3 over replica.sqlite3 to bring
+the replica up to date, e.g. after populate_data and before
+bench_connections. The rest of the test suite expects a single database.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES as PRIMARY_DATABASES
+
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / filename,
+        'CONN_MAX_AGE': PRIMARY_DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+    }
+    for alias, filename in (('default', 'primary.sqlite3'), ('replica', 'replica.sqlite3'))
+}